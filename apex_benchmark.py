@@ -0,0 +1,263 @@
+"""apex_benchmark.py - Benchmark offline do stack de clientes LLM
+
+Sobe o mock local da Perplexity (apex_mock_perplexity) e executa os
+clientes do APEX com concorrência crescente, medindo latência
+(p50/p95/p99), requisições por segundo e taxa de erro. O resultado sai em
+JSON, para comparar execuções e pegar regressões sem rede nem tokens.
+
+`--memoria N` mede, em vez disso, `ContextMemory.obter_contexto_relevante`
+num banco sintético com N conversas (termos comuns, raros e mistos).
+
+Uso:
+    python apex_benchmark.py --concorrencias 1,4,16 --requisicoes 100 \
+        --latencia-ms 80 --taxa-429 0.05 --saida bench.json
+    python apex_benchmark.py --memoria 200000
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from apex_context_memory import ContextMemory
+from apex_historico import HistoricoConversa
+from apex_http import TransporteHTTP, estatisticas_pool, trocar_transporte
+from apex_llm_cache import CacheRespostas
+from apex_llm_client import APEXLLMClient
+from apex_mock_perplexity import ServidorMockPerplexity
+from apex_perplexity_integration import PerplexityIntegration
+from apex_rate_limit import ControleTaxa, trocar_controle
+from apex_tutor_conteudo import TutorConteudo
+
+ALVOS = ('llm', 'streaming', 'perplexity', 'tutor')
+
+
+def percentil(valores: List[float], p: float) -> Optional[float]:
+    """Percentil pelo método nearest-rank"""
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    indice = max(0, math.ceil(p / 100.0 * len(ordenados)) - 1)
+    return ordenados[indice]
+
+
+def _resumir_medicoes(latencias: List[float], erros: int, duracao: float, ttfts: List[float]) -> Dict:
+    total = len(latencias) + erros
+    resumo = {
+        'requisicoes': total,
+        'erros': erros,
+        'taxa_erro': round(erros / total, 4) if total else 0.0,
+        'req_por_segundo': round(total / duracao, 2) if duracao else 0.0,
+        'duracao_s': round(duracao, 3)
+    }
+    for p in (50, 95, 99):
+        valor = percentil(latencias, p)
+        resumo[f'p{p}_ms'] = round(valor * 1000, 2) if valor is not None else None
+    if ttfts:
+        resumo['ttft_p50_ms'] = round(percentil(ttfts, 50) * 1000, 2)
+        resumo['ttft_p95_ms'] = round(percentil(ttfts, 95) * 1000, 2)
+    return resumo
+
+
+def _criar_chamada(alvo: str, mock: ServidorMockPerplexity) -> Callable[[str], Tuple[bool, Optional[float]]]:
+    """
+    Devolve uma função (prompt) -> (sucesso, tempo até o primeiro token).
+    """
+    sem_cache = CacheRespostas(ativo=False)
+    cliente = APEXLLMClient('chave-benchmark', cache=sem_cache)
+    cliente.base_url = mock.url_base
+
+    if alvo == 'llm':
+        def _chamar(prompt):
+            return not cliente.gerar_resposta(prompt).startswith('Erro'), None
+    elif alvo == 'streaming':
+        def _chamar(prompt):
+            try:
+                resposta = cliente.processar_com_streaming(prompt)
+                resposta.ler_tudo()
+                return True, resposta.tempo_primeiro_token
+            except Exception:
+                return False, None
+    elif alvo == 'perplexity':
+        perplexity = PerplexityIntegration('chave-benchmark', cache=sem_cache, historico=HistoricoConversa())
+        perplexity.url_api = mock.url_chat
+
+        def _chamar(prompt):
+            return perplexity.fazer_pergunta(prompt).get('status') == 'sucesso', None
+    elif alvo == 'tutor':
+        tutor = TutorConteudo(cliente)
+
+        def _chamar(prompt):
+            return not tutor.resumir(prompt, 'pequeno').startswith('Erro'), None
+    else:
+        raise ValueError(f"Alvo desconhecido: {alvo}")
+    return _chamar
+
+
+def medir(alvo: str, mock: ServidorMockPerplexity, concorrencia: int, requisicoes: int) -> Dict:
+    """
+    Executa `requisicoes` chamadas do alvo com `concorrencia` threads.
+    """
+    chamar = _criar_chamada(alvo, mock)
+    # Prompts únicos: cache e single-flight não devem mascarar a medição
+    prompts = [f"benchmark {uuid.uuid4().hex} {i}" for i in range(requisicoes)]
+
+    def _cronometrar(prompt):
+        inicio = time.perf_counter()
+        sucesso, ttft = chamar(prompt)
+        return sucesso, time.perf_counter() - inicio, ttft
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+        resultados = list(executor.map(_cronometrar, prompts))
+    duracao = time.perf_counter() - inicio
+
+    latencias = [lat for ok, lat, _ in resultados if ok]
+    ttfts = [ttft for ok, _, ttft in resultados if ok and ttft is not None]
+    erros = sum(1 for ok, _, _ in resultados if not ok)
+    return _resumir_medicoes(latencias, erros, duracao, ttfts)
+
+
+def executar_benchmark(
+    concorrencias: List[int],
+    requisicoes: int = 50,
+    alvos: Tuple[str, ...] = ALVOS,
+    **config_mock
+) -> Dict:
+    """
+    Roda o benchmark completo e devolve o relatório.
+
+    Args:
+        concorrencias: Níveis de concorrência a medir
+        requisicoes: Chamadas por nível e por alvo
+        alvos: Quais clientes medir (llm, streaming, perplexity, tutor)
+        **config_mock: Parâmetros do ServidorMockPerplexity
+
+    O transporte HTTP e o controle de taxa do processo são trocados durante
+    a medição e restaurados no fim.
+    """
+    maior = max(concorrencias)
+    transporte_anterior = trocar_transporte(TransporteHTTP(pool_por_host=maior))
+    # Limites altos: o benchmark mede o cliente, não a cota
+    controle_anterior = trocar_controle(ControleTaxa(
+        requisicoes_por_minuto=1_000_000,
+        tokens_por_minuto=1_000_000_000,
+        concorrencia_inicial=maior,
+        concorrencia_maxima=maior
+    ))
+    try:
+        relatorio = {'config': {'requisicoes': requisicoes, **config_mock}, 'resultados': {}}
+        with ServidorMockPerplexity(**config_mock) as mock:
+            for alvo in alvos:
+                relatorio['resultados'][alvo] = {
+                    str(c): medir(alvo, mock, c, requisicoes) for c in concorrencias
+                }
+            relatorio['servidor'] = dict(mock.contadores)
+        relatorio['pool_http'] = estatisticas_pool()
+        return relatorio
+    finally:
+        trocar_transporte(transporte_anterior).fechar()
+        trocar_controle(controle_anterior)
+
+
+# Consultas do benchmark de memória: termo em ~70% das conversas, termos
+# raros e a mistura dos dois
+CONSULTAS_MEMORIA = {
+    'comum': ['python', 'python erro'],
+    'raro': ['termo123 termo4567', 'termo9 termo19999'],
+    'misto': ['python erro termo5', 'como usar python com termo777'],
+}
+
+
+def medir_contexto_relevante(conversas: int = 200_000, repeticoes: int = 20, semente: int = 0) -> Dict:
+    """
+    Latência de `obter_contexto_relevante` num banco sintético.
+
+    Cada conversa tem termos de um vocabulário de 20 mil palavras (as 200
+    primeiras bem mais frequentes); "python" aparece em ~70% e "erro" em
+    ~30% delas, como assuntos recorrentes de um usuário.
+
+    Returns:
+        {'conversas', 'geracao_s', 'consultas': {tipo: {p50_ms, p95_ms, p99_ms, ...}}}
+    """
+    aleatorio = random.Random(semente)
+    vocabulario = [f"termo{i}" for i in range(20000)]
+    with tempfile.TemporaryDirectory() as pasta:
+        memoria = ContextMemory(
+            os.path.join(pasta, 'memoria.db'), escrita_adiada=True, tamanho_lote=10000, recall_vetorial=False
+        )
+        inicio = time.perf_counter()
+        for _ in range(conversas):
+            palavras = aleatorio.choices(vocabulario[:200], k=3) + aleatorio.choices(vocabulario, k=8)
+            if aleatorio.random() < 0.7:
+                palavras.append('python')
+            if aleatorio.random() < 0.3:
+                palavras.append('erro')
+            aleatorio.shuffle(palavras)
+            memoria.adicionar_conversa(' '.join(palavras[:6]), ' '.join(palavras[6:]))
+        memoria.descarregar()
+        geracao = time.perf_counter() - inicio
+
+        relatorio = {'conversas': conversas, 'geracao_s': round(geracao, 2), 'consultas': {}}
+        for tipo, consultas in CONSULTAS_MEMORIA.items():
+            latencias = []
+            inicio = time.perf_counter()
+            for _ in range(repeticoes):
+                for consulta in consultas:
+                    antes = time.perf_counter()
+                    memoria.obter_contexto_relevante(consulta)
+                    latencias.append(time.perf_counter() - antes)
+            relatorio['consultas'][tipo] = _resumir_medicoes(latencias, 0, time.perf_counter() - inicio, [])
+        memoria.fechar()
+    return relatorio
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline dos clientes LLM do APEX")
+    parser.add_argument('--concorrencias', default='1,2,4,8,16')
+    parser.add_argument('--requisicoes', type=int, default=50)
+    parser.add_argument('--alvos', default=','.join(ALVOS))
+    parser.add_argument('--latencia-ms', type=float, default=50)
+    parser.add_argument('--jitter-ms', type=float, default=10)
+    parser.add_argument('--tokens-resposta', type=int, default=32)
+    parser.add_argument('--intervalo-token-ms', type=float, default=2)
+    parser.add_argument('--taxa-erro', type=float, default=0.0)
+    parser.add_argument('--taxa-429', type=float, default=0.0)
+    parser.add_argument('--semente', type=int, default=None)
+    parser.add_argument('--memoria', type=int, metavar='N',
+                        help="Mede a busca de contexto relevante com N conversas")
+    parser.add_argument('--saida', help="Arquivo JSON de saída (padrão: stdout)")
+    args = parser.parse_args()
+
+    if args.memoria:
+        relatorio = medir_contexto_relevante(args.memoria)
+    else:
+        relatorio = executar_benchmark(
+            [int(c) for c in args.concorrencias.split(',')],
+            args.requisicoes,
+            tuple(a.strip() for a in args.alvos.split(',')),
+            latencia_ms=args.latencia_ms,
+            jitter_ms=args.jitter_ms,
+            tokens_resposta=args.tokens_resposta,
+            intervalo_token_ms=args.intervalo_token_ms,
+            taxa_erro=args.taxa_erro,
+            taxa_429=args.taxa_429,
+            semente=args.semente
+        )
+
+    saida = json.dumps(relatorio, ensure_ascii=False, indent=2)
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            f.write(saida)
+    else:
+        print(saida)
+
+
+if __name__ == "__main__":
+    main()
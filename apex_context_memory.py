@@ -1,85 +1,808 @@
 """apex_context_memory.py - Sistema de memória contextual e histórico persistente"""
+import os
+import gzip
 import json
+import zlib
+import atexit
 import sqlite3
+import threading
+import logging
+import weakref
+import re
+import unicodedata
+from collections import OrderedDict
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import Dict, Iterator, List, Optional
 from pathlib import Path
 
+from apex_passage_index import STOPWORDS, tokenizar
+from apex_vector_index import IndiceVetorial, vetorizar_lote
+
+logger = logging.getLogger(__name__)
+
+SESSAO_PADRAO = 'padrao'
+# Termos presentes em mais que esta fração das conversas (e em mais de
+# MIN_DOCS_TERMO_COMUM) não entram no ranking: só custam tempo ao bm25
+FRACAO_TERMO_COMUM = 0.05
+MIN_DOCS_TERMO_COMUM = 1000
+# Só as N conversas mais recentes que casam com a busca são ranqueadas
+MAX_CANDIDATOS_FTS = 500
+
+_TABELA_CONVERSA = '''
+    CREATE TABLE IF NOT EXISTS {nome} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp TEXT,
+        pergunta TEXT,
+        resposta TEXT,
+        fonte TEXT,
+        tokens INTEGER,
+        sessao TEXT NOT NULL DEFAULT 'padrao'
+    )
+'''
+
+
+def _grupo_sessao(sessao: str) -> int:
+    """Grupo da sessão no índice vetorial (CRC32: estável entre processos)"""
+    return zlib.crc32(sessao.encode('utf-8'))
+
+
+_RE_TERMOS = re.compile(r'\w+')
+
+
+def _termos_conteudo(texto: str) -> frozenset:
+    """
+    Palavras de conteúdo da pergunta (sem acentos e sem stopwords), incluindo
+    números de um dígito: "raiz de 144" e "raiz de 169" não são a mesma pergunta.
+    """
+    texto = unicodedata.normalize('NFKD', texto.lower())
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return frozenset(
+        t for t in _RE_TERMOS.findall(texto) if (len(t) > 1 or t.isdigit()) and t not in STOPWORDS
+    )
+
+
+# Instâncias vivas, fechadas na saída do processo. O WeakSet não segura as
+# instâncias: as descartadas são coletadas normalmente
+_instancias: 'weakref.WeakSet[ContextMemory]' = weakref.WeakSet()
+
+
+@atexit.register
+def _fechar_instancias():
+    for memoria in list(_instancias):
+        try:
+            memoria.fechar()
+        except Exception as e:
+            logger.error(f"Erro ao fechar a memória {memoria.db_path}: {e}")
+
+
 class ContextMemory:
     """
     Gerenciador de memória contextual do APEX
     Armazena histórico persistente em SQLite
+
+    Cada thread usa uma conexão própria e duradoura (WAL, synchronous=NORMAL),
+    então a instância pode ser compartilhada pelas threads do Flask. Com
+    `escrita_adiada`, as conversas entram numa fila e são gravadas em lote,
+    numa única transação, ao atingir `tamanho_lote` ou a cada `intervalo_lote`
+    segundos; leituras e o encerramento do processo descarregam a fila.
+
+    Conversas e variáveis são separadas por sessão (um id por usuário ou
+    cliente; o padrão é SESSAO_PADRAO). As variáveis ficam num cache em
+    memória, lido e gravado junto com o banco; gravações de outros processos
+    são detectadas pelo PRAGMA data_version e pela tabela `contexto_versao`,
+    que invalida só as sessões alteradas. O cache guarda no máximo
+    `max_sessoes_cache` sessões, descartando a usada há mais tempo.
     """
-    def __init__(self, db_path: str = 'apex_memory.db'):
+    def __init__(
+        self,
+        db_path: str = 'apex_memory.db',
+        escrita_adiada: bool = False,
+        tamanho_lote: int = 50,
+        intervalo_lote: float = 1.0,
+        recall_vetorial: bool = True,
+        max_sessoes_cache: int = 256
+    ):
         self.db_path = db_path
+        self.escrita_adiada = escrita_adiada
+        self.tamanho_lote = tamanho_lote
+        self.intervalo_lote = intervalo_lote
+
+        self._local = threading.local()
+        self._conexoes: List[sqlite3.Connection] = []
+        self._conexoes_lock = threading.Lock()
+
+        # Fila da escrita adiada
+        self._pendentes: List[tuple] = []
+        self._cond = threading.Condition()
+        self._escrita_lock = threading.Lock()
+        self._escritor: Optional[threading.Thread] = None
+        self._parar = False
+
+        # Cache das variáveis: sessão -> {chave: valor (None = não existe)},
+        # da menos para a mais recentemente usada
+        self._variaveis: 'OrderedDict[str, Dict[str, Optional[str]]]' = OrderedDict()
+        self.max_sessoes_cache = max(1, max_sessoes_cache)
+        # Versão de cada sessão em cache e última `seq` de contexto_versao lida
+        self._versoes: Dict[str, int] = {}
+        self._seq_vista = 0
+        self._geracao = 0
+        self._cache_lock = threading.Lock()
+
         self._inicializar_db()
-    
+        # Vetores das perguntas em <banco>_vetores.f32, ao lado do banco
+        self.vetores = IndiceVetorial(str(Path(db_path).with_suffix('')) + '_vetores') if recall_vetorial else None
+        # Termo comum demais para o ranking -> total de conversas quando foi visto
+        self._termos_comuns: Dict[str, int] = {}
+        # Serializa a conferência do último id com o anexo no índice
+        self._vetores_lock = threading.Lock()
+        _instancias.add(self)
+
+    def _conexao(self) -> sqlite3.Connection:
+        """Conexão da thread atual, aberta no primeiro uso"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA busy_timeout=10000')
+            self._local.conn = conn
+            with self._conexoes_lock:
+                self._conexoes.append(conn)
+        return conn
+
     def _inicializar_db(self):
         """Cria tabelas do banco de dados"""
-        with sqlite3.connect(self.db_path) as conn:
+        conn = self._conexao()
+        with conn:
             cursor = conn.cursor()
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS conversa (
-                    id INTEGER PRIMARY KEY,
-                    timestamp TEXT,
-                    pergunta TEXT,
-                    resposta TEXT,
-                    fonte TEXT,
-                    tokens INTEGER
-                )
-            ''')
-            cursor.execute('''
+            cursor.execute(_TABELA_CONVERSA.format(nome='conversa'))
+            colunas = [linha[1] for linha in cursor.execute('PRAGMA table_info(conversa)')]
+            if 'sessao' not in colunas:
+                cursor.execute("ALTER TABLE conversa ADD COLUMN sessao TEXT NOT NULL DEFAULT 'padrao'")
+            self._migrar_autoincremento(cursor)
+            self._migrar_contexto(cursor)
+            cursor.executescript('''
                 CREATE TABLE IF NOT EXISTS contexto (
-                    id INTEGER PRIMARY KEY,
-                    chave TEXT UNIQUE,
+                    sessao TEXT NOT NULL,
+                    chave TEXT NOT NULL,
                     valor TEXT,
-                    atualizado TEXT
-                )
+                    atualizado TEXT,
+                    PRIMARY KEY (sessao, chave)
+                );
+                CREATE TABLE IF NOT EXISTS contexto_versao (
+                    sessao TEXT PRIMARY KEY,
+                    versao INTEGER NOT NULL,
+                    seq INTEGER NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_contexto_versao_seq ON contexto_versao (seq);
+                CREATE TRIGGER IF NOT EXISTS contexto_versao_ai AFTER INSERT ON contexto BEGIN
+                    INSERT OR REPLACE INTO contexto_versao (sessao, versao, seq) VALUES (
+                        new.sessao,
+                        COALESCE((SELECT versao FROM contexto_versao WHERE sessao = new.sessao), 0) + 1,
+                        (SELECT COALESCE(MAX(seq), 0) + 1 FROM contexto_versao)
+                    );
+                END;
+                CREATE TRIGGER IF NOT EXISTS contexto_versao_au AFTER UPDATE ON contexto BEGIN
+                    INSERT OR REPLACE INTO contexto_versao (sessao, versao, seq) VALUES (
+                        new.sessao,
+                        COALESCE((SELECT versao FROM contexto_versao WHERE sessao = new.sessao), 0) + 1,
+                        (SELECT COALESCE(MAX(seq), 0) + 1 FROM contexto_versao)
+                    );
+                END;
+                CREATE TRIGGER IF NOT EXISTS contexto_versao_ad AFTER DELETE ON contexto BEGIN
+                    INSERT OR REPLACE INTO contexto_versao (sessao, versao, seq) VALUES (
+                        old.sessao,
+                        COALESCE((SELECT versao FROM contexto_versao WHERE sessao = old.sessao), 0) + 1,
+                        (SELECT COALESCE(MAX(seq), 0) + 1 FROM contexto_versao)
+                    );
+                END;
+                CREATE INDEX IF NOT EXISTS idx_conversa_timestamp ON conversa (timestamp);
+                CREATE INDEX IF NOT EXISTS idx_conversa_fonte ON conversa (fonte, id);
+                CREATE INDEX IF NOT EXISTS idx_conversa_sessao ON conversa (sessao, id);
             ''')
-            conn.commit()
-    
-    def adicionar_conversa(self, pergunta: str, resposta: str, fonte: str = 'perplexity', tokens: int = 0):
-        """Armazena uma conversa no histórico"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO conversa (timestamp, pergunta, resposta, fonte, tokens)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (datetime.now().isoformat(), pergunta, resposta, fonte, tokens))
-            conn.commit()
-    
-    def obter_contexto(self, limite: int = 10) -> List[Dict]:
-        """Retorna as últimas conversar para contexto"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute(f'SELECT * FROM conversa ORDER BY id DESC LIMIT {limite}')
-            return [dict(zip([desc[0] for desc in cursor.description], row)) for row in cursor.fetchall()]
-    
-    def salvar_variavel(self, chave: str, valor: str):
-        """Salva uma variável de contexto"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT OR REPLACE INTO contexto (chave, valor, atualizado)
-                VALUES (?, ?, ?)
-            ''', (chave, valor, datetime.now().isoformat()))
-            conn.commit()
-    
-    def obter_variavel(self, chave: str) -> Optional[str]:
-        """Obtém uma variável de contexto"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT valor FROM contexto WHERE chave = ?', (chave,))
-            resultado = cursor.fetchone()
-            return resultado[0] if resultado else None
-    
+            self._seq_vista = cursor.execute('SELECT COALESCE(MAX(seq), 0) FROM contexto_versao').fetchone()[0]
+        self._fts = self._inicializar_fts(conn)
+
+    @staticmethod
+    def _migrar_autoincremento(cursor: sqlite3.Cursor):
+        """
+        Bancos antigos: `conversa` passa a usar AUTOINCREMENT.
+
+        Sem ele o SQLite reaproveita os ids mais altos depois que conversas
+        são apagadas (arquivadas), e vetores, cursores de exportação e o
+        arquivo passariam a apontar para a conversa errada.
+        """
+        sql = cursor.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'conversa'"
+        ).fetchone()[0]
+        if 'AUTOINCREMENT' in sql.upper():
+            return
+        cursor.execute(_TABELA_CONVERSA.format(nome='conversa_nova'))
+        cursor.execute(
+            'INSERT INTO conversa_nova (id, timestamp, pergunta, resposta, fonte, tokens, sessao) '
+            'SELECT id, timestamp, pergunta, resposta, fonte, tokens, sessao FROM conversa'
+        )
+        cursor.execute('DROP TABLE conversa')
+        cursor.execute('ALTER TABLE conversa_nova RENAME TO conversa')
+        # Ids já arquivados também não podem voltar
+        ultimo = cursor.execute('SELECT COALESCE(MAX(id), 0) FROM conversa').fetchone()[0]
+        if cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'conversa_arquivo'"
+        ).fetchone():
+            ultimo = max(ultimo, cursor.execute(
+                'SELECT COALESCE(MAX(ultimo_id), 0) FROM conversa_arquivo'
+            ).fetchone()[0])
+        cursor.execute("DELETE FROM sqlite_sequence WHERE name = 'conversa'")
+        cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('conversa', ?)", (ultimo,))
+
+    @staticmethod
+    def _migrar_contexto(cursor: sqlite3.Cursor):
+        """Bancos antigos: a tabela `contexto` (chave única) passa a ser por sessão"""
+        colunas = [linha[1] for linha in cursor.execute('PRAGMA table_info(contexto)')]
+        if not colunas or 'sessao' in colunas:
+            return
+        cursor.execute('ALTER TABLE contexto RENAME TO contexto_antigo')
+        cursor.execute('''
+            CREATE TABLE contexto (
+                sessao TEXT NOT NULL,
+                chave TEXT NOT NULL,
+                valor TEXT,
+                atualizado TEXT,
+                PRIMARY KEY (sessao, chave)
+            )
+        ''')
+        cursor.execute(
+            'INSERT INTO contexto (sessao, chave, valor, atualizado) '
+            'SELECT ?, chave, valor, atualizado FROM contexto_antigo', (SESSAO_PADRAO,)
+        )
+        cursor.execute('DROP TABLE contexto_antigo')
+
+    def _inicializar_fts(self, conn: sqlite3.Connection) -> bool:
+        """
+        Cria o índice FTS5 de pergunta/resposta, mantido por triggers.
+
+        Bancos antigos são indexados uma única vez (rebuild). Retorna False
+        se o SQLite não tiver FTS5; nesse caso a busca cai na ordem recente.
+        """
+        existia = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'conversa_fts'"
+        ).fetchone() is not None
+        try:
+            with conn:
+                conn.executescript('''
+                    CREATE VIRTUAL TABLE IF NOT EXISTS conversa_fts USING fts5(
+                        pergunta, resposta,
+                        content='conversa', content_rowid='id',
+                        tokenize='unicode61 remove_diacritics 2'
+                    );
+                    CREATE TRIGGER IF NOT EXISTS conversa_fts_ai AFTER INSERT ON conversa BEGIN
+                        INSERT INTO conversa_fts (rowid, pergunta, resposta)
+                        VALUES (new.id, new.pergunta, new.resposta);
+                    END;
+                    CREATE TRIGGER IF NOT EXISTS conversa_fts_ad AFTER DELETE ON conversa BEGIN
+                        INSERT INTO conversa_fts (conversa_fts, rowid, pergunta, resposta)
+                        VALUES ('delete', old.id, old.pergunta, old.resposta);
+                    END;
+                    CREATE TRIGGER IF NOT EXISTS conversa_fts_au AFTER UPDATE ON conversa BEGIN
+                        INSERT INTO conversa_fts (conversa_fts, rowid, pergunta, resposta)
+                        VALUES ('delete', old.id, old.pergunta, old.resposta);
+                        INSERT INTO conversa_fts (rowid, pergunta, resposta)
+                        VALUES (new.id, new.pergunta, new.resposta);
+                    END;
+                    CREATE VIRTUAL TABLE IF NOT EXISTS conversa_fts_vocab USING fts5vocab(conversa_fts, row);
+                ''')
+                if not existia:
+                    conn.execute("INSERT INTO conversa_fts (conversa_fts) VALUES ('rebuild')")
+            return True
+        except sqlite3.OperationalError as e:
+            logger.warning(f"FTS5 indisponível, busca por relevância desativada: {e}")
+            return False
+
+    def adicionar_conversa(
+        self,
+        pergunta: str,
+        resposta: str,
+        fonte: str = 'perplexity',
+        tokens: int = 0,
+        sessao: str = SESSAO_PADRAO
+    ):
+        """Armazena uma conversa no histórico da sessão"""
+        linha = (datetime.now().isoformat(), pergunta, resposta, fonte, tokens, sessao)
+        if not self.escrita_adiada:
+            self._gravar_conversas([linha])
+            return
+
+        with self._cond:
+            self._pendentes.append(linha)
+            if self._escritor is None:
+                self._escritor = threading.Thread(target=self._loop_escritor, name='apex-memoria', daemon=True)
+                self._escritor.start()
+            if len(self._pendentes) >= self.tamanho_lote:
+                self._cond.notify()
+
+    def _gravar_conversas(self, linhas: List[tuple]):
+        conn = self._conexao()
+        with conn:
+            conn.executemany('''
+                INSERT INTO conversa (timestamp, pergunta, resposta, fonte, tokens, sessao)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', linhas)
+
+    def _esquecer_vetores(self, ids: List[int]):
+        """Tira do recall vetorial conversas apagadas da tabela (ex.: arquivadas)"""
+        if self.vetores is not None:
+            self.vetores.remover(ids)
+
+    def _sincronizar_vetores(self):
+        """
+        Vetoriza as conversas gravadas depois do último id do índice.
+
+        Roda a cada busca, então pega também o que outros processos gravaram.
+        Os ids só crescem (AUTOINCREMENT), e o índice guarda até onde já foi.
+        A vetorização fica fora do `_vetores_lock`, que protege só o anexo.
+        """
+        cursor = self._conexao().execute(
+            'SELECT id, pergunta, sessao FROM conversa WHERE id > ? ORDER BY id', (self.vetores.ultimo_id or 0,)
+        )
+        while True:
+            linhas = cursor.fetchmany(5000)
+            if not linhas:
+                break
+            vetores = vetorizar_lote([l[1] or '' for l in linhas], self.vetores.dimensao)
+            with self._vetores_lock:
+                # Outra busca pode ter anexado parte do lote enquanto este era vetorizado
+                ultimo = self.vetores.ultimo_id or 0
+                inicio = next((i for i, l in enumerate(linhas) if l[0] > ultimo), len(linhas))
+                self.vetores.anexar(
+                    [l[0] for l in linhas[inicio:]], vetores[inicio:],
+                    [_grupo_sessao(l[2]) for l in linhas[inicio:]]
+                )
+
+    def _loop_escritor(self):
+        """Grava a fila quando ela enche ou a cada `intervalo_lote` segundos"""
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self._parar or len(self._pendentes) >= self.tamanho_lote,
+                    timeout=self.intervalo_lote
+                )
+                parar = self._parar
+            try:
+                self.descarregar()
+            except sqlite3.Error as e:
+                logger.error(f"Erro ao gravar conversas em lote: {e}")
+            if parar:
+                return
+
+    def descarregar(self):
+        """Grava imediatamente as conversas que estão na fila"""
+        with self._escrita_lock:
+            with self._cond:
+                lote, self._pendentes = self._pendentes, []
+            if lote:
+                self._gravar_conversas(lote)
+
+    def obter_contexto(self, limite: int = 10, sessao: str = SESSAO_PADRAO) -> List[Dict]:
+        """Retorna as últimas conversar da sessão para contexto"""
+        self.descarregar()
+        cursor = self._conexao().cursor()
+        cursor.execute(
+            'SELECT * FROM conversa WHERE sessao = ? ORDER BY id DESC LIMIT ?', (sessao, int(limite))
+        )
+        return [dict(zip([desc[0] for desc in cursor.description], row)) for row in cursor.fetchall()]
+
+    def obter_contexto_relevante(
+        self,
+        query: str,
+        k: int = 5,
+        peso_recencia: float = 0.3,
+        meia_vida: int = 200,
+        sessao: str = SESSAO_PADRAO
+    ) -> List[Dict]:
+        """
+        Retorna as conversas mais relevantes para `query`.
+
+        Os candidatos vêm do FTS5 ordenados por bm25; a pontuação final mistura
+        a relevância normalizada com a recência, que cai pela metade a cada
+        `meia_vida` conversas.
+
+        O custo é limitado antes do ranking: termos comuns demais (ver
+        FRACAO_TERMO_COMUM) ficam de fora, porque o bm25 percorre a lista
+        inteira de cada termo, e só as MAX_CANDIDATOS_FTS conversas mais
+        recentes da sessão que casam são ranqueadas. Se a busca só tiver
+        termos comuns, vale a ordem recente entre as que casam.
+
+        Args:
+            query: Texto da pergunta atual
+            k: Quantidade de conversas
+            peso_recencia: Peso da recência na pontuação (0 = só relevância)
+            meia_vida: Conversas até a recência valer metade
+            sessao: Sessão cujas conversas são consultadas
+
+        Returns:
+            Conversas (dicts da tabela) com a chave extra 'relevancia', da mais
+            para a menos relevante
+        """
+        termos = tokenizar(query)
+        if not self._fts or not termos:
+            return self.obter_contexto(k, sessao)
+
+        self.descarregar()
+        conn = self._conexao()
+        termos = list(dict.fromkeys(termos))
+        raros = self._termos_raros(conn, termos)
+        limite = max(k * 10, 50)
+        if raros:
+            expressao = ' OR '.join('"' + termo + '"' for termo in raros)
+            # Id da N-ésima conversa mais recente que casa: percorrer o índice
+            # em ordem de rowid não calcula bm25
+            corte = conn.execute('''
+                SELECT conversa_fts.rowid
+                FROM conversa_fts JOIN conversa c ON c.id = conversa_fts.rowid
+                WHERE conversa_fts MATCH ? AND c.sessao = ?
+                ORDER BY conversa_fts.rowid DESC
+                LIMIT 1 OFFSET ?
+            ''', (expressao, sessao, MAX_CANDIDATOS_FTS - 1)).fetchone()
+            cursor = conn.execute('''
+                SELECT c.*, conversa_fts.rank AS bm25
+                FROM conversa_fts JOIN conversa c ON c.id = conversa_fts.rowid
+                WHERE conversa_fts MATCH ? AND conversa_fts.rowid >= ? AND c.sessao = ?
+                ORDER BY conversa_fts.rank
+                LIMIT ?
+            ''', (expressao, corte[0] if corte else 0, sessao, limite))
+        else:
+            expressao = ' OR '.join('"' + termo + '"' for termo in termos)
+            cursor = conn.execute('''
+                SELECT c.*, -1.0 AS bm25
+                FROM conversa_fts JOIN conversa c ON c.id = conversa_fts.rowid
+                WHERE conversa_fts MATCH ? AND c.sessao = ?
+                ORDER BY conversa_fts.rowid DESC
+                LIMIT ?
+            ''', (expressao, sessao, limite))
+        colunas = [desc[0] for desc in cursor.description]
+        candidatos = [dict(zip(colunas, row)) for row in cursor.fetchall()]
+        if not candidatos:
+            return []
+
+        ultimo_id = conn.execute('SELECT MAX(id) FROM conversa WHERE sessao = ?', (sessao,)).fetchone()[0]
+        # bm25 do SQLite é negativo: quanto menor, mais relevante
+        melhor = max(-c['bm25'] for c in candidatos) or 1.0
+        for c in candidatos:
+            relevancia = -c.pop('bm25') / melhor
+            recencia = 0.5 ** ((ultimo_id - c['id']) / meia_vida)
+            c['relevancia'] = round((1 - peso_recencia) * relevancia + peso_recencia * recencia, 6)
+        candidatos.sort(key=lambda c: c['relevancia'], reverse=True)
+        return candidatos[:k]
+
+    def _termos_raros(self, conn: sqlite3.Connection, termos: List[str]) -> List[str]:
+        """
+        Termos abaixo do corte de frequência (FRACAO_TERMO_COMUM).
+
+        Contar as conversas de um termo no fts5vocab percorre a lista dele,
+        então os termos já vistos como comuns ficam em cache até o banco
+        dobrar de tamanho.
+        """
+        # MIN e MAX em subconsultas separadas: cada um vira uma leitura no índice
+        minimo, maximo = conn.execute(
+            'SELECT (SELECT MIN(id) FROM conversa), (SELECT MAX(id) FROM conversa)'
+        ).fetchone()
+        total = (maximo - minimo + 1) if maximo is not None else 0
+        limite = max(FRACAO_TERMO_COMUM * total, MIN_DOCS_TERMO_COMUM)
+        if total <= limite:
+            return termos
+        raros = []
+        for termo in termos:
+            visto = self._termos_comuns.get(termo)
+            if visto is not None and total < 2 * visto:
+                continue
+            linha = conn.execute('SELECT doc FROM conversa_fts_vocab WHERE term = ?', (termo,)).fetchone()
+            if linha is not None and linha[0] > limite:
+                self._termos_comuns[termo] = total
+            else:
+                self._termos_comuns.pop(termo, None)
+                raros.append(termo)
+        return raros
+
+    def buscar_similares(
+        self,
+        pergunta: str,
+        k: int = 5,
+        limiar: float = 0.0,
+        sessao: str = SESSAO_PADRAO
+    ) -> List[Dict]:
+        """
+        Conversas da sessão cujas perguntas são parecidas com `pergunta`
+        (recall vetorial).
+
+        Returns:
+            Conversas com a chave extra 'similaridade' (cosseno, 0 a 1), da
+            mais para a menos parecida, apenas as com similaridade >= limiar
+        """
+        if self.vetores is None:
+            return []
+        self.descarregar()
+        self._sincronizar_vetores()
+        # O índice guarda a sessão de cada vetor: o top-k já sai só da sessão
+        encontrados = [
+            (i, s) for i, s in self.vetores.buscar(pergunta, k, grupo=_grupo_sessao(sessao)) if s >= limiar
+        ]
+        if not encontrados:
+            return []
+        cursor = self._conexao().execute(
+            f"SELECT * FROM conversa WHERE sessao = ? AND id IN ({','.join('?' * len(encontrados))})",
+            [sessao] + [i for i, _ in encontrados]
+        )
+        colunas = [desc[0] for desc in cursor.description]
+        por_id = {row[0]: dict(zip(colunas, row)) for row in cursor.fetchall()}
+        resultado = []
+        for i, similaridade in encontrados:
+            # Conversas removidas/arquivadas continuam no índice: são ignoradas
+            if i in por_id:
+                por_id[i]['similaridade'] = round(similaridade, 4)
+                resultado.append(por_id[i])
+        return resultado
+
+    def resposta_memorizada(
+        self,
+        pergunta: str,
+        limiar: float = 0.75,
+        sessao: str = SESSAO_PADRAO
+    ) -> Optional[Dict]:
+        """
+        Conversa com a mesma pergunta, para responder sem chamar o LLM.
+
+        O recall vetorial só levanta candidatos (similaridade >= `limiar`);
+        a resposta vale apenas se as palavras de conteúdo, com números e
+        nomes, forem exatamente as mesmas. Assim "qual é a raiz quadrada de
+        144?" reaproveita "qual a raiz quadrada de 144", mas "... de 169" ou
+        "capital da Alemanha" x "capital da França" não. None se nenhum
+        candidato confirmar.
+        """
+        termos = _termos_conteudo(pergunta)
+        for candidato in self.buscar_similares(pergunta, k=5, limiar=limiar, sessao=sessao):
+            if _termos_conteudo(candidato['pergunta'] or '') == termos:
+                return candidato
+        return None
+
+    def _validar_cache(self):
+        """
+        Descarta do cache as sessões alteradas por outras conexões.
+
+        PRAGMA data_version só muda quando outra conexão grava no banco; nesse
+        caso, as sessões com versão nova em `contexto_versao` são invalidadas.
+        """
+        conn = self._conexao()
+        versao_dados = conn.execute('PRAGMA data_version').fetchone()[0]
+        if getattr(self._local, 'versao_dados', None) == versao_dados:
+            return
+        self._local.versao_dados = versao_dados
+        with self._cache_lock:
+            vista = self._seq_vista
+        alteradas = conn.execute(
+            'SELECT sessao, versao, seq FROM contexto_versao WHERE seq > ?', (vista,)
+        ).fetchall()
+        with self._cache_lock:
+            for sessao, versao, seq in alteradas:
+                if sessao in self._versoes:
+                    self._atualizar_versao(sessao, versao)
+                else:
+                    # Fora do cache: só descarta leituras em andamento
+                    self._geracao += 1
+                self._seq_vista = max(self._seq_vista, seq)
+
+    def _atualizar_versao(self, sessao: str, versao: int) -> Dict[str, Optional[str]]:
+        """Cache da sessão, esvaziado se a versão conhecida não é `versao` (com _cache_lock)"""
+        if self._versoes.get(sessao) != versao:
+            self._variaveis.pop(sessao, None)
+            self._versoes[sessao] = versao
+            self._geracao += 1
+        return self._cache_sessao(sessao)
+
+    def _cache_sessao(self, sessao: str) -> Dict[str, Optional[str]]:
+        """Cache da sessão, marcado como o mais recente; descarta os excedentes (com _cache_lock)"""
+        variaveis = self._variaveis.get(sessao)
+        if variaveis is not None:
+            self._variaveis.move_to_end(sessao)
+            return variaveis
+        variaveis = self._variaveis[sessao] = {}
+        while len(self._variaveis) > self.max_sessoes_cache:
+            antiga, _ = self._variaveis.popitem(last=False)
+            self._versoes.pop(antiga, None)
+        return variaveis
+
+    def salvar_variavel(self, chave: str, valor: str, sessao: str = SESSAO_PADRAO):
+        """Salva uma variável de contexto da sessão (banco e cache)"""
+        conn = self._conexao()
+        with conn:
+            conn.execute('''
+                INSERT OR REPLACE INTO contexto (sessao, chave, valor, atualizado)
+                VALUES (?, ?, ?, ?)
+            ''', (sessao, chave, valor, datetime.now().isoformat()))
+            versao = conn.execute(
+                'SELECT versao FROM contexto_versao WHERE sessao = ?', (sessao,)
+            ).fetchone()[0]
+        with self._cache_lock:
+            # Se a versão conhecida não é a imediatamente anterior, outra
+            # conexão gravou nesta sessão antes e o cache dela é descartado
+            if self._versoes.get(sessao) == versao - 1:
+                self._versoes[sessao] = versao
+                self._geracao += 1
+                variaveis = self._cache_sessao(sessao)
+            else:
+                variaveis = self._atualizar_versao(sessao, versao)
+            variaveis[chave] = valor
+
+    def obter_variavel(self, chave: str, sessao: str = SESSAO_PADRAO) -> Optional[str]:
+        """Obtém uma variável de contexto da sessão (do cache, se possível)"""
+        self._validar_cache()
+        with self._cache_lock:
+            variaveis = self._variaveis.get(sessao)
+            if variaveis is not None and chave in variaveis:
+                self._variaveis.move_to_end(sessao)
+                return variaveis[chave]
+            geracao = self._geracao
+
+        # Um único SELECT: valor e versão vêm do mesmo instante do banco
+        valor, versao = self._conexao().execute('''
+            SELECT (SELECT valor FROM contexto WHERE sessao = ? AND chave = ?),
+                   COALESCE((SELECT versao FROM contexto_versao WHERE sessao = ?), 0)
+        ''', (sessao, chave, sessao)).fetchone()
+        with self._cache_lock:
+            # Uma gravação no meio da leitura deixaria o valor lido desatualizado
+            if self._geracao == geracao:
+                self._atualizar_versao(sessao, versao)[chave] = valor
+        return valor
+
+    def listar_sessoes(self) -> List[str]:
+        """Sessões com conversas gravadas"""
+        self.descarregar()
+        cursor = self._conexao().execute('SELECT DISTINCT sessao FROM conversa ORDER BY sessao')
+        return [linha[0] for linha in cursor.fetchall()]
+
+    def iterar_conversas(
+        self,
+        desde_id: int = 0,
+        desde_timestamp: Optional[str] = None,
+        tamanho_lote: int = 1000
+    ) -> Iterator[Dict]:
+        """
+        Percorre as conversas em ordem de id, lendo `tamanho_lote` linhas por vez.
+
+        Args:
+            desde_id: Só conversas com id maior que este
+            desde_timestamp: Só conversas com timestamp ISO >= este
+            tamanho_lote: Linhas trazidas do SQLite a cada fetchmany
+        """
+        self.descarregar()
+        sql = 'SELECT * FROM conversa WHERE id > ?'
+        parametros: list = [int(desde_id)]
+        if desde_timestamp is not None:
+            sql += ' AND timestamp >= ?'
+            parametros.append(desde_timestamp)
+        # Cursor próprio: o iterador pode ser consumido aos poucos
+        cursor = self._conexao().cursor()
+        cursor.execute(sql + ' ORDER BY id', parametros)
+        colunas = [desc[0] for desc in cursor.description]
+        try:
+            while True:
+                linhas = cursor.fetchmany(tamanho_lote)
+                if not linhas:
+                    return
+                for row in linhas:
+                    yield dict(zip(colunas, row))
+        finally:
+            cursor.close()
+
+    def exportar_jsonl(
+        self,
+        arquivo: str,
+        desde_id: Optional[int] = None,
+        desde_timestamp: Optional[str] = None,
+        arquivo_cursor: Optional[str] = None,
+        tamanho_lote: int = 1000
+    ) -> int:
+        """
+        Anexa as conversas a `arquivo` (JSONL; gzip se terminar em .gz) sem
+        carregar a tabela na memória.
+
+        Com `arquivo_cursor`, o último id exportado e o tamanho do arquivo
+        ficam salvos nele a cada lote: a próxima chamada (ou a retomada após
+        uma falha) continua de onde parou, exportando só o que é novo. Cada
+        lote é anexado inteiro (no gzip, como um membro completo) antes de o
+        cursor avançar, e um lote interrompido no meio é descartado na
+        retomada, então o arquivo continua legível.
+
+        Args:
+            arquivo: Destino (.jsonl ou .jsonl.gz)
+            desde_id: Só conversas com id maior (padrão: o do cursor, ou 0)
+            desde_timestamp: Só conversas com timestamp ISO >= este
+            arquivo_cursor: JSON com o progresso da exportação
+            tamanho_lote: Conversas escritas entre gravações do cursor
+
+        Returns:
+            Quantidade de conversas escritas
+        """
+        cursor = self._ler_cursor(arquivo_cursor) if arquivo_cursor else {}
+        if desde_id is None:
+            desde_id = cursor.get('ultimo_id', 0)
+        if 'bytes' in cursor and os.path.exists(arquivo) and os.path.getsize(arquivo) > cursor['bytes']:
+            # Sobra de um lote que não chegou a ser confirmado no cursor
+            with open(arquivo, 'r+b') as f:
+                f.truncate(cursor['bytes'])
+
+        comprimir = arquivo.endswith('.gz')
+        escritas = 0
+        lote: List[str] = []
+        for conversa in self.iterar_conversas(desde_id, desde_timestamp, tamanho_lote):
+            lote.append(json.dumps(conversa, ensure_ascii=False) + '\n')
+            if len(lote) >= tamanho_lote:
+                escritas += self._escrever_lote(arquivo, comprimir, lote, arquivo_cursor, conversa['id'])
+                lote = []
+        if lote:
+            escritas += self._escrever_lote(arquivo, comprimir, lote, arquivo_cursor, conversa['id'])
+        return escritas
+
+    @staticmethod
+    def _escrever_lote(
+        arquivo: str,
+        comprimir: bool,
+        lote: List[str],
+        arquivo_cursor: Optional[str],
+        ultimo_id: int
+    ) -> int:
+        dados = ''.join(lote).encode('utf-8')
+        with open(arquivo, 'ab') as f:
+            f.write(gzip.compress(dados) if comprimir else dados)
+            f.flush()
+            os.fsync(f.fileno())
+            tamanho = f.tell()
+        if arquivo_cursor:
+            # O cursor só avança depois que o lote foi escrito
+            temporario = arquivo_cursor + '.tmp'
+            with open(temporario, 'w', encoding='utf-8') as c:
+                json.dump({
+                    'ultimo_id': ultimo_id, 'bytes': tamanho, 'atualizado': datetime.now().isoformat()
+                }, c)
+            os.replace(temporario, arquivo_cursor)
+        return len(lote)
+
+    @staticmethod
+    def _ler_cursor(arquivo_cursor: str) -> Dict:
+        try:
+            with open(arquivo_cursor, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
     def exportar_historico(self, arquivo: str = 'apex_historico.json'):
-        """Exporta histórico para JSON"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM conversa')
-            colunas = [desc[0] for desc in cursor.description]
-            dados = [dict(zip(colunas, row)) for row in cursor.fetchall()]
-        
+        """Exporta histórico para JSON (escrito conversa a conversa)"""
         with open(arquivo, 'w', encoding='utf-8') as f:
-            json.dump(dados, f, ensure_ascii=False, indent=2)
+            f.write('[')
+            for i, conversa in enumerate(self.iterar_conversas()):
+                f.write(',\n  ' if i else '\n  ')
+                f.write(json.dumps(conversa, ensure_ascii=False))
+            f.write('\n]\n')
+
+    def fechar(self):
+        """Descarrega a fila e fecha as conexões (chamado também no atexit)"""
+        with self._cond:
+            self._parar = True
+            self._cond.notify_all()
+            escritor = self._escritor
+        if escritor is not None and escritor is not threading.current_thread():
+            escritor.join(timeout=10)
+        self.descarregar()
+        if self.vetores is not None:
+            self.vetores.fechar()
+        with self._conexoes_lock:
+            for conn in self._conexoes:
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            self._conexoes.clear()
+        self._local = threading.local()
+        with self._cond:
+            # A instância continua utilizável (reabre conexões sob demanda)
+            self._escritor = None
+            self._parar = False
@@ -0,0 +1,192 @@
+"""apex_context_window.py - Montagem da janela de contexto por orçamento de tokens
+
+Em vez de enviar o histórico inteiro (ou um número fixo de pares), o
+MontadorContexto preenche um orçamento de tokens da mensagem mais nova
+para a mais antiga, mantendo sempre as mensagens de sistema. Os turnos
+que não cabem podem ser condensados num resumo, que fica em cache e é
+atualizado de forma incremental conforme a conversa cresce.
+"""
+
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+# Palavras e sinais de pontuação; palavras longas contam ~1 token a cada 4 caracteres
+_PADRAO_TOKEN = re.compile(r"\w+|[^\w\s]")
+
+# Custo fixo de cada mensagem no formato chat (role, separadores)
+TOKENS_POR_MENSAGEM = 4
+
+
+def contar_tokens(texto: str) -> int:
+    """
+    Estima a quantidade de tokens de um texto.
+
+    É uma aproximação (sem tokenizer do modelo), calibrada para
+    português/inglês: ~1 token por palavra curta ou sinal de pontuação.
+    """
+    total = 0
+    for m in _PADRAO_TOKEN.finditer(texto):
+        tamanho = m.end() - m.start()
+        total += 1 if tamanho <= 4 else (tamanho + 3) // 4
+    return total
+
+
+class MontadorContexto:
+    """
+    Monta a lista de mensagens respeitando um orçamento de tokens.
+    """
+
+    def __init__(
+        self,
+        orcamento_tokens: int = 3000,
+        resumidor: Optional[Callable[[List[Dict]], str]] = None,
+        orcamento_resumo: Optional[int] = None,
+        max_cache: int = 4096
+    ):
+        """
+        Args:
+            orcamento_tokens: Máximo de tokens enviados no prompt
+            resumidor: Função que condensa mensagens antigas num texto;
+                se None, turnos que não cabem são simplesmente descartados
+            orcamento_resumo: Tokens reservados ao resumo (padrão: 1/4 do orçamento)
+            max_cache: Mensagens com contagem de tokens em cache
+        """
+        self.orcamento_tokens = orcamento_tokens
+        self.resumidor = resumidor
+        self.orcamento_resumo = orcamento_resumo if orcamento_resumo is not None else orcamento_tokens // 4
+        self.max_cache = max_cache
+
+        self._lock = threading.Lock()
+        self._contagens: 'OrderedDict[tuple, int]' = OrderedDict()
+        self._resumos: 'OrderedDict[str, str]' = OrderedDict()
+
+    def contar(self, mensagem: Dict) -> int:
+        """Tokens de uma mensagem, com cache por (role, content)"""
+        chave = (mensagem.get('role', ''), mensagem.get('content', ''))
+        with self._lock:
+            total = self._contagens.get(chave)
+            if total is not None:
+                self._contagens.move_to_end(chave)
+                return total
+        total = contar_tokens(chave[1]) + TOKENS_POR_MENSAGEM
+        with self._lock:
+            self._contagens[chave] = total
+            if len(self._contagens) > self.max_cache:
+                self._contagens.popitem(last=False)
+        return total
+
+    def montar(self, mensagens: List[Dict], orcamento_tokens: Optional[int] = None) -> List[Dict]:
+        """
+        Seleciona as mensagens que cabem no orçamento.
+
+        As mensagens de sistema e a última mensagem (pergunta atual) são
+        sempre mantidas; o restante entra da mais nova para a mais antiga.
+
+        Args:
+            mensagens: Mensagens em ordem cronológica
+            orcamento_tokens: Sobrescreve o orçamento padrão nesta chamada
+
+        Returns:
+            Nova lista de mensagens, em ordem cronológica
+        """
+        orcamento = orcamento_tokens or self.orcamento_tokens
+        if not mensagens:
+            return []
+
+        sistema = [m for m in mensagens if m.get('role') == 'system']
+        conversa = [m for m in mensagens if m.get('role') != 'system']
+        atual, anteriores = conversa[-1:], conversa[:-1]
+
+        usados = sum(self.contar(m) for m in sistema) + sum(self.contar(m) for m in atual)
+        disponivel = orcamento - usados
+        if self.resumidor and anteriores:
+            disponivel -= self.orcamento_resumo
+
+        inicio = len(anteriores)
+        while inicio > 0:
+            custo = self.contar(anteriores[inicio - 1])
+            if custo > disponivel:
+                break
+            disponivel -= custo
+            inicio -= 1
+
+        # A conversa mantida deve começar por uma fala do usuário (a API
+        # exige alternância user/assistant após as mensagens de sistema)
+        while inicio < len(anteriores) and anteriores[inicio].get('role') != 'user':
+            inicio += 1
+
+        mantidas = anteriores[inicio:]
+        descartadas = anteriores[:inicio]
+
+        resumo = []
+        if descartadas and self.resumidor:
+            texto = self._resumir(descartadas)
+            if texto:
+                resumo = [{"role": "system", "content": f"Resumo da conversa anterior: {texto}"}]
+
+        return sistema + resumo + mantidas + atual
+
+    def _resumir(self, descartadas: List[Dict]) -> str:
+        """
+        Resume as mensagens descartadas reaproveitando o maior prefixo já resumido.
+        """
+        chaves = []
+        acumulado = hashlib.sha1()
+        for m in descartadas:
+            acumulado.update(m.get('role', '').encode('utf-8'))
+            acumulado.update(b'\x00')
+            acumulado.update(m.get('content', '').encode('utf-8'))
+            acumulado.update(b'\x01')
+            chaves.append(acumulado.hexdigest())
+
+        with self._lock:
+            if chaves[-1] in self._resumos:
+                self._resumos.move_to_end(chaves[-1])
+                return self._resumos[chaves[-1]]
+            anterior, desde = None, 0
+            for i in range(len(chaves) - 2, -1, -1):
+                if chaves[i] in self._resumos:
+                    anterior, desde = self._resumos[chaves[i]], i + 1
+                    break
+
+        entrada = descartadas[desde:]
+        if anterior:
+            entrada = [{"role": "system", "content": f"Resumo até aqui: {anterior}"}] + entrada
+        texto = self.resumidor(entrada) or ''
+        texto = self._truncar(texto, self.orcamento_resumo)
+
+        with self._lock:
+            self._resumos[chaves[-1]] = texto
+            while len(self._resumos) > 256:
+                self._resumos.popitem(last=False)
+        return texto
+
+    @staticmethod
+    def _truncar(texto: str, max_tokens: int) -> str:
+        """Corta o texto para caber em `max_tokens` (aproximado)"""
+        total = 0
+        for m in _PADRAO_TOKEN.finditer(texto):
+            tamanho = m.end() - m.start()
+            total += 1 if tamanho <= 4 else (tamanho + 3) // 4
+            if total > max_tokens:
+                return texto[:m.start()].rstrip()
+        return texto
+
+
+def criar_resumidor(llm_client, max_palavras: int = 120) -> Callable[[List[Dict]], str]:
+    """
+    Cria um resumidor que usa o próprio LLM para condensar turnos antigos.
+
+    Args:
+        llm_client: Cliente com `gerar_resposta` (ex.: APEXLLMClient)
+        max_palavras: Tamanho aproximado do resumo
+    """
+    def _resumir(mensagens: List[Dict]) -> str:
+        conversa = '\n'.join(f"{m.get('role')}: {m.get('content')}" for m in mensagens)
+        prompt = f"Resuma em até {max_palavras} palavras os fatos importantes desta conversa:\n{conversa}"
+        return llm_client.gerar_resposta(prompt, temperatura=0.2)
+
+    return _resumir
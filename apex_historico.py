@@ -0,0 +1,213 @@
+"""apex_historico.py - Histórico de conversa limitado e persistente
+
+Mantém em memória só as últimas N interações (buffer circular de registros
+compactos com `__slots__`) e grava cada interação, no momento em que
+acontece, num log JSONL somente-anexação. A memória fica estável em
+processos longos e o histórico completo continua no disco.
+
+A exportação é incremental: cada chamada anexa ao arquivo de destino apenas
+as interações ainda não exportadas, com custo O(novas interações).
+
+`limpar()` anexa ao log uma marca de limpeza; ao recarregar o log, só as
+interações depois da última marca voltam para a memória.
+"""
+
+import os
+import json
+import threading
+import logging
+from collections import deque
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Bloco usado para ler o final do log de trás para frente
+_TAMANHO_BLOCO = 64 * 1024
+
+
+class RegistroConversa:
+    """Uma interação pergunta/resposta"""
+
+    __slots__ = ('seq', 'timestamp', 'pergunta', 'resposta', 'modelo', 'tokens')
+
+    def __init__(self, seq: int, timestamp: str, pergunta: str, resposta: str, modelo: str, tokens: int):
+        self.seq = seq
+        self.timestamp = timestamp
+        self.pergunta = pergunta
+        self.resposta = resposta
+        self.modelo = modelo
+        self.tokens = tokens
+
+    def para_dict(self) -> Dict:
+        return {
+            'timestamp': self.timestamp,
+            'pergunta': self.pergunta,
+            'resposta': self.resposta,
+            'modelo': self.modelo,
+            'tokens': self.tokens
+        }
+
+
+def _ler_ultimas_linhas(caminho: str, quantidade: int) -> List[str]:
+    """
+    Lê as últimas `quantidade` linhas de um arquivo sem percorrê-lo inteiro.
+    """
+    if quantidade <= 0:
+        return []
+    with open(caminho, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        posicao = f.tell()
+        dados = b''
+        while posicao > 0 and dados.count(b'\n') <= quantidade:
+            leitura = min(_TAMANHO_BLOCO, posicao)
+            posicao -= leitura
+            f.seek(posicao)
+            dados = f.read(leitura) + dados
+    linhas = [l for l in dados.split(b'\n') if l.strip()]
+    if posicao > 0:
+        # A primeira linha do bloco pode estar cortada
+        linhas = linhas[1:]
+    return [l.decode('utf-8', errors='replace') for l in linhas[-quantidade:]]
+
+
+class HistoricoConversa:
+    """
+    Buffer circular de interações com gravação imediata em log JSONL.
+    """
+
+    def __init__(self, max_itens: int = 200, arquivo_log: Optional[str] = None):
+        """
+        Args:
+            max_itens: Interações mantidas em memória
+            arquivo_log: Log JSONL somente-anexação (None = só memória).
+                Se já existir, as últimas `max_itens` interações depois da
+                última limpeza são recarregadas.
+        """
+        self.max_itens = max_itens
+        self.arquivo_log = arquivo_log
+        self._itens: deque = deque(maxlen=max_itens)
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._log = None
+        # Último `seq` exportado por arquivo de destino
+        self._exportados: Dict[str, int] = {}
+
+        if arquivo_log and os.path.exists(arquivo_log):
+            self._carregar_log()
+        # Interações recarregadas já estão persistidas: não são reexportadas
+        self._seq_inicial = self._seq
+
+    def _carregar_log(self):
+        try:
+            linhas = _ler_ultimas_linhas(self.arquivo_log, self.max_itens)
+        except OSError as e:
+            logger.warning(f"Não foi possível ler o histórico {self.arquivo_log}: {e}")
+            return
+        for linha in linhas:
+            try:
+                dados = json.loads(linha)
+            except ValueError:
+                continue
+            if 'limpeza' in dados:
+                self._itens.clear()
+                continue
+            self._seq += 1
+            self._itens.append(RegistroConversa(
+                self._seq,
+                dados.get('timestamp', ''),
+                dados.get('pergunta', ''),
+                dados.get('resposta', ''),
+                dados.get('modelo', ''),
+                dados.get('tokens', 0)
+            ))
+
+    def _gravar(self, dados: Dict):
+        if not self.arquivo_log:
+            return
+        try:
+            if self._log is None:
+                pasta = os.path.dirname(self.arquivo_log)
+                if pasta:
+                    os.makedirs(pasta, exist_ok=True)
+                self._log = open(self.arquivo_log, 'a', encoding='utf-8')
+            self._log.write(json.dumps(dados, ensure_ascii=False) + '\n')
+            self._log.flush()
+        except OSError as e:
+            logger.error(f"Erro ao gravar histórico em {self.arquivo_log}: {e}")
+
+    def adicionar(self, pergunta: str, resposta: str, modelo: str, tokens: int = 0) -> RegistroConversa:
+        """
+        Registra uma interação (descarta a mais antiga se o buffer estiver cheio).
+        """
+        with self._lock:
+            self._seq += 1
+            registro = RegistroConversa(
+                self._seq, datetime.now().isoformat(), pergunta, resposta, modelo, tokens
+            )
+            self._itens.append(registro)
+            self._gravar(registro.para_dict())
+        return registro
+
+    def __iter__(self) -> Iterator[RegistroConversa]:
+        with self._lock:
+            return iter(list(self._itens))
+
+    def __len__(self) -> int:
+        return len(self._itens)
+
+    def listar(self) -> List[Dict]:
+        """Interações em memória como lista de dicionários (mais antiga primeiro)"""
+        return [registro.para_dict() for registro in self]
+
+    def limpar(self):
+        """
+        Esvazia o buffer em memória. O log em disco é preservado, com uma
+        marca de limpeza para que recarregá-lo não traga as interações de volta.
+        """
+        with self._lock:
+            self._itens.clear()
+            self._gravar({'limpeza': datetime.now().isoformat()})
+
+    def exportar(self, arquivo: str) -> int:
+        """
+        Anexa a `arquivo` (JSONL) as interações desta sessão ainda não exportadas.
+
+        Returns:
+            Quantidade de interações escritas
+        """
+        with self._lock:
+            ultimo = self._exportados.get(arquivo, self._seq_inicial)
+            novos = [r for r in self._itens if r.seq > ultimo]
+            if self._itens and self._itens[0].seq > ultimo + 1:
+                perdidos = self._itens[0].seq - ultimo - 1
+                logger.warning(
+                    f"{perdidos} interações saíram do buffer antes da exportação "
+                    f"(disponíveis em {self.arquivo_log or 'nenhum log'})"
+                )
+            if novos:
+                with open(arquivo, 'a', encoding='utf-8') as f:
+                    f.writelines(json.dumps(r.para_dict(), ensure_ascii=False) + '\n' for r in novos)
+            self._exportados[arquivo] = self._seq
+        return len(novos)
+
+    def fechar(self):
+        """Fecha o arquivo de log"""
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+
+
+def criar_historico() -> HistoricoConversa:
+    """
+    Cria um histórico configurado pelo .env.
+
+    O log JSONL só é gravado se `APEX_HISTORICO_LOG` indicar o arquivo;
+    sem a variável (ex.: testes e scripts) o histórico fica só em memória.
+    """
+    arquivo_log = os.getenv('APEX_HISTORICO_LOG')
+    return HistoricoConversa(
+        max_itens=int(os.getenv('APEX_HISTORICO_MAX_ITENS', '200')),
+        arquivo_log=arquivo_log or None
+    )
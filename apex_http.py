@@ -0,0 +1,215 @@
+"""apex_http.py - Transporte HTTP compartilhado do APEX
+
+Mantém uma única `requests.Session` por processo com pool de conexões
+keep-alive, retentativas automáticas e timeouts de conexão/leitura
+separados. Todos os módulos que falam com a Perplexity usam este
+transporte, evitando um novo handshake TCP+TLS a cada chamada.
+"""
+
+import os
+import threading
+import logging
+from typing import Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+
+class _ContadorConexoes:
+    """Contadores de requisições e conexões abertas (thread-safe)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requisicoes = 0
+        self.conexoes_abertas = 0
+
+    def nova_conexao(self):
+        with self._lock:
+            self.conexoes_abertas += 1
+
+    def nova_requisicao(self):
+        with self._lock:
+            self.requisicoes += 1
+
+
+def _pool_com_contador(base, contador: _ContadorConexoes):
+    """Cria uma subclasse do pool do urllib3 que conta conexões novas"""
+
+    class _PoolContado(base):
+        def _new_conn(self):
+            contador.nova_conexao()
+            return super()._new_conn()
+
+    _PoolContado.__name__ = f"Contado{base.__name__}"
+    return _PoolContado
+
+
+class _AdaptadorContado(HTTPAdapter):
+    """HTTPAdapter que registra cada conexão TCP aberta pelo pool"""
+
+    def __init__(self, contador: _ContadorConexoes, **kwargs):
+        self._contador = contador
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _pool_com_contador(HTTPConnectionPool, self._contador),
+            'https': _pool_com_contador(HTTPSConnectionPool, self._contador),
+        }
+
+
+class TransporteHTTP:
+    """
+    Sessão HTTP com pool de conexões compartilhada entre os clientes do APEX.
+    """
+
+    def __init__(
+        self,
+        pool_por_host: Optional[int] = None,
+        max_hosts: Optional[int] = None,
+        tentativas: Optional[int] = None,
+        timeout_conexao: Optional[float] = None,
+        timeout_leitura: Optional[float] = None
+    ):
+        """
+        Inicializa o transporte.
+
+        Args:
+            pool_por_host: Conexões keep-alive mantidas por host
+            max_hosts: Quantidade de hosts com pool próprio
+            tentativas: Retentativas em falhas de conexão (429/5xx da API são
+                tratados com backoff pelo apex_rate_limit)
+            timeout_conexao: Timeout (s) para abrir a conexão
+            timeout_leitura: Timeout (s) para ler a resposta
+        """
+        self.pool_por_host = pool_por_host or int(os.getenv('APEX_HTTP_POOL_POR_HOST', '10'))
+        self.max_hosts = max_hosts or int(os.getenv('APEX_HTTP_MAX_HOSTS', '10'))
+        self.tentativas = tentativas if tentativas is not None else int(os.getenv('APEX_HTTP_TENTATIVAS', '2'))
+        self.timeout_conexao = timeout_conexao or float(os.getenv('APEX_HTTP_TIMEOUT_CONEXAO', '5'))
+        self.timeout_leitura = timeout_leitura or float(os.getenv('APEX_HTTP_TIMEOUT_LEITURA', '30'))
+
+        self._contador = _ContadorConexoes()
+        self.sessao = self._criar_sessao()
+
+    def _criar_sessao(self) -> requests.Session:
+        """Monta a sessão com adaptadores de retentativa e pool"""
+        retry = Retry(
+            total=self.tentativas,
+            connect=self.tentativas,
+            read=0,
+            status=0,
+            backoff_factor=0.3,
+            allowed_methods=frozenset(['GET', 'HEAD', 'POST']),
+            raise_on_status=False
+        )
+        adaptador = _AdaptadorContado(
+            self._contador,
+            pool_connections=self.max_hosts,
+            pool_maxsize=self.pool_por_host,
+            max_retries=retry
+        )
+
+        sessao = requests.Session()
+        sessao.mount('https://', adaptador)
+        sessao.mount('http://', adaptador)
+        sessao.hooks['response'].append(lambda r, *a, **kw: self._contador.nova_requisicao())
+        return sessao
+
+    @property
+    def timeout(self) -> Tuple[float, float]:
+        """Tupla (conexão, leitura) no formato aceito pelo requests"""
+        return (self.timeout_conexao, self.timeout_leitura)
+
+    def _timeout(self, timeout) -> Tuple[float, float]:
+        if timeout is None:
+            return self.timeout
+        if isinstance(timeout, (int, float)):
+            return (min(self.timeout_conexao, timeout), timeout)
+        return timeout
+
+    def post(self, url: str, timeout=None, **kwargs) -> requests.Response:
+        """POST reaproveitando conexões do pool"""
+        return self.sessao.post(url, timeout=self._timeout(timeout), **kwargs)
+
+    def get(self, url: str, timeout=None, **kwargs) -> requests.Response:
+        """GET reaproveitando conexões do pool"""
+        return self.sessao.get(url, timeout=self._timeout(timeout), **kwargs)
+
+    def estatisticas(self) -> Dict:
+        """
+        Retorna estatísticas do pool.
+
+        Returns:
+            Dicionário com requisições, conexões abertas e taxa de reuso
+        """
+        requisicoes = self._contador.requisicoes
+        conexoes = self._contador.conexoes_abertas
+        reuso = 1 - conexoes / requisicoes if requisicoes else 0.0
+        return {
+            'requisicoes': requisicoes,
+            'conexoes_abertas': conexoes,
+            'taxa_reuso': round(max(reuso, 0.0), 4),
+            'pool_por_host': self.pool_por_host,
+            'timeout_conexao': self.timeout_conexao,
+            'timeout_leitura': self.timeout_leitura
+        }
+
+    def fechar(self):
+        """Fecha todas as conexões do pool"""
+        self.sessao.close()
+
+
+_transporte: Optional[TransporteHTTP] = None
+_transporte_lock = threading.Lock()
+
+
+def obter_transporte() -> TransporteHTTP:
+    """
+    Retorna o transporte HTTP compartilhado do processo.
+    """
+    global _transporte
+    if _transporte is None:
+        with _transporte_lock:
+            if _transporte is None:
+                _transporte = TransporteHTTP()
+    return _transporte
+
+
+def configurar_transporte(**kwargs) -> TransporteHTTP:
+    """
+    Substitui o transporte compartilhado por um novo com outros parâmetros.
+
+    Args:
+        **kwargs: Mesmos argumentos de TransporteHTTP
+    """
+    global _transporte
+    with _transporte_lock:
+        anterior = _transporte
+        _transporte = TransporteHTTP(**kwargs)
+    if anterior is not None:
+        anterior.fechar()
+    return _transporte
+
+
+def trocar_transporte(transporte: Optional[TransporteHTTP]) -> Optional[TransporteHTTP]:
+    """
+    Instala `transporte` como compartilhado sem fechar o anterior.
+
+    Returns:
+        O transporte anterior (None se ainda não tinha sido criado), para
+        ser reinstalado depois
+    """
+    global _transporte
+    with _transporte_lock:
+        anterior, _transporte = _transporte, transporte
+    return anterior
+
+
+def estatisticas_pool() -> Dict:
+    """Atalho para as estatísticas do transporte compartilhado"""
+    return obter_transporte().estatisticas()
@@ -0,0 +1,196 @@
+"""apex_intent_classifier.py - Classificador de intenções tolerante a erros de transcrição
+
+Frases de exemplo de cada intenção viram vetores TF-IDF de n-gramas de
+caracteres, guardados numa matriz NumPy. Uma frase nova é comparada com
+todos os exemplos por similaridade de cosseno (um produto de matrizes) e
+recebe a intenção do exemplo mais parecido, se a confiança passar do
+limiar e ficar à frente da segunda intenção por uma margem. Antes dos
+n-gramas, cada palavra passa por uma chave fonética (y/i, ç/ss/s, c/qu/k,
+letras dobradas, e/o finais...), então "abri o iutubi" e "youtube" viram a mesma
+grafia; verbos de comando ("abre", "entra") e palavras de pergunta
+("que") não contam, para "entra no facebook" não virar youtube.
+
+Uso:
+    classificador = ClassificadorIntencoes({'youtube': ['abrir o youtube'], ...})
+    classificador.classificar('abri o iutube')          # ('youtube', confiança)
+    classificador.classificar_lote(transcricoes)        # [(rotulo, confiança), ...]
+"""
+
+import math
+import re
+import unicodedata
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+def normalizar(texto: str) -> str:
+    """Minúsculas, sem acentos e sem pontuação, espaços simples"""
+    texto = unicodedata.normalize('NFKD', texto.lower().replace('ç', 's'))
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    texto = ''.join(c if c.isalnum() else ' ' for c in texto)
+    return ' '.join(texto.split())
+
+
+# Palavras que acompanham qualquer intenção (já sem acentos): dizem que é
+# um comando ou uma pergunta, mas não qual
+PALAVRAS_PORTADORAS = frozenset({
+    "abre", "abra", "abri", "abrir", "entra", "entre", "entrar", "bota", "coloca",
+    "quero", "queria", "ver", "sabe", "que", "qual", "quais", "esta", "estao",
+    "agora", "atual", "uma", "pro", "pra", "para", "com",
+})
+
+
+# Regras aplicadas em ordem a cada palavra normalizada: grafias que soam
+# igual (ou que a transcrição troca) viram uma só
+_REGRAS_FONETICAS = [(re.compile(padrao), troca) for padrao, troca in (
+    (r'ph', 'f'),
+    (r'you', 'iu'),
+    (r'y', 'i'),
+    (r'w', 'u'),
+    (r'oo', 'u'),
+    (r'ch(?=r)', 'k'),
+    (r'[cs]h', 'x'),
+    (r'qu(?=[ei])', 'k'),
+    (r'c(?=[ei])', 's'),
+    (r'[cq]', 'k'),
+    (r'g(?=[ei])', 'j'),
+    (r'([ln])h', r'\1i'),
+    (r'z', 's'),
+    (r'(.)\1+', r'\1'),
+    (r'(?<=..)e$', 'i'),
+    (r'(?<=..)o$', 'u'),
+)]
+
+
+def chave_fonetica(palavra: str) -> str:
+    """
+    Grafia "como se fala" de uma palavra já normalizada.
+
+    Exemplos: "youtube" e "iutube" -> "iutubi"; "massa" e "maça" -> "masa";
+    "chrome" e "crome" -> "kromi".
+    """
+    for regra, troca in _REGRAS_FONETICAS:
+        palavra = regra.sub(troca, palavra)
+    return palavra
+
+
+def ngramas(texto: str, tamanhos: Tuple[int, ...] = (3, 4)) -> Counter:
+    """
+    N-gramas de caracteres de cada palavra (com espaço nas bordas).
+
+    Palavras de até 2 letras (artigos, preposições) e as portadoras ficam de
+    fora: aparecem em frases de várias intenções e só aproximam comandos
+    diferentes. As demais entram pela `chave_fonetica`.
+    """
+    contagem: Counter = Counter()
+    for palavra in normalizar(texto).split():
+        if len(palavra) <= 2 or palavra in PALAVRAS_PORTADORAS:
+            continue
+        palavra = f" {chave_fonetica(palavra)} "
+        for n in tamanhos:
+            for i in range(len(palavra) - n + 1):
+                contagem[palavra[i:i + n]] += 1
+    return contagem
+
+
+class ClassificadorIntencoes:
+    """
+    Classificador por vizinho mais próximo sobre TF-IDF de n-gramas.
+    """
+
+    def __init__(self, exemplos: Dict[str, Sequence[str]], limiar: float = 0.55, margem: float = 0.1):
+        """
+        Args:
+            exemplos: Rótulo da intenção -> frases de exemplo
+            limiar: Confiança mínima (cosseno) para aceitar a intenção
+            margem: Vantagem mínima sobre a segunda intenção mais parecida
+        """
+        self.limiar = limiar
+        self.margem = margem
+        self.rotulos: List[str] = []
+        frases: List[str] = []
+        inicios: List[int] = []
+        for rotulo, lista in exemplos.items():
+            if not lista:
+                continue
+            self.rotulos.append(rotulo)
+            inicios.append(len(frases))
+            frases.extend(lista)
+        # Linhas agrupadas por rótulo: o máximo de cada grupo sai com reduceat
+        self._inicios = np.asarray(inicios, dtype=np.intp)
+
+        contagens = [ngramas(f) for f in frases]
+        self._vocabulario: Dict[str, int] = {}
+        documentos: Counter = Counter()
+        for contagem in contagens:
+            for ngrama in contagem:
+                self._vocabulario.setdefault(ngrama, len(self._vocabulario))
+                documentos[ngrama] += 1
+        total = len(frases)
+        self._idf = np.zeros(len(self._vocabulario), dtype=np.float32)
+        for ngrama, coluna in self._vocabulario.items():
+            self._idf[coluna] = math.log((1 + total) / (1 + documentos[ngrama])) + 1
+        self._exemplos = self._matriz(contagens)
+
+    def _matriz(self, contagens: Sequence[Counter]) -> np.ndarray:
+        """
+        Linhas TF-IDF L2-normalizadas.
+
+        N-gramas fora do vocabulário não têm coluna, mas entram na norma
+        (com IDF 1): "que temperatura está" não fica igual a "que horas são"
+        só porque o pouco que as duas dividem é tudo o que o vocabulário vê.
+        """
+        matriz = np.zeros((len(contagens), len(self._vocabulario)), dtype=np.float32)
+        desconhecidos = np.zeros((len(contagens), 1), dtype=np.float32)
+        for linha, contagem in enumerate(contagens):
+            for ngrama, frequencia in contagem.items():
+                coluna = self._vocabulario.get(ngrama)
+                if coluna is not None:
+                    matriz[linha, coluna] = 1 + math.log(frequencia)
+                else:
+                    desconhecidos[linha] += (1 + math.log(frequencia)) ** 2
+        matriz *= self._idf
+        normas = np.sqrt(np.sum(matriz ** 2, axis=1, keepdims=True) + desconhecidos)
+        normas[normas == 0] = 1
+        return matriz / normas
+
+    def pontuar_lote(self, textos: Sequence[str]) -> np.ndarray:
+        """
+        Returns:
+            Matriz (len(textos), len(rotulos)) com a maior similaridade entre
+            cada texto e os exemplos de cada intenção
+        """
+        consultas = self._matriz([ngramas(t) for t in textos])
+        similaridades = consultas @ self._exemplos.T
+        return np.maximum.reduceat(similaridades, self._inicios, axis=1)
+
+    def classificar_lote(self, textos: Sequence[str]) -> List[Tuple[Optional[str], float]]:
+        """
+        Classifica vários textos com um único produto de matrizes.
+
+        Returns:
+            (rótulo ou None se abaixo do limiar ou sem margem sobre a segunda
+            intenção, confiança) para cada texto
+        """
+        if not textos:
+            return []
+        if not self.rotulos:
+            return [(None, 0.0) for _ in textos]
+        pontuacoes = self.pontuar_lote(textos)
+        melhores = pontuacoes.argmax(axis=1)
+        if len(self.rotulos) > 1:
+            segundas = -np.partition(-pontuacoes, 1, axis=1)[:, 1]
+        else:
+            segundas = np.zeros(len(textos), dtype=np.float32)
+        resultado = []
+        for linha, coluna in enumerate(melhores):
+            confianca = float(pontuacoes[linha, coluna])
+            aceita = confianca >= self.limiar and confianca - float(segundas[linha]) >= self.margem
+            resultado.append((self.rotulos[coluna] if aceita else None, round(confianca, 4)))
+        return resultado
+
+    def classificar(self, texto: str) -> Tuple[Optional[str], float]:
+        """(rótulo ou None, confiança) para um texto"""
+        return self.classificar_lote([texto])[0]
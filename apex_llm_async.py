@@ -0,0 +1,179 @@
+"""apex_llm_async.py - Cliente assíncrono (asyncio) para a Perplexity AI
+
+Mesma interface do APEXLLMClient (`gerar_resposta`, `chat_contextualizado`),
+mas com métodos `async`. As chamadas rodam num pool de threads limitado que
+reaproveita o transporte HTTP compartilhado (apex_http), então N prompts em
+paralelo custam ~1 latência em vez da soma das latências.
+
+Exemplo:
+    cliente = AsyncAPEXLLMClient(limite_concorrencia=8)
+    respostas = await cliente.gerar_em_lote(["Resuma X", "Explique Y"])
+"""
+
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from apex_llm_client import APEXLLMClient
+
+
+async def executar_em_lote(
+    aguardaveis: Iterable[Awaitable],
+    limite: int = 8,
+    return_exceptions: bool = False
+) -> List[Any]:
+    """
+    Equivalente a `asyncio.gather`, mas com no máximo `limite` tarefas ativas.
+
+    Args:
+        aguardaveis: Corrotinas/awaitables a executar
+        limite: Máximo de execuções simultâneas
+        return_exceptions: Devolve exceções na lista em vez de propagá-las
+
+    Returns:
+        Resultados na mesma ordem da entrada
+    """
+    semaforo = asyncio.Semaphore(max(1, limite))
+
+    async def _limitado(aguardavel):
+        async with semaforo:
+            return await aguardavel
+
+    return await asyncio.gather(
+        *(_limitado(a) for a in aguardaveis),
+        return_exceptions=return_exceptions
+    )
+
+
+class AsyncAPEXLLMClient:
+    """
+    Cliente asyncio para integração com Perplexity AI.
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        limite_concorrencia: int = 8,
+        cliente: Optional[APEXLLMClient] = None
+    ):
+        """
+        Inicializa o cliente assíncrono.
+
+        Args:
+            api_key: Chave da API da Perplexity (se None, lê do .env)
+            limite_concorrencia: Máximo de chamadas simultâneas à API
+            cliente: APEXLLMClient já configurado (opcional)
+        """
+        self.cliente = cliente or APEXLLMClient(api_key)
+        self.limite_concorrencia = max(1, limite_concorrencia)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.limite_concorrencia,
+            thread_name_prefix='apex-llm'
+        )
+
+    def __getattr__(self, nome):
+        # model, temperature, base_url... vêm do cliente síncrono
+        if nome == 'cliente':
+            raise AttributeError(nome)
+        return getattr(self.cliente, nome)
+
+    async def _executar(self, funcao: Callable, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        # Copia o contexto para a thread: mantém o rótulo de origem da telemetria
+        contexto = contextvars.copy_context()
+        return await loop.run_in_executor(self._executor, partial(contexto.run, funcao, *args, **kwargs))
+
+    async def gerar_resposta(
+        self,
+        prompt: str,
+        sistema: str = None,
+        temperatura: float = None,
+        contexto: Optional[List[str]] = None,
+        ao_token: Optional[Callable[[str], None]] = None
+    ) -> str:
+        """
+        Versão assíncrona de APEXLLMClient.gerar_resposta.
+
+        Tarefas simultâneas com o mesmo prompt compartilham uma única
+        chamada. O callback `ao_token`, se informado, é chamado a partir
+        da thread de trabalho.
+        """
+        executar = partial(
+            self._executar,
+            self.cliente.gerar_resposta, prompt, sistema, temperatura, contexto, ao_token
+        )
+        if ao_token:
+            return await executar()
+        mensagens = self.cliente._montar_mensagens(prompt, None, sistema)
+        chave = self.cliente._chave(mensagens, temperatura or self.cliente.temperature)
+        return await self.cliente.singleflight.executar_async(chave, executar)
+
+    async def chat_contextualizado(
+        self,
+        prompt: str,
+        historico: Optional[List[Dict]] = None,
+        sistema: str = None,
+        ao_token: Optional[Callable[[str], None]] = None,
+        orcamento_tokens: Optional[int] = None
+    ) -> str:
+        """
+        Versão assíncrona de APEXLLMClient.chat_contextualizado.
+        """
+        executar = partial(
+            self._executar,
+            self.cliente.chat_contextualizado, prompt, historico, sistema, ao_token, orcamento_tokens
+        )
+        if ao_token:
+            return await executar()
+        mensagens = self.cliente.contexto.montar(
+            self.cliente._montar_mensagens(prompt, historico, sistema),
+            orcamento_tokens
+        )
+        chave = self.cliente._chave(mensagens, self.cliente.temperature)
+        return await self.cliente.singleflight.executar_async(chave, executar)
+
+    async def gather(
+        self,
+        aguardaveis: Iterable[Awaitable],
+        limite: Optional[int] = None,
+        return_exceptions: bool = False
+    ) -> List[Any]:
+        """
+        Executa várias chamadas (inclusive métodos de tutores) em paralelo.
+
+        Args:
+            aguardaveis: Corrotinas a executar
+            limite: Máximo simultâneo (padrão: limite_concorrencia do cliente)
+            return_exceptions: Devolve exceções na lista em vez de propagá-las
+
+        Returns:
+            Resultados na mesma ordem da entrada
+        """
+        return await executar_em_lote(
+            aguardaveis,
+            limite or self.limite_concorrencia,
+            return_exceptions
+        )
+
+    async def gerar_em_lote(
+        self,
+        prompts: List[str],
+        sistema: str = None,
+        limite: Optional[int] = None
+    ) -> List[str]:
+        """
+        Gera respostas para vários prompts com concorrência limitada.
+
+        Returns:
+            Respostas na mesma ordem dos prompts
+        """
+        return await self.gather(
+            (self.gerar_resposta(prompt, sistema) for prompt in prompts),
+            limite
+        )
+
+    def fechar(self):
+        """Encerra o pool de threads do cliente"""
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,307 @@
+"""apex_llm_cache.py - Cache de respostas do LLM em dois níveis
+
+Nível 1: LRU em memória com TTL (mais rápido, por processo).
+Nível 2: SQLite persistente ao lado do apex_memory.db, com remoção por
+tamanho (as entradas acessadas há mais tempo saem primeiro).
+
+A chave é um hash normalizado de (modelo, mensagens, temperatura,
+max_tokens); o prompt de sistema faz parte das mensagens. Modelos
+`-online` consultam a web e por isso não são cacheados, a menos que uma
+janela de frescor seja configurada.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _normalizar_texto(texto: Any) -> str:
+    return ' '.join(str(texto).split())
+
+
+def chave_cache(
+    modelo: str,
+    mensagens: List[Dict],
+    temperatura: Optional[float],
+    max_tokens: Optional[int],
+    sistema: Optional[str] = None
+) -> str:
+    """
+    Gera a chave de cache de uma requisição.
+
+    Espaços extras e diferenças de caixa no `role` não mudam a chave.
+
+    Args:
+        modelo: Nome do modelo
+        mensagens: Mensagens no formato da API (podem incluir o sistema)
+        temperatura: Temperatura da requisição
+        max_tokens: Limite de tokens da resposta
+        sistema: Prompt de sistema, quando não está em `mensagens`
+
+    Returns:
+        Hash SHA-256 em hexadecimal
+    """
+    normalizado = {
+        'modelo': modelo.strip().lower(),
+        'sistema': _normalizar_texto(sistema) if sistema else None,
+        'mensagens': [
+            [str(m.get('role', '')).strip().lower(), _normalizar_texto(m.get('content', ''))]
+            for m in mensagens
+        ],
+        'temperatura': round(float(temperatura), 3) if temperatura is not None else None,
+        'max_tokens': max_tokens
+    }
+    bruto = json.dumps(normalizado, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(bruto.encode('utf-8')).hexdigest()
+
+
+def _caminho_padrao() -> str:
+    """apex_cache.db no mesmo diretório do banco de memória"""
+    pasta = os.path.dirname(os.getenv('DATABASE_PATH', 'apex_memory.db'))
+    return os.path.join(pasta, 'apex_cache.db')
+
+
+class CacheRespostas:
+    """
+    Cache LRU em memória + SQLite para respostas do LLM.
+    """
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        max_itens_memoria: int = 256,
+        ttl: float = 3600,
+        max_bytes_disco: int = 50 * 1024 * 1024,
+        janela_frescor_online: Optional[float] = None,
+        ativo: bool = True
+    ):
+        """
+        Args:
+            db_path: Arquivo SQLite do nível persistente (None desativa o disco)
+            max_itens_memoria: Entradas mantidas no LRU em memória
+            ttl: Validade (s) de cada entrada
+            max_bytes_disco: Tamanho máximo das respostas guardadas em disco
+            janela_frescor_online: Validade (s) para modelos `-online`;
+                se None, esses modelos nunca são cacheados
+            ativo: Liga/desliga o cache por completo
+        """
+        self.db_path = db_path
+        self.max_itens_memoria = max_itens_memoria
+        self.ttl = ttl
+        self.max_bytes_disco = max_bytes_disco
+        self.janela_frescor_online = janela_frescor_online
+        self.ativo = ativo
+
+        self._memoria: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._lock = threading.RLock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._bytes_disco = 0
+
+        self.contadores = {
+            'hits_memoria': 0,
+            'hits_disco': 0,
+            'misses': 0,
+            'gravacoes': 0,
+            'remocoes_memoria': 0,
+            'remocoes_disco': 0,
+            'expirados': 0,
+            'ignorados_online': 0
+        }
+
+    def _conexao(self) -> Optional[sqlite3.Connection]:
+        """Abre o SQLite no primeiro uso"""
+        if self._conn is None and self.db_path:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS cache_respostas (
+                    chave TEXT PRIMARY KEY,
+                    valor TEXT,
+                    tamanho INTEGER,
+                    expira REAL,
+                    acessado REAL
+                )
+            ''')
+            self._conn.execute(
+                'CREATE INDEX IF NOT EXISTS idx_cache_acessado ON cache_respostas (acessado)'
+            )
+            self._conn.commit()
+            total = self._conn.execute('SELECT COALESCE(SUM(tamanho), 0) FROM cache_respostas').fetchone()[0]
+            self._bytes_disco = total
+        return self._conn
+
+    def usar_cache(self, modelo: str) -> bool:
+        """Indica se requisições deste modelo podem ser cacheadas"""
+        if not self.ativo:
+            return False
+        if '-online' in modelo and self.janela_frescor_online is None:
+            self.contadores['ignorados_online'] += 1
+            return False
+        return True
+
+    def _ttl(self, modelo: str) -> float:
+        if '-online' in modelo and self.janela_frescor_online is not None:
+            return min(self.ttl, self.janela_frescor_online)
+        return self.ttl
+
+    def obter(self, chave: str) -> Optional[Any]:
+        """
+        Busca uma resposta, primeiro em memória e depois em disco.
+
+        Returns:
+            Valor guardado ou None se ausente/expirado
+        """
+        agora = time.time()
+        with self._lock:
+            item = self._memoria.get(chave)
+            if item is not None:
+                expira, valor = item
+                if expira > agora:
+                    self._memoria.move_to_end(chave)
+                    self.contadores['hits_memoria'] += 1
+                    return valor
+                del self._memoria[chave]
+                self.contadores['expirados'] += 1
+
+            conn = self._conexao()
+            if conn is not None:
+                linha = conn.execute(
+                    'SELECT valor, expira FROM cache_respostas WHERE chave = ?', (chave,)
+                ).fetchone()
+                if linha is not None:
+                    if linha[1] > agora:
+                        conn.execute('UPDATE cache_respostas SET acessado = ? WHERE chave = ?', (agora, chave))
+                        conn.commit()
+                        valor = json.loads(linha[0])
+                        self._guardar_memoria(chave, linha[1], valor)
+                        self.contadores['hits_disco'] += 1
+                        return valor
+                    self._remover_disco(chave)
+                    self.contadores['expirados'] += 1
+
+            self.contadores['misses'] += 1
+            return None
+
+    def salvar(self, chave: str, valor: Any, modelo: str = ''):
+        """
+        Guarda uma resposta nos dois níveis.
+
+        Args:
+            chave: Chave gerada por `chave_cache`
+            valor: Resposta (qualquer valor serializável em JSON)
+            modelo: Modelo usado (define o TTL para modelos `-online`)
+        """
+        agora = time.time()
+        expira = agora + self._ttl(modelo)
+        with self._lock:
+            self._guardar_memoria(chave, expira, valor)
+            self.contadores['gravacoes'] += 1
+
+            conn = self._conexao()
+            if conn is None:
+                return
+            serializado = json.dumps(valor, ensure_ascii=False)
+            tamanho = len(serializado.encode('utf-8'))
+            if tamanho > self.max_bytes_disco:
+                return
+            self._remover_disco(chave, commit=False)
+            conn.execute(
+                'INSERT INTO cache_respostas (chave, valor, tamanho, expira, acessado) VALUES (?, ?, ?, ?, ?)',
+                (chave, serializado, tamanho, expira, agora)
+            )
+            self._bytes_disco += tamanho
+            self._liberar_espaco()
+            conn.commit()
+
+    def _guardar_memoria(self, chave: str, expira: float, valor: Any):
+        self._memoria[chave] = (expira, valor)
+        self._memoria.move_to_end(chave)
+        while len(self._memoria) > self.max_itens_memoria:
+            self._memoria.popitem(last=False)
+            self.contadores['remocoes_memoria'] += 1
+
+    def _remover_disco(self, chave: str, commit: bool = True):
+        conn = self._conexao()
+        linha = conn.execute('SELECT tamanho FROM cache_respostas WHERE chave = ?', (chave,)).fetchone()
+        if linha is None:
+            return
+        conn.execute('DELETE FROM cache_respostas WHERE chave = ?', (chave,))
+        self._bytes_disco -= linha[0]
+        if commit:
+            conn.commit()
+
+    def _liberar_espaco(self):
+        """Remove entradas expiradas e depois as menos acessadas até caber"""
+        if self._bytes_disco <= self.max_bytes_disco:
+            return
+        conn = self._conexao()
+        conn.execute('DELETE FROM cache_respostas WHERE expira <= ?', (time.time(),))
+        removidas = 0
+        self._bytes_disco = conn.execute('SELECT COALESCE(SUM(tamanho), 0) FROM cache_respostas').fetchone()[0]
+        cursor = conn.execute('SELECT chave, tamanho FROM cache_respostas ORDER BY acessado')
+        vitimas = []
+        while self._bytes_disco > self.max_bytes_disco:
+            linha = cursor.fetchone()
+            if linha is None:
+                break
+            vitimas.append((linha[0],))
+            self._bytes_disco -= linha[1]
+            removidas += 1
+        cursor.close()
+        conn.executemany('DELETE FROM cache_respostas WHERE chave = ?', vitimas)
+        self.contadores['remocoes_disco'] += removidas
+
+    def limpar(self):
+        """Remove todas as entradas dos dois níveis"""
+        with self._lock:
+            self._memoria.clear()
+            conn = self._conexao()
+            if conn is not None:
+                conn.execute('DELETE FROM cache_respostas')
+                conn.commit()
+                self._bytes_disco = 0
+
+    def estatisticas(self) -> Dict:
+        """
+        Retorna contadores de uso para dimensionar o cache.
+        """
+        with self._lock:
+            hits = self.contadores['hits_memoria'] + self.contadores['hits_disco']
+            consultas = hits + self.contadores['misses']
+            return {
+                **self.contadores,
+                'taxa_acerto': round(hits / consultas, 4) if consultas else 0.0,
+                'itens_memoria': len(self._memoria),
+                'bytes_disco': self._bytes_disco
+            }
+
+
+_cache: Optional[CacheRespostas] = None
+_cache_lock = threading.Lock()
+
+
+def obter_cache() -> CacheRespostas:
+    """
+    Retorna o cache compartilhado do processo, configurado pelo .env.
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                frescor = os.getenv('APEX_CACHE_FRESCOR_ONLINE')
+                _cache = CacheRespostas(
+                    db_path=_caminho_padrao(),
+                    max_itens_memoria=int(os.getenv('APEX_CACHE_MAX_ITENS', '256')),
+                    ttl=float(os.getenv('CACHE_TTL', '3600')),
+                    max_bytes_disco=int(float(os.getenv('APEX_CACHE_MAX_MB', '50')) * 1024 * 1024),
+                    janela_frescor_online=float(frescor) if frescor else None,
+                    ativo=os.getenv('APEX_CACHE_ATIVO', 'true').lower() in ('1', 'true', 'sim', 'yes')
+                )
+    return _cache
@@ -13,29 +13,128 @@ Fun action principais:
 
 import os
 import json
+import time
 from dotenv import load_dotenv
 import requests
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Callable, Iterator
+
+from apex_http import obter_transporte
+from apex_rate_limit import obter_controle
+from apex_llm_cache import CacheRespostas, chave_cache, obter_cache
+from apex_singleflight import SingleFlight
+from apex_context_window import MontadorContexto
+from apex_telemetry import metricas, origem_atual
 
 # Carregar variáveis de ambiente
 load_dotenv()
 
+
+class RespostaStreaming:
+    """
+    Iterador sobre os deltas de uma resposta em streaming (SSE).
+    
+    Cada iteração devolve o próximo trecho de texto assim que ele chega.
+    Ao final, `texto` contém a resposta completa e `uso` as estatísticas
+    de tokens enviadas pela API (o gerador também retorna `uso`).
+    """
+    
+    def __init__(
+        self,
+        response: requests.Response,
+        inicio: Optional[float] = None,
+        modelo: str = ''
+    ):
+        self._response = response
+        # Instante do envio da requisição (perf_counter), base do tempo até o 1º token
+        self._inicio = inicio if inicio is not None else time.perf_counter()
+        self._modelo = modelo
+        self._origem = origem_atual('apex_llm_client')
+        self.texto = ""
+        self.uso: Dict[str, Any] = {}
+        self.tempo_primeiro_token: Optional[float] = None
+        self.tempo_total: Optional[float] = None
+    
+    def _eventos(self) -> Iterator[Dict]:
+        """Separa o corpo SSE em eventos JSON, linha a linha"""
+        dados = []
+        for linha in self._response.iter_lines(chunk_size=None):
+            linha = linha.decode('utf-8') if isinstance(linha, bytes) else linha
+            if linha.startswith('data:'):
+                dados.append(linha[5:].strip())
+                continue
+            if linha or not dados:
+                continue
+            evento = '\n'.join(dados)
+            dados = []
+            if evento == '[DONE]':
+                return
+            yield json.loads(evento)
+        if dados and dados[0] != '[DONE]':
+            yield json.loads('\n'.join(dados))
+    
+    def __iter__(self) -> Iterator[str]:
+        partes = []
+        status = 'erro_stream'
+        try:
+            for evento in self._eventos():
+                if evento.get('usage'):
+                    self.uso = evento['usage']
+                for escolha in evento.get('choices', []):
+                    delta = (escolha.get('delta') or {}).get('content')
+                    if not delta:
+                        continue
+                    if self.tempo_primeiro_token is None:
+                        self.tempo_primeiro_token = time.perf_counter() - self._inicio
+                    partes.append(delta)
+                    yield delta
+            status = self._response.status_code
+        finally:
+            self._response.close()
+            self.texto = ''.join(partes)
+            self.tempo_total = time.perf_counter() - self._inicio
+            metricas.registrar(
+                self._origem, self._modelo, status, self.tempo_total, self.tempo_primeiro_token,
+                self.uso.get('prompt_tokens'), self.uso.get('completion_tokens')
+            )
+        return self.uso
+    
+    def ler_tudo(self, ao_token: Optional[Callable[[str], None]] = None) -> str:
+        """
+        Consome o streaming inteiro e retorna o texto completo.
+        
+        Args:
+            ao_token: Callback chamado com cada delta recebido
+        """
+        for delta in self:
+            if ao_token:
+                ao_token(delta)
+        return self.texto
+
+
 class APEXLLMClient:
     """
     Cliente para integra action com Perplexity AI.
     """
     
-    def __init__(self, api_key: Optional[str] = None):
+    # Compartilhado entre instâncias: requisições idênticas simultâneas
+    # (várias threads do Flask, tutores) viram uma única chamada à API
+    singleflight = SingleFlight()
+    
+    def __init__(self, api_key: Optional[str] = None, cache: Optional[CacheRespostas] = None):
         """
         Inicializa o cliente LLM.
         
         Args:
             api_key: Chave da API da Perplexity (se None, lê do .env)
+            cache: Cache de respostas (se None, usa o cache compartilhado)
         """
         self.api_key = api_key or os.getenv('PERPLEXITY_API_KEY')
         self.base_url = "https://api.perplexity.ai/openai/v1"
         self.model = "pplx-7b-online"
         self.temperature = 0.7
+        self.max_tokens = 2048
+        self.cache = cache if cache is not None else obter_cache()
+        self.contexto = MontadorContexto(int(os.getenv('APEX_ORCAMENTO_CONTEXTO', '3000')))
         
         if not self.api_key:
             raise ValueError("PERPLEXITY_API_KEY não definida no .env")
@@ -45,7 +144,8 @@ class APEXLLMClient:
         prompt: str,
         sistema: str = None,
         temperatura: float = None,
-        contexto: Optional[List[str]] = None
+        contexto: Optional[List[str]] = None,
+        ao_token: Optional[Callable[[str], None]] = None
     ) -> str:
         """
         Gera uma resposta usando a API da Perplexity.
@@ -55,6 +155,7 @@ class APEXLLMClient:
             sistema: Instru action do sistema (role='system')
             temperatura: Controla a criatividade (0-1)
             contexto: Lista de contextos anteriores para referência
+            ao_token: Se informado, usa streaming e chama o callback a cada delta
             
         Returns:
             Resposta gerada pelo modelo
@@ -69,23 +170,7 @@ class APEXLLMClient:
         messages.append({"role": "user", "content": prompt})
         
         try:
-            response = requests.post(
-                f"{self.base_url}/chat/completions",
-                headers={"Authorization": f"Bearer {self.api_key}"},
-                json={
-                    "model": self.model,
-                    "messages": messages,
-                    "temperature": temperatura,
-                    "max_tokens": 2048
-                },
-                timeout=30
-            )
-            
-            response.raise_for_status()
-            data = response.json()
-            
-            return data['choices'][0]['message']['content']
-        
+            return self._completar(messages, temperatura, ao_token)
         except requests.exceptions.RequestException as e:
             return f"Erro ao conectar com Perplexity: {str(e)}"
     
@@ -93,19 +178,68 @@ class APEXLLMClient:
         self,
         prompt: str,
         historico: Optional[List[Dict]] = None,
-        sistema: str = None
+        sistema: str = None,
+        ao_token: Optional[Callable[[str], None]] = None,
+        orcamento_tokens: Optional[int] = None
     ) -> str:
         """
         Gera uma resposta com contexto do histórico de conversa action.
         
+        O histórico é cortado para caber no orçamento de tokens de
+        `self.contexto` (mensagens mais recentes primeiro).
+        
         Args:
             prompt: Mensagem atual do usuário
             historico: List de mensagens anteriores
             sistema: Instru action do sistema
+            ao_token: Se informado, usa streaming e chama o callback a cada delta
+            orcamento_tokens: Sobrescreve o orçamento de tokens do prompt
             
         Returns:
             Resposta contextualizada
         """
+        messages = self.contexto.montar(
+            self._montar_mensagens(prompt, historico, sistema),
+            orcamento_tokens
+        )
+        
+        try:
+            return self._completar(messages, self.temperature, ao_token)
+        except requests.exceptions.RequestException as e:
+            return f"Erro: {str(e)}"
+    
+    def processar_com_streaming(
+        self,
+        prompt: str,
+        sistema: str = None,
+        temperatura: float = None,
+        historico: Optional[List[Dict]] = None
+    ) -> RespostaStreaming:
+        """
+        Gera uma resposta em streaming, entregando os tokens conforme chegam.
+        
+        Args:
+            prompt: Pergunta ou instru action do usuário
+            sistema: Instru action do sistema
+            temperatura: Controla a criatividade (0-1)
+            historico: List de mensagens anteriores
+            
+        Returns:
+            Iterador de deltas; após consumido expõe `texto` e `uso`
+            
+        Raises:
+            requests.exceptions.RequestException: Em falhas de rede ou HTTP
+        """
+        messages = self._montar_mensagens(prompt, historico, sistema)
+        return self._enviar_streaming(messages, temperatura or self.temperature)
+    
+    def _montar_mensagens(
+        self,
+        prompt: str,
+        historico: Optional[List[Dict]],
+        sistema: Optional[str]
+    ) -> List[Dict]:
+        """Monta a lista de mensagens no formato da API"""
         messages = []
         
         if sistema:
@@ -115,27 +249,134 @@ class APEXLLMClient:
             messages.extend(historico)
         
         messages.append({"role": "user", "content": prompt})
+        return messages
+    
+    def _completar(
+        self,
+        messages: List[Dict],
+        temperatura: float,
+        ao_token: Optional[Callable[[str], None]] = None
+    ) -> str:
+        """
+        Obtém a resposta do cache ou da API (em streaming se houver `ao_token`).
+        
+        Raises:
+            requests.exceptions.RequestException: Em falhas de rede ou HTTP
+        """
+        chave = self._chave(messages, temperatura)
+        usar_cache = self.cache is not None and self.cache.usar_cache(self.model)
+        if usar_cache:
+            em_cache = self.cache.obter(chave)
+            if em_cache is not None:
+                if ao_token:
+                    ao_token(em_cache)
+                return em_cache
+        
+        executou = False
         
+        def _chamar() -> str:
+            nonlocal executou
+            executou = True
+            if ao_token:
+                texto = self._enviar_streaming(messages, temperatura).ler_tudo(ao_token)
+            else:
+                texto = self._enviar(messages, temperatura)
+            if usar_cache:
+                self.cache.salvar(chave, texto, self.model)
+            return texto
+        
+        texto = self.singleflight.executar(chave, _chamar)
+        if ao_token and not executou:
+            # Resultado de outra thread: entrega o texto completo de uma vez
+            ao_token(texto)
+        return texto
+    
+    def _chave(self, messages: List[Dict], temperatura: float) -> str:
+        """Chave que identifica a requisição (cache e single-flight)"""
+        return chave_cache(self.model, messages, temperatura, self.max_tokens)
+    
+    def _enviar(self, messages: List[Dict], temperatura: float) -> str:
+        """
+        Envia as mensagens pelo transporte HTTP compartilhado.
+        
+        Raises:
+            requests.exceptions.RequestException: Em falhas de rede ou HTTP
+        """
+        controle = obter_controle()
+        estimados = self._estimar_tokens(messages)
+        inicio = time.perf_counter()
+        status, uso = 'erro_rede', {}
         try:
-            response = requests.post(
-                f"{self.base_url}/chat/completions",
-                headers={"Authorization": f"Bearer {self.api_key}"},
-                json={
-                    "model": self.model,
-                    "messages": messages,
-                    "temperature": self.temperature,
-                    "max_tokens": 2048
-                },
-                timeout=30
+            response = controle.executar(
+                lambda: obter_transporte().post(
+                    f"{self.base_url}/chat/completions",
+                    headers={"Authorization": f"Bearer {self.api_key}"},
+                    json={
+                        "model": self.model,
+                        "messages": messages,
+                        "temperature": temperatura,
+                        "max_tokens": self.max_tokens
+                    }
+                ),
+                estimados
             )
+            status = response.status_code
             
             response.raise_for_status()
             data = response.json()
+            uso = data.get('usage') or {}
+            controle.registrar_uso(uso.get('total_tokens'), estimados)
             
             return data['choices'][0]['message']['content']
+        finally:
+            metricas.registrar(
+                'apex_llm_client', self.model, status, time.perf_counter() - inicio,
+                None, uso.get('prompt_tokens'), uso.get('completion_tokens')
+            )
+    
+    def _estimar_tokens(self, messages: List[Dict]) -> int:
+        """Tokens esperados da chamada (prompt + teto da resposta), para o limite por minuto"""
+        return sum(self.contexto.contar(m) for m in messages) + self.max_tokens
+    
+    def _enviar_streaming(self, messages: List[Dict], temperatura: float) -> RespostaStreaming:
+        """
+        Abre uma requisição com `stream: true` e devolve o iterador SSE.
         
-        except requests.exceptions.RequestException as e:
-            return f"Erro: {str(e)}"
+        Raises:
+            requests.exceptions.RequestException: Em falhas de rede ou HTTP
+        """
+        inicio = time.perf_counter()
+        try:
+            response = obter_controle().executar(
+                lambda: obter_transporte().post(
+                    f"{self.base_url}/chat/completions",
+                    headers={
+                        "Authorization": f"Bearer {self.api_key}",
+                        "Accept": "text/event-stream"
+                    },
+                    json={
+                        "model": self.model,
+                        "messages": messages,
+                        "temperature": temperatura,
+                        "max_tokens": self.max_tokens,
+                        "stream": True
+                    },
+                    stream=True
+                ),
+                self._estimar_tokens(messages)
+            )
+        except requests.exceptions.RequestException:
+            metricas.registrar('apex_llm_client', self.model, 'erro_rede', time.perf_counter() - inicio)
+            raise
+        
+        try:
+            response.raise_for_status()
+        except requests.exceptions.RequestException:
+            response.close()
+            metricas.registrar('apex_llm_client', self.model, response.status_code, time.perf_counter() - inicio)
+            raise
+        
+        return RespostaStreaming(response, inicio, self.model)
 
 # Função auxiliar para uso direto
 def gerar_resposta_simples(prompt: str, api_key: Optional[str] = None) -> str:
@@ -0,0 +1,342 @@
+"""apex_memory_retention.py - Retenção, arquivamento e manutenção do apex_memory.db
+
+A tabela `conversa` fica só com as conversas recentes. As mais antigas que
+`dias_retencao` (preservando sempre as `manter_minimo` últimas) vão em blocos
+para `conversa_arquivo`, como JSON comprimido com zlib; opcionalmente cada
+bloco vira uma conversa-resumo (fonte 'resumo') gerada pelo LLM. Nada se
+perde: `ler_arquivo` devolve as conversas arquivadas.
+
+A manutenção converte o banco para auto_vacuum incremental (uma vez), libera
+páginas vazias, atualiza as estatísticas do planejador (ANALYZE limitado),
+otimiza o índice FTS e trunca o WAL. `iniciar()` executa tudo a cada
+`intervalo` segundos numa thread em segundo plano.
+
+Uso:
+    memoria = ContextMemory()
+    retencao = criar_retencao(memoria)
+    retencao.iniciar()
+    ...
+    print(retencao.estatisticas())
+"""
+
+import os
+import json
+import zlib
+import time
+import sqlite3
+import threading
+import logging
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterator, List, Optional
+
+from apex_context_memory import ContextMemory
+from apex_telemetry import origem
+
+logger = logging.getLogger(__name__)
+
+FONTE_RESUMO = 'resumo'
+
+SISTEMA_RESUMO = (
+    "Resuma em português, em até 8 tópicos curtos, os assuntos, fatos e "
+    "preferências do usuário presentes nas conversas abaixo. Não invente nada."
+)
+
+
+def resumidor_llm(llm_client, max_caracteres: int = 12000) -> Callable[[List[Dict]], Optional[str]]:
+    """
+    Cria um resumidor de blocos de conversa que usa o LLM.
+
+    Args:
+        llm_client: APEXLLMClient (usa `gerar_resposta`)
+        max_caracteres: Tamanho máximo do texto enviado por bloco
+    """
+    def _resumir(conversas: List[Dict]) -> Optional[str]:
+        linhas = []
+        total = 0
+        for c in conversas:
+            linha = f"Usuário: {c['pergunta']}\nAPEX: {c['resposta']}"
+            total += len(linha)
+            if total > max_caracteres:
+                break
+            linhas.append(linha)
+        with origem('apex_memory_retention'):
+            resumo = llm_client.gerar_resposta('\n\n'.join(linhas), sistema=SISTEMA_RESUMO, temperatura=0.2)
+        # gerar_resposta devolve a mensagem de erro como texto
+        if not resumo or resumo.startswith('Erro'):
+            logger.warning(f"Resumo do bloco não gerado: {resumo}")
+            return None
+        return resumo
+
+    return _resumir
+
+
+class RetencaoMemoria:
+    """
+    Política de retenção e manutenção de um ContextMemory.
+    """
+
+    def __init__(
+        self,
+        memoria: ContextMemory,
+        dias_retencao: float = 90,
+        manter_minimo: int = 500,
+        tamanho_bloco: int = 500,
+        resumidor: Optional[Callable[[List[Dict]], Optional[str]]] = None,
+        intervalo: float = 3600
+    ):
+        """
+        Args:
+            memoria: Memória cujo banco será mantido
+            dias_retencao: Idade a partir da qual a conversa é arquivada
+            manter_minimo: Conversas mais recentes de cada sessão que nunca
+                são arquivadas
+            tamanho_bloco: Conversas por linha de `conversa_arquivo`
+            resumidor: Função (conversas do bloco) -> resumo ou None; sem ela
+                não são criadas conversas-resumo
+            intervalo: Segundos entre execuções agendadas
+        """
+        self.memoria = memoria
+        self.dias_retencao = dias_retencao
+        self.manter_minimo = manter_minimo
+        self.tamanho_bloco = tamanho_bloco
+        self.resumidor = resumidor
+        self.intervalo = intervalo
+
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._ultima: Dict = {}
+        self._inicializar_tabela()
+
+    def _inicializar_tabela(self):
+        conn = self.memoria._conexao()
+        with conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS conversa_arquivo (
+                    id INTEGER PRIMARY KEY,
+                    primeiro_id INTEGER,
+                    ultimo_id INTEGER,
+                    inicio TEXT,
+                    fim TEXT,
+                    quantidade INTEGER,
+                    dados BLOB,
+                    resumo TEXT,
+                    arquivado TEXT,
+                    sessao TEXT
+                )
+            ''')
+            colunas = [linha[1] for linha in conn.execute('PRAGMA table_info(conversa_arquivo)')]
+            if 'sessao' not in colunas:
+                conn.execute('ALTER TABLE conversa_arquivo ADD COLUMN sessao TEXT')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_arquivo_fim ON conversa_arquivo (fim)')
+
+    def arquivar(self, agora: Optional[datetime] = None) -> int:
+        """
+        Move as conversas vencidas para `conversa_arquivo`.
+
+        Cada sessão é tratada à parte: preserva as `manter_minimo` conversas
+        mais recentes dela e seus blocos (e resumos) não misturam sessões.
+
+        Returns:
+            Quantidade de conversas arquivadas
+        """
+        agora = agora or datetime.now()
+        limite = (agora - timedelta(days=self.dias_retencao)).isoformat()
+        self.memoria.descarregar()
+        conn = self.memoria._conexao()
+        sessoes = [linha[0] for linha in conn.execute(
+            'SELECT DISTINCT sessao FROM conversa WHERE timestamp < ?', (limite,)
+        )]
+        arquivadas = sum(self._arquivar_sessao(conn, sessao, limite, agora) for sessao in sessoes)
+        if arquivadas:
+            logger.info(f"{arquivadas} conversas arquivadas em {self.memoria.db_path}")
+        return arquivadas
+
+    def _arquivar_sessao(self, conn: sqlite3.Connection, sessao: str, limite: str, agora: datetime) -> int:
+        colunas = ['id', 'timestamp', 'pergunta', 'resposta', 'fonte', 'tokens', 'sessao']
+        arquivadas = 0
+        while True:
+            # A posição de corte é recalculada a cada bloco: resumos novos
+            # entram no topo e não devem empurrar conversas para o arquivo
+            corte = conn.execute(
+                'SELECT id FROM conversa WHERE sessao = ? ORDER BY id DESC LIMIT 1 OFFSET ?',
+                (sessao, self.manter_minimo)
+            ).fetchone()
+            if corte is None:
+                break
+            linhas = conn.execute(f'''
+                SELECT {', '.join(colunas)} FROM conversa
+                WHERE sessao = ? AND id <= ? AND timestamp < ? AND fonte IS NOT ?
+                ORDER BY id LIMIT ?
+            ''', (sessao, corte[0], limite, FONTE_RESUMO, self.tamanho_bloco)).fetchall()
+            if not linhas:
+                break
+
+            conversas = [dict(zip(colunas, linha)) for linha in linhas]
+            resumo = None
+            if self.resumidor is not None:
+                try:
+                    resumo = self.resumidor(conversas)
+                except Exception as e:
+                    logger.error(f"Erro ao resumir conversas arquivadas: {e}")
+
+            dados = zlib.compress(json.dumps(conversas, ensure_ascii=False).encode('utf-8'), 6)
+            with conn:
+                conn.execute('''
+                    INSERT INTO conversa_arquivo
+                        (primeiro_id, ultimo_id, inicio, fim, quantidade, dados, resumo, arquivado, sessao)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                    conversas[0]['id'], conversas[-1]['id'], conversas[0]['timestamp'],
+                    conversas[-1]['timestamp'], len(conversas), dados, resumo, agora.isoformat(), sessao
+                ))
+                conn.executemany('DELETE FROM conversa WHERE id = ?', [(c['id'],) for c in conversas])
+            self.memoria._esquecer_vetores([c['id'] for c in conversas])
+            if resumo:
+                # Pelo caminho normal de gravação, para entrar também no índice vetorial
+                titulo = f"Resumo das conversas de {conversas[0]['timestamp'][:10]} a {conversas[-1]['timestamp'][:10]}"
+                self.memoria._gravar_conversas([
+                    (conversas[-1]['timestamp'], titulo, resumo, FONTE_RESUMO, 0, sessao)
+                ])
+            arquivadas += len(conversas)
+        return arquivadas
+
+    def ler_arquivo(
+        self,
+        inicio: Optional[str] = None,
+        fim: Optional[str] = None,
+        sessao: Optional[str] = None
+    ) -> Iterator[Dict]:
+        """
+        Conversas arquivadas, em ordem, opcionalmente entre dois timestamps
+        ISO e de uma única sessão.
+        """
+        filtros, parametros = [], []
+        if sessao is not None:
+            filtros.append('sessao = ?')
+            parametros.append(sessao)
+        if inicio is not None:
+            filtros.append('fim >= ?')
+            parametros.append(inicio)
+        if fim is not None:
+            filtros.append('inicio <= ?')
+            parametros.append(fim)
+        onde = f"WHERE {' AND '.join(filtros)}" if filtros else ''
+        cursor = self.memoria._conexao().execute(
+            f'SELECT dados FROM conversa_arquivo {onde} ORDER BY primeiro_id', parametros
+        )
+        for (dados,) in cursor:
+            for conversa in json.loads(zlib.decompress(dados).decode('utf-8')):
+                if inicio is not None and conversa['timestamp'] < inicio:
+                    continue
+                if fim is not None and conversa['timestamp'] > fim:
+                    continue
+                yield conversa
+
+    def manutencao(self, paginas: Optional[int] = None):
+        """
+        Libera páginas vazias, atualiza estatísticas e trunca o WAL.
+
+        Args:
+            paginas: Máximo de páginas liberadas por execução (None = todas)
+        """
+        conn = self.memoria._conexao()
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+            # Só tem efeito após um VACUUM completo, feito uma única vez
+            conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            conn.execute('VACUUM')
+        conn.execute(f'PRAGMA incremental_vacuum({int(paginas) if paginas else 0})').fetchall()
+        if self.memoria._fts:
+            with conn:
+                conn.execute("INSERT INTO conversa_fts (conversa_fts) VALUES ('optimize')")
+        # ANALYZE amostrado: custo limitado mesmo com tabelas grandes
+        conn.execute('PRAGMA analysis_limit = 1000')
+        conn.execute('ANALYZE')
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchall()
+
+    def executar(self) -> Dict:
+        """Arquiva e faz a manutenção; retorna o resumo da execução"""
+        with self._lock:
+            inicio = time.perf_counter()
+            arquivadas = self.arquivar()
+            self.manutencao()
+            self._ultima = {
+                'ultima_execucao': datetime.now().isoformat(),
+                'duracao_s': round(time.perf_counter() - inicio, 4),
+                'arquivadas_ultima': arquivadas
+            }
+            return dict(self._ultima)
+
+    def _loop(self):
+        while not self._parar.wait(self.intervalo):
+            try:
+                self.executar()
+            except sqlite3.Error as e:
+                logger.error(f"Erro na manutenção da memória: {e}")
+
+    def iniciar(self):
+        """Agenda `executar` a cada `intervalo` segundos em segundo plano"""
+        if self._thread is None:
+            self._parar.clear()
+            self._thread = threading.Thread(target=self._loop, name='apex-retencao', daemon=True)
+            self._thread.start()
+
+    def parar(self):
+        """Interrompe o agendamento"""
+        self._parar.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+            self._thread = None
+
+    def estatisticas(self) -> Dict:
+        """Tamanho do banco e contagem de linhas quente/arquivo"""
+        self.memoria.descarregar()
+        conn = self.memoria._conexao()
+        tamanho_pagina = conn.execute('PRAGMA page_size').fetchone()[0]
+        paginas = conn.execute('PRAGMA page_count').fetchone()[0]
+        livres = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        conversas, resumos = conn.execute(
+            'SELECT COUNT(*), COALESCE(SUM(fonte = ?), 0) FROM conversa', (FONTE_RESUMO,)
+        ).fetchone()
+        blocos, arquivadas, bytes_arquivo = conn.execute(
+            'SELECT COUNT(*), COALESCE(SUM(quantidade), 0), COALESCE(SUM(LENGTH(dados)), 0) FROM conversa_arquivo'
+        ).fetchone()
+        wal = self.memoria.db_path + '-wal'
+        return {
+            'tamanho_bytes': tamanho_pagina * paginas,
+            'livres_bytes': tamanho_pagina * livres,
+            'wal_bytes': os.path.getsize(wal) if os.path.exists(wal) else 0,
+            'conversas': conversas,
+            'resumos': resumos,
+            'blocos_arquivo': blocos,
+            'conversas_arquivadas': arquivadas,
+            'arquivo_bytes': bytes_arquivo,
+            **self._ultima
+        }
+
+    def exportar_prometheus(self) -> str:
+        """`estatisticas()` como gauges no formato de texto do Prometheus"""
+        dados = self.estatisticas()
+        linhas = []
+        for chave in ('tamanho_bytes', 'livres_bytes', 'wal_bytes', 'conversas', 'resumos',
+                      'blocos_arquivo', 'conversas_arquivadas', 'arquivo_bytes'):
+            linhas.append(f"# TYPE apex_memoria_{chave} gauge")
+            linhas.append(f"apex_memoria_{chave} {dados[chave]}")
+        return '\n'.join(linhas) + '\n'
+
+
+def criar_retencao(memoria: ContextMemory, llm_client=None) -> RetencaoMemoria:
+    """
+    Cria a política de retenção configurada pelo .env.
+
+    Os resumos pelo LLM só são gerados com APEX_MEMORIA_RESUMOS=true e um
+    `llm_client`.
+    """
+    resumos = os.getenv('APEX_MEMORIA_RESUMOS', 'false').lower() == 'true'
+    return RetencaoMemoria(
+        memoria,
+        dias_retencao=float(os.getenv('APEX_MEMORIA_RETENCAO_DIAS', '90')),
+        manter_minimo=int(os.getenv('APEX_MEMORIA_MANTER_MINIMO', '500')),
+        resumidor=resumidor_llm(llm_client) if resumos and llm_client is not None else None,
+        intervalo=float(os.getenv('APEX_MEMORIA_MANUTENCAO_INTERVALO', '3600'))
+    )
@@ -0,0 +1,205 @@
+"""apex_mock_perplexity.py - Servidor local que imita a API da Perplexity
+
+Usado pelos benchmarks e testes para medir o stack de clientes sem rede e
+sem gastar tokens. Responde em qualquer caminho terminado em
+`/chat/completions` (cobre `api.perplexity.ai/chat/completions` e
+`/openai/v1/chat/completions`), com ou sem streaming SSE.
+
+Exemplo:
+    with ServidorMockPerplexity(latencia_ms=80, taxa_429=0.05) as mock:
+        cliente = APEXLLMClient('chave')
+        cliente.base_url = mock.url_base
+"""
+
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+
+class _ManipuladorMock(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _responder_json(self, status: int, corpo: Dict, headers: Optional[Dict] = None):
+        dados = json.dumps(corpo).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(dados)))
+        for chave, valor in (headers or {}).items():
+            self.send_header(chave, valor)
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def do_POST(self):
+        mock: 'ServidorMockPerplexity' = self.server.mock
+        tamanho = int(self.headers.get('Content-Length') or 0)
+        payload = json.loads(self.rfile.read(tamanho) or b'{}')
+
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._responder_json(404, {'error': 'not found'})
+            return
+
+        mock._contar('requisicoes')
+        sorteio = mock._aleatorio()
+        if sorteio < mock.taxa_429:
+            mock._contar('respostas_429')
+            self._responder_json(429, {'error': 'rate limited'}, {'Retry-After': str(mock.retry_after)})
+            return
+        if sorteio < mock.taxa_429 + mock.taxa_erro:
+            mock._contar('respostas_500')
+            self._responder_json(500, {'error': 'internal error'})
+            return
+
+        mensagens = payload.get('messages', [])
+        tokens_prompt = sum(len(str(m.get('content', '')).split()) for m in mensagens)
+        palavras = [f"token{i}" for i in range(mock.tokens_resposta)]
+        uso = {
+            'prompt_tokens': tokens_prompt,
+            'completion_tokens': len(palavras),
+            'total_tokens': tokens_prompt + len(palavras)
+        }
+
+        time.sleep(mock._latencia())
+
+        if payload.get('stream'):
+            self._responder_streaming(mock, palavras, uso)
+        else:
+            mock._contar('respostas_200')
+            self._responder_json(200, {
+                'id': 'mock',
+                'model': payload.get('model'),
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': ' '.join(palavras)}}],
+                'usage': uso
+            })
+
+    def _responder_streaming(self, mock: 'ServidorMockPerplexity', palavras, uso):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        def _enviar(texto: str):
+            dados = texto.encode('utf-8')
+            self.wfile.write(f"{len(dados):X}\r\n".encode() + dados + b"\r\n")
+            self.wfile.flush()
+
+        for i, palavra in enumerate(palavras):
+            delta = palavra if i == 0 else ' ' + palavra
+            _enviar(f"data: {json.dumps({'choices': [{'index': 0, 'delta': {'content': delta}}]})}\n\n")
+            if mock.intervalo_token_ms:
+                time.sleep(mock.intervalo_token_ms / 1000.0)
+        _enviar(f"data: {json.dumps({'choices': [{'index': 0, 'delta': {}}], 'usage': uso})}\n\n")
+        _enviar("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+        mock._contar('respostas_200')
+
+
+class _ServidorHTTP(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clientes fechando conexões keep-alive ociosas não são erro do mock
+        pass
+
+
+class ServidorMockPerplexity:
+    """
+    Stand-in local de `api.perplexity.ai` com latência e falhas configuráveis.
+    """
+
+    def __init__(
+        self,
+        latencia_ms: float = 50,
+        jitter_ms: float = 10,
+        tokens_resposta: int = 32,
+        intervalo_token_ms: float = 2,
+        taxa_erro: float = 0.0,
+        taxa_429: float = 0.0,
+        retry_after: float = 0.1,
+        porta: int = 0,
+        semente: Optional[int] = None
+    ):
+        """
+        Args:
+            latencia_ms: Latência média até o primeiro byte
+            jitter_ms: Variação uniforme (±) da latência
+            tokens_resposta: Tokens (palavras) gerados por resposta
+            intervalo_token_ms: Intervalo entre tokens no modo streaming
+            taxa_erro: Fração de requisições que respondem 500
+            taxa_429: Fração de requisições que respondem 429
+            retry_after: Valor (s) do cabeçalho Retry-After nos 429
+            porta: Porta local (0 = escolhida pelo sistema)
+            semente: Semente do gerador aleatório (reprodutibilidade)
+        """
+        self.latencia_ms = latencia_ms
+        self.jitter_ms = jitter_ms
+        self.tokens_resposta = tokens_resposta
+        self.intervalo_token_ms = intervalo_token_ms
+        self.taxa_erro = taxa_erro
+        self.taxa_429 = taxa_429
+        self.retry_after = retry_after
+        self.porta = porta
+
+        self._random = random.Random(semente)
+        self._lock = threading.Lock()
+        self._servidor: Optional[ThreadingHTTPServer] = None
+        self.contadores = {'requisicoes': 0, 'respostas_200': 0, 'respostas_429': 0, 'respostas_500': 0}
+
+    def _contar(self, campo: str):
+        with self._lock:
+            self.contadores[campo] += 1
+
+    def _aleatorio(self) -> float:
+        with self._lock:
+            return self._random.random()
+
+    def _latencia(self) -> float:
+        with self._lock:
+            variacao = self._random.uniform(-self.jitter_ms, self.jitter_ms)
+        return max(0.0, self.latencia_ms + variacao) / 1000.0
+
+    @property
+    def url_base(self) -> str:
+        """URL para usar como `base_url` do APEXLLMClient"""
+        return f"http://127.0.0.1:{self._servidor.server_port}"
+
+    @property
+    def url_chat(self) -> str:
+        """URL para usar como `url_api` da PerplexityIntegration"""
+        return f"{self.url_base}/chat/completions"
+
+    def iniciar(self) -> 'ServidorMockPerplexity':
+        """Sobe o servidor numa thread em segundo plano"""
+        self._servidor = _ServidorHTTP(('127.0.0.1', self.porta), _ManipuladorMock)
+        self._servidor.mock = self
+        threading.Thread(target=self._servidor.serve_forever, daemon=True).start()
+        return self
+
+    def parar(self):
+        """Encerra o servidor"""
+        if self._servidor is not None:
+            self._servidor.shutdown()
+            self._servidor.server_close()
+            self._servidor = None
+
+    def __enter__(self):
+        return self.iniciar()
+
+    def __exit__(self, *exc):
+        self.parar()
+        return False
+
+
+if __name__ == "__main__":
+    servidor = ServidorMockPerplexity().iniciar()
+    print(f"Mock da Perplexity em {servidor.url_base} (Ctrl+C para sair)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        servidor.parar()
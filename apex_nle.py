@@ -1,5 +1,8 @@
 # apex_nle.py
 import re
+from typing import Dict, List, Optional, Sequence
+
+from apex_intent_classifier import ClassificadorIntencoes
 
 
 # Palavras que não influenciam o comando e devem ser removidas
@@ -10,84 +13,258 @@ STOPWORDS = [
 ]
 
 
+def _alternativas(palavras: Sequence[str]) -> str:
+    """Alternância regex com as expressões mais longas primeiro"""
+    return "|".join(re.escape(p) for p in sorted(palavras, key=len, reverse=True))
+
+
+# Só palavras inteiras: "me" não sai de dentro de "mensagem"
+_RE_STOPWORDS = re.compile(r"\b(?:" + _alternativas(STOPWORDS) + r")\b")
+_RE_ESPACOS = re.compile(r"\s+")
+_RE_SLOT = re.compile(r"\{(\w+)\}")
+_RE_PALAVRA = re.compile(r"\w+")
+
+
 def limpar_texto(texto: str) -> str:
     """
     Remove palavras irrelevantes e normaliza o texto.
     """
-    texto = texto.lower().strip()
+    texto = _RE_STOPWORDS.sub(" ", texto.lower().strip())
+    return _RE_ESPACOS.sub(" ", texto).strip()
 
 
-    for sw in STOPWORDS:
-        texto = texto.replace(sw, " ")
+# ============================
+# TABELA DE INTENÇÕES
+# ============================
 
 
-    texto = re.sub(r"\s+", " ", texto)
-    return texto.strip()
+class Intencao:
+    """
+    Intenção reconhecida por gatilhos, convertida no comando `modelo`.
 
+    Cada padrão é uma frase literal que pode ter slots, ex.:
+    "pesquisar {termo}". O texto capturado no slot preenche o slot de
+    mesmo nome no modelo ("pesquisar por {termo}"). Modelo None devolve
+    o texto original.
 
+    `exemplos` são frases típicas usadas pelo classificador aproximado
+    quando nenhum padrão casa (só para modelos sem slots).
+    """
 
-def interpretar_comando(texto: str) -> str:
+    __slots__ = ("nome", "padroes", "modelo", "exemplos")
+
+    def __init__(
+        self,
+        nome: str,
+        padroes: Sequence[str],
+        modelo: Optional[str],
+        exemplos: Sequence[str] = ()
+    ):
+        self.nome = nome
+        self.padroes = list(padroes)
+        self.modelo = modelo
+        self.exemplos = list(exemplos)
+
+    def formatar(self, slots: Dict[str, str], original: str) -> str:
+        if self.modelo is None:
+            return original
+        return self.modelo.format(**slots).strip()
+
+
+# Em ordem de prioridade: se várias casarem, vale a primeira da lista
+INTENCOES: List[Intencao] = [
+    Intencao("youtube", ["youtube"], "abrir youtube", [
+        "abrir o youtube", "abre o youtube", "abre youtube", "quero ver youtube",
+        "entra no youtube", "bota um video no youtube", "coloca o youtube",
+        "quero assistir youtube", "abre o youtube ai"
+    ]),
+    Intencao("navegador_chrome", ["chrome"], "abrir navegador chrome", [
+        "abrir o chrome", "abre o google chrome", "abre o chrome", "entra no chrome",
+        "abre o navegador chrome", "quero usar o chrome"
+    ]),
+    Intencao("navegador", ["navegador", "internet", "google"], "abrir navegador", [
+        "abrir o navegador", "abre o navegador", "abre a internet", "entra na internet", "abre o google",
+        "abre o browser", "quero navegar na internet"
+    ]),
+    Intencao("vs_code", ["vs code", "vscode", "visual studio code"], "abrir vs code", [
+        "abrir o vs code", "abre o vscode", "abre o visual studio code", "abre o visual studio",
+        "abre o vs"
+    ]),
+    Intencao("horas", ["hora", "horas"], "que horas são", [
+        "que horas sao", "que hora e", "diz as horas", "sabe que horas sao", "horario atual",
+        "me fala as horas", "que horas sao agora"
+    ]),
+    Intencao(
+        "pesquisar",
+        ["pesquisar {termo}", "pesquise {termo}", "procure {termo}", "busque {termo}", "buscar {termo}"],
+        "pesquisar por {termo}"
+    ),
+    Intencao("criar_comando", ["criar comando"], None),
+]
+
+
+def _regex_padrao(padrao: str) -> str:
+    """Frase com slots -> regex; palavras separadas por qualquer espaço"""
+    partes = []
+    posicao = 0
+    for slot in _RE_SLOT.finditer(padrao):
+        literal = padrao[posicao:slot.start()].strip()
+        if literal:
+            partes.append(r"\s+".join(re.escape(p) for p in literal.split()) + r"\b")
+        final = slot.end() == len(padrao.rstrip())
+        partes.append(rf"(?P<{slot.group(1)}>.*)" if final else rf"(?P<{slot.group(1)}>.*?)")
+        posicao = slot.end()
+    literal = padrao[posicao:].strip()
+    if literal:
+        partes.append(r"\s+".join(re.escape(p) for p in literal.split()) + r"\b")
+    return r"\s*".join(partes)
+
+
+class MatcherIntencoes:
     """
-    Interpreta frases naturais e converte para comandos que o APEX entende.
-    Se não encontrar intenção clara, devolve o texto original.
+    Reconhece intenções com uma árvore de gatilhos por palavra.
+
+    O gatilho de um padrão é o trecho literal antes do primeiro slot. Cada
+    nó da árvore guarda todos os padrões cujo gatilho termina nele, então
+    padrões que dividem o gatilho ("tocar {musica} no spotify" e
+    "tocar {musica}") e gatilhos que são prefixo de outros ("abrir {app}" e
+    "abrir o navegador") são todos candidatos. Os candidatos são tentados
+    em ordem de prioridade e só eles são casados de novo para extrair os
+    slots.
+    """
+
+    def __init__(self, intencoes: Sequence[Intencao]):
+        self.intencoes = list(intencoes)
+        # palavra -> (subárvore, [(prioridade, ordem, intenção, regex completa do padrão)])
+        self._arvore: Dict[str, tuple] = {}
+        ordem = 0
+        for prioridade, intencao in enumerate(self.intencoes):
+            for padrao in intencao.padroes:
+                palavras = _RE_PALAVRA.findall(_RE_SLOT.split(padrao, maxsplit=1)[0])
+                if not palavras:
+                    raise ValueError(f"Padrão sem gatilho literal: {padrao!r}")
+                ramos = self._arvore
+                for palavra in palavras:
+                    no = ramos.setdefault(palavra, ({}, []))
+                    ramos = no[0]
+                no[1].append((prioridade, ordem, intencao, re.compile(_regex_padrao(padrao))))
+                ordem += 1
+
+    def _candidatos(self, texto: str) -> List[tuple]:
+        palavras = list(_RE_PALAVRA.finditer(texto))
+        candidatos = []
+        for i, primeira in enumerate(palavras):
+            ramos = self._arvore
+            for j in range(i, len(palavras)):
+                # As palavras do gatilho só podem estar separadas por espaço
+                if j > i and not texto[palavras[j - 1].end():palavras[j].start()].isspace():
+                    break
+                no = ramos.get(palavras[j].group())
+                if no is None:
+                    break
+                ramos, padroes = no
+                for prioridade, ordem, intencao, regex in padroes:
+                    candidatos.append((prioridade, primeira.start(), ordem, intencao, regex))
+        candidatos.sort(key=lambda c: c[:3])
+        return candidatos
+
+    def reconhecer(self, texto: str) -> Optional[tuple]:
+        """
+        Returns:
+            (intenção, slots) da intenção de maior prioridade, ou None
+        """
+        for _, inicio, _, intencao, regex in self._candidatos(texto):
+            casamento = regex.match(texto, inicio)
+            if casamento is not None:
+                return intencao, {k: (v or "").strip() for k, v in casamento.groupdict().items()}
+        return None
+
+
+_matcher = MatcherIntencoes(INTENCOES)
+# Criado no primeiro uso (ver _obter_classificador)
+_classificador: Optional[ClassificadorIntencoes] = None
+
+
+def registrar_intencao(
+    nome: str,
+    padroes: Sequence[str],
+    modelo: Optional[str],
+    prioridade: Optional[int] = None,
+    exemplos: Sequence[str] = ()
+):
     """
-    original = texto.lower().strip()
-    texto = limpar_texto(original)
+    Adiciona uma intenção à tabela (no fim, ou na posição `prioridade`) e
+    recompila o matcher.
+    """
+    global _matcher, _classificador
+    intencao = Intencao(nome, padroes, modelo, exemplos)
+    if prioridade is None:
+        INTENCOES.append(intencao)
+    else:
+        INTENCOES.insert(prioridade, intencao)
+    _matcher = MatcherIntencoes(INTENCOES)
+    _classificador = None
 
 
-    if not texto:
-        return original
+def _obter_classificador() -> ClassificadorIntencoes:
+    """Classificador aproximado com os exemplos das intenções sem slots"""
+    global _classificador
+    if _classificador is None:
+        _classificador = ClassificadorIntencoes({
+            intencao.nome: intencao.exemplos for intencao in INTENCOES
+            if intencao.exemplos and intencao.modelo is not None and not _RE_SLOT.search(intencao.modelo)
+        })
+    return _classificador
 
 
-    # -------------------------
-    # ABRIR YOUTUBE
-    # -------------------------
-    if "youtube" in texto:
-        return "abrir youtube"
+def _intencao(nome: str) -> Intencao:
+    return next(intencao for intencao in INTENCOES if intencao.nome == nome)
 
 
-    # -------------------------
-    # ABRIR NAVEGADOR / CHROME
-    # -------------------------
-    if any(p in texto for p in ["navegador", "internet", "chrome", "google"]):
-        if "chrome" in texto:
-            return "abrir navegador chrome"
-        return "abrir navegador"
+def interpretar_comando(texto: str) -> str:
+    """
+    Interpreta frases naturais e converte para comandos que o APEX entende.
+    Se não encontrar intenção clara, devolve o texto original.
+    """
+    return interpretar_lote([texto])[0]
+
 
+def interpretar_lote(textos: Sequence[str]) -> List[str]:
+    """
+    Interpreta várias frases (ex.: transcrições gravadas) de uma vez.
 
-    # -------------------------
-    # ABRIR VS CODE
-    # -------------------------
-    if any(p in texto for p in ["vs code", "vscode", "visual studio code"]):
-        return "abrir vs code"
+    Cada frase passa primeiro pelos padrões exatos; as que não casam vão
+    juntas para o classificador aproximado, que tolera erros de
+    transcrição ("abri o iutube"), e só são aceitas acima do limiar.
+    """
+    comandos: List[Optional[str]] = []
+    pendentes = []
+    for indice, texto in enumerate(textos):
+        original = texto.lower().strip()
+        texto = limpar_texto(original)
 
 
-    # -------------------------
-    # PERGUNTAR HORAS
-    # -------------------------
-    if "hora" in texto or "horas" in texto:
-        return "que horas são"
+        if not texto:
+            comandos.append(original)
+            continue
 
 
-    # -------------------------
-    # PESQUISAR NA INTERNET
-    # -------------------------
-    for gatilho in ["pesquisar", "pesquise", "procure", "busque", "buscar"]:
-        if gatilho in texto:
-            termo = texto.split(gatilho, 1)[-1].strip()
-            if termo:
-                return f"pesquisar por {termo}"
-            return "pesquisar por"
+        reconhecido = _matcher.reconhecer(texto)
+        if reconhecido is not None:
+            intencao, slots = reconhecido
+            comandos.append(intencao.formatar(slots, original))
+            continue
 
 
-    # -------------------------
-    # CRIAR COMANDO PERSONALIZADO
-    # -------------------------
-    if "criar comando" in original:
-        return original
+        comandos.append(None)
+        pendentes.append((indice, original, texto))
 
 
-    # -------------------------
-    # SE NÃO ENTENDER, DEVOLVE O TEXTO ORIGINAL
-    # -------------------------
-    return original
+    if pendentes:
+        classificados = _obter_classificador().classificar_lote([texto for _, _, texto in pendentes])
+        for (indice, original, _), (rotulo, _confianca) in zip(pendentes, classificados):
+            # -------------------------
+            # SE NÃO ENTENDER, DEVOLVE O TEXTO ORIGINAL
+            # -------------------------
+            comandos[indice] = _intencao(rotulo).formatar({}, original) if rotulo else original
+    return comandos
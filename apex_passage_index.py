@@ -0,0 +1,206 @@
+"""apex_passage_index.py - Índice BM25 de passagens das páginas extraídas
+
+As páginas são divididas em passagens curtas (janelas de palavras com
+sobreposição) e indexadas num índice invertido em memória. `buscar`
+devolve as k passagens mais relevantes para a pergunta, para que só o
+trecho útil de cada página vá para o prompt do LLM.
+
+O índice é incremental: uma página já indexada com o mesmo texto não é
+tokenizada de novo, e as páginas mais antigas saem quando o limite é
+atingido.
+"""
+
+import re
+import math
+import hashlib
+import threading
+import unicodedata
+from collections import Counter, OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+_RE_PALAVRAS = re.compile(r'\w+')
+
+# Palavras muito frequentes em português/inglês que não ajudam no ranking
+STOPWORDS = frozenset('''
+    a o as os um uma uns umas de do da dos das em no na nos nas por pelo pela
+    pelos pelas para com sem sob sobre e ou mas que se ao aos como mais menos
+    muito ja nao sim foi ser sao esta estao isso isto esse essa este qual quais
+    quando onde eu tu ele ela nos eles elas seu sua seus suas meu minha
+    the an of to in on at for and or but is are was were be been it this that
+    with as by from what which who how
+'''.split())
+
+
+def tokenizar(texto: str) -> List[str]:
+    """
+    Minúsculas, sem acentos e sem stopwords.
+    """
+    texto = unicodedata.normalize('NFKD', texto.lower())
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return [t for t in _RE_PALAVRAS.findall(texto) if len(t) > 1 and t not in STOPWORDS]
+
+
+def dividir_passagens(texto: str, palavras_por_passagem: int = 80, sobreposicao: int = 20) -> List[str]:
+    """
+    Divide o texto em janelas de `palavras_por_passagem` palavras.
+
+    Janelas vizinhas compartilham `sobreposicao` palavras, para que uma
+    frase cortada na fronteira apareça inteira em uma delas.
+    """
+    palavras = texto.split()
+    if not palavras:
+        return []
+    passo = max(1, palavras_por_passagem - sobreposicao)
+    passagens = []
+    for inicio in range(0, len(palavras), passo):
+        passagens.append(' '.join(palavras[inicio:inicio + palavras_por_passagem]))
+        if inicio + palavras_por_passagem >= len(palavras):
+            break
+    return passagens
+
+
+class Passagem:
+    """Trecho de uma página"""
+
+    __slots__ = ('id', 'url', 'titulo', 'texto', 'tamanho', 'termos')
+
+    def __init__(self, id: int, url: str, titulo: str, texto: str, termos: Counter):
+        self.id = id
+        self.url = url
+        self.titulo = titulo
+        self.texto = texto
+        self.termos = termos
+        self.tamanho = sum(termos.values())
+
+
+class IndicePassagens:
+    """
+    Índice invertido BM25 sobre passagens de páginas web.
+    """
+
+    def __init__(
+        self,
+        k1: float = 1.5,
+        b: float = 0.75,
+        palavras_por_passagem: int = 80,
+        sobreposicao: int = 20,
+        max_paginas: int = 500
+    ):
+        """
+        Args:
+            k1: Saturação da frequência do termo (BM25)
+            b: Peso da normalização pelo tamanho da passagem (BM25)
+            palavras_por_passagem: Tamanho das passagens
+            sobreposicao: Palavras repetidas entre passagens vizinhas
+            max_paginas: Páginas mantidas; as indexadas há mais tempo saem primeiro
+        """
+        self.k1 = k1
+        self.b = b
+        self.palavras_por_passagem = palavras_por_passagem
+        self.sobreposicao = sobreposicao
+        self.max_paginas = max_paginas
+
+        self._lock = threading.Lock()
+        self._proximo_id = 0
+        self._passagens: Dict[int, Passagem] = {}
+        # termo -> {id da passagem: frequência}
+        self._postings: Dict[str, Dict[int, int]] = {}
+        # url -> (hash do texto, ids das passagens)
+        self._paginas: 'OrderedDict[str, Tuple[str, List[int]]]' = OrderedDict()
+        self._tamanho_total = 0
+
+    def __len__(self) -> int:
+        return len(self._passagens)
+
+    def adicionar_pagina(self, url: str, texto: str, titulo: str = '') -> int:
+        """
+        Indexa as passagens de uma página.
+
+        Se a página já estiver indexada com o mesmo texto, nada é refeito.
+
+        Returns:
+            Quantidade de passagens da página
+        """
+        assinatura = hashlib.sha1(texto.encode('utf-8')).hexdigest()
+        with self._lock:
+            existente = self._paginas.get(url)
+            if existente is not None:
+                if existente[0] == assinatura:
+                    self._paginas.move_to_end(url)
+                    return len(existente[1])
+                self._remover(url)
+
+            ids = []
+            for trecho in dividir_passagens(texto, self.palavras_por_passagem, self.sobreposicao):
+                termos = Counter(tokenizar(trecho))
+                if not termos:
+                    continue
+                passagem = Passagem(self._proximo_id, url, titulo, trecho, termos)
+                self._proximo_id += 1
+                self._passagens[passagem.id] = passagem
+                self._tamanho_total += passagem.tamanho
+                for termo, frequencia in termos.items():
+                    self._postings.setdefault(termo, {})[passagem.id] = frequencia
+                ids.append(passagem.id)
+            self._paginas[url] = (assinatura, ids)
+
+            while len(self._paginas) > self.max_paginas:
+                self._remover(next(iter(self._paginas)))
+            return len(ids)
+
+    def remover_pagina(self, url: str):
+        """Tira uma página do índice"""
+        with self._lock:
+            self._remover(url)
+
+    def _remover(self, url: str):
+        _, ids = self._paginas.pop(url, (None, []))
+        for pid in ids:
+            passagem = self._passagens.pop(pid)
+            self._tamanho_total -= passagem.tamanho
+            for termo in passagem.termos:
+                postings = self._postings.get(termo)
+                if postings is not None:
+                    postings.pop(pid, None)
+                    if not postings:
+                        del self._postings[termo]
+
+    def buscar(
+        self,
+        pergunta: str,
+        k: int = 5,
+        urls: Optional[Iterable[str]] = None
+    ) -> List[Tuple[float, Passagem]]:
+        """
+        Retorna as `k` passagens mais relevantes para a pergunta.
+
+        Args:
+            pergunta: Texto da pergunta
+            k: Quantidade de passagens
+            urls: Restringe a busca a essas páginas (ex.: as da busca atual)
+
+        Returns:
+            Lista de (pontuação BM25, passagem), da mais relevante para a menos
+        """
+        termos = set(tokenizar(pergunta))
+        permitidas = set(urls) if urls is not None else None
+        with self._lock:
+            total = len(self._passagens)
+            if not total or not termos:
+                return []
+            media = self._tamanho_total / total
+            pontuacoes: Dict[int, float] = {}
+            for termo in termos:
+                postings = self._postings.get(termo)
+                if not postings:
+                    continue
+                idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+                for pid, frequencia in postings.items():
+                    passagem = self._passagens[pid]
+                    if permitidas is not None and passagem.url not in permitidas:
+                        continue
+                    norma = self.k1 * (1 - self.b + self.b * passagem.tamanho / media)
+                    pontuacoes[pid] = pontuacoes.get(pid, 0.0) + idf * frequencia * (self.k1 + 1) / (frequencia + norma)
+
+            melhores = sorted(pontuacoes.items(), key=lambda item: item[1], reverse=True)[:k]
+            return [(pontuacao, self._passagens[pid]) for pid, pontuacao in melhores]
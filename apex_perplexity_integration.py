@@ -5,11 +5,18 @@ Funciona como o Perplexity com busca web e respostas contextualizadas
 """
 
 import requests
-import json
-from typing import Optional, Dict, List
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 import os
+import time
 import logging
-from datetime import datetime
+
+from apex_http import obter_transporte
+from apex_rate_limit import obter_controle
+from apex_llm_cache import CacheRespostas, chave_cache, obter_cache
+from apex_context_window import MontadorContexto
+from apex_telemetry import metricas
+from apex_historico import HistoricoConversa, RegistroConversa, criar_historico
 
 logger = logging.getLogger(__name__)
 
@@ -20,20 +27,37 @@ class PerplexityIntegration:
     Oferece respostas inteligentes com busca web
     """
     
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        cache: Optional[CacheRespostas] = None,
+        historico: Optional[HistoricoConversa] = None
+    ):
         """
         Inicializa a integração
         API Key pode vir de variável de ambiente ou parâmetro
+        Cache de respostas é o compartilhado do processo, salvo se informado
+        Histórico é limitado em memória e, se configurado, gravado em log JSONL (ver .env)
         """
         self.api_key = api_key or os.getenv('PERPLEXITY_API_KEY')
         self.modelo = "pplx-70b-online"  # Modelo com acesso web
         self.url_api = "https://api.perplexity.ai/chat/completions"
-        self.historico = []
+        self.historico = historico if historico is not None else criar_historico()
         self.max_tokens = 1000
+        self.cache = cache if cache is not None else obter_cache()
+        self.contexto = MontadorContexto(int(os.getenv('APEX_ORCAMENTO_CONTEXTO', '3000')))
     
-    def fazer_pergunta(self, pergunta: str, com_web: bool = True) -> Dict:
+    def fazer_pergunta(
+        self,
+        pergunta: str,
+        com_web: bool = True,
+        modelo: Optional[str] = None,
+        historico: Optional[List[RegistroConversa]] = None
+    ) -> Dict:
         """
         Faz uma pergunta ao Perplexity e retorna resposta
+        `modelo` substitui a escolha automática feita a partir de `com_web`
+        `historico` fixa as interações usadas como contexto (padrão: o histórico atual)
         """
         if not self.api_key:
             return {
@@ -49,46 +73,75 @@ class PerplexityIntegration:
             }
             
             # Selecionar modelo com ou sem busca web
-            modelo_selecionado = "pplx-70b-online" if com_web else "pplx-70b"
+            modelo_selecionado = modelo or ("pplx-70b-online" if com_web else "pplx-70b")
             
             payload = {
                 "model": modelo_selecionado,
-                "messages": self._preparar_mensagens(pergunta),
+                "messages": self._preparar_mensagens(pergunta, historico),
                 "max_tokens": self.max_tokens,
                 "temperature": 0.7,
                 "top_p": 0.9,
                 "stream": False
             }
             
-            response = requests.post(self.url_api, json=payload, headers=headers, timeout=30)
+            chave = None
+            em_cache = None
+            if self.cache is not None and self.cache.usar_cache(modelo_selecionado):
+                chave = chave_cache(modelo_selecionado, payload['messages'], payload['temperature'], self.max_tokens)
+                em_cache = self.cache.obter(chave)
             
-            if response.status_code == 200:
+            if em_cache is not None:
+                resposta_completa = em_cache['resposta']
+                tokens = em_cache['tokens']
+            else:
+                controle = obter_controle()
+                estimados = sum(self.contexto.contar(m) for m in payload['messages']) + self.max_tokens
+                inicio = time.perf_counter()
+                try:
+                    response = controle.executar(
+                        lambda: obter_transporte().post(self.url_api, json=payload, headers=headers),
+                        estimados
+                    )
+                except requests.exceptions.RequestException:
+                    metricas.registrar(
+                        'apex_perplexity_integration', modelo_selecionado, 'erro_rede', time.perf_counter() - inicio
+                    )
+                    raise
+                latencia = time.perf_counter() - inicio
+                
+                if response.status_code != 200:
+                    metricas.registrar('apex_perplexity_integration', modelo_selecionado, response.status_code, latencia)
+                    logger.error(f"Erro da API: {response.status_code}")
+                    return {
+                        'status': 'erro',
+                        'mensagem': f'Erro HTTP {response.status_code}',
+                        'detalhes': response.text
+                    }
+                
                 resultado = response.json()
                 resposta_completa = resultado['choices'][0]['message']['content']
+                uso = resultado['usage']
+                tokens = uso['total_tokens']
+                controle.registrar_uso(tokens, estimados)
+                metricas.registrar(
+                    'apex_perplexity_integration', modelo_selecionado, response.status_code, latencia,
+                    None, uso.get('prompt_tokens'), uso.get('completion_tokens')
+                )
                 
-                # Armazenar no histórico
-                self.historico.append({
-                    'timestamp': datetime.now().isoformat(),
-                    'pergunta': pergunta,
-                    'resposta': resposta_completa,
-                    'modelo': modelo_selecionado,
-                    'tokens': resultado['usage']['total_tokens']
-                })
-                
-                return {
-                    'status': 'sucesso',
-                    'resposta': resposta_completa,
-                    'com_busca_web': com_web,
-                    'modelo': modelo_selecionado,
-                    'tokens_usados': resultado['usage']['total_tokens']
-                }
-            else:
-                logger.error(f"Erro da API: {response.status_code}")
-                return {
-                    'status': 'erro',
-                    'mensagem': f'Erro HTTP {response.status_code}',
-                    'detalhes': response.text
-                }
+                if chave is not None:
+                    self.cache.salvar(chave, {'resposta': resposta_completa, 'tokens': tokens}, modelo_selecionado)
+            
+            # Armazenar no histórico
+            self.historico.adicionar(pergunta, resposta_completa, modelo_selecionado, tokens)
+            
+            return {
+                'status': 'sucesso',
+                'resposta': resposta_completa,
+                'com_busca_web': com_web,
+                'modelo': modelo_selecionado,
+                'tokens_usados': tokens,
+                'do_cache': em_cache is not None
+            }
         
         except requests.exceptions.Timeout:
             return {'status': 'erro', 'mensagem': 'Timeout na conexão com Perplexity'}
@@ -96,21 +149,21 @@ class PerplexityIntegration:
             logger.error(f"Erro: {e}")
             return {'status': 'erro', 'mensagem': str(e)}
     
-    def _preparar_mensagens(self, pergunta: str) -> List[Dict]:
+    def _preparar_mensagens(self, pergunta: str, historico: Optional[List[RegistroConversa]] = None) -> List[Dict]:
         """
         Prepara o histórico de mensagens para a API
+        Inclui os pares mais recentes que couberem no orçamento de tokens
         """
         mensagens = []
         
-        # Adicionar contexto do histórico (limitado aos últimos 5)
-        for item in self.historico[-5:]:
+        for item in (historico if historico is not None else self.historico):
             mensagens.append({
                 "role": "user",
-                "content": item['pergunta']
+                "content": item.pergunta
             })
             mensagens.append({
                 "role": "assistant",
-                "content": item['resposta']
+                "content": item.resposta
             })
         
         # Adicionar pergunta atual
@@ -119,7 +172,7 @@ class PerplexityIntegration:
             "content": pergunta
         })
         
-        return mensagens
+        return self.contexto.montar(mensagens)
     
     def resumir_com_contexto(self, texto: str, contexto: Optional[str] = None) -> str:
         """
@@ -141,26 +194,112 @@ class PerplexityIntegration:
         resultado = self.fazer_pergunta(prompt, com_web=True)
         return resultado.get('resposta', 'Não encontrado')
     
+    def _executar_item(
+        self,
+        indice: int,
+        item: Union[str, Dict],
+        historico: List[RegistroConversa]
+    ) -> Tuple[int, Dict]:
+        if isinstance(item, str):
+            item = {'pergunta': item}
+        if not isinstance(item, dict) or not isinstance(item.get('pergunta'), str) or not item['pergunta'].strip():
+            # Item inválido não derruba o lote: vira um resultado de erro
+            return indice, {
+                'status': 'erro',
+                'mensagem': "Item do lote sem 'pergunta' (texto)",
+                'indice': indice,
+                'pergunta': item.get('pergunta') if isinstance(item, dict) else None,
+                'latencia_s': 0.0,
+                'tokens_usados': 0
+            }
+        inicio = time.perf_counter()
+        resultado = self.fazer_pergunta(
+            item['pergunta'],
+            com_web=item.get('com_web', True),
+            modelo=item.get('modelo'),
+            historico=historico
+        )
+        resultado['indice'] = indice
+        resultado['pergunta'] = item['pergunta']
+        resultado['latencia_s'] = round(time.perf_counter() - inicio, 4)
+        resultado.setdefault('tokens_usados', 0)
+        return indice, resultado
+    
+    def iterar_perguntas_em_lote(
+        self,
+        itens: Iterable[Union[str, Dict]],
+        max_workers: int = 4
+    ) -> Iterator[Tuple[int, Dict]]:
+        """
+        Faz várias perguntas em paralelo e devolve cada uma assim que termina
+        
+        Args:
+            itens: Perguntas (str) ou dicts com 'pergunta' e, opcionalmente,
+                'com_web' e 'modelo'
+            max_workers: Perguntas simultâneas
+        
+        Todas as perguntas usam como contexto o histórico de antes do lote,
+        então a resposta de um item não depende de quais outros terminaram
+        antes dele. Itens sem 'pergunta' voltam com status 'erro'.
+        
+        Yields:
+            (índice do item na entrada, resultado de fazer_pergunta acrescido
+            de 'indice', 'pergunta' e 'latencia_s'), em ordem de conclusão
+        """
+        itens = list(itens)
+        if not itens:
+            return
+        historico = list(self.historico)
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(itens)))) as executor:
+            futuros = [executor.submit(self._executar_item, i, item, historico) for i, item in enumerate(itens)]
+            for futuro in as_completed(futuros):
+                yield futuro.result()
+    
+    def fazer_perguntas_em_lote(
+        self,
+        itens: Iterable[Union[str, Dict]],
+        max_workers: int = 4,
+        ao_concluir: Optional[Callable[[int, Dict], None]] = None
+    ) -> List[Dict]:
+        """
+        Faz várias perguntas em paralelo e retorna os resultados na ordem da entrada
+        
+        Args:
+            itens: Perguntas (str) ou dicts com 'pergunta', 'com_web' e 'modelo'
+            max_workers: Perguntas simultâneas
+            ao_concluir: Callback (índice, resultado) chamado a cada pergunta concluída
+        """
+        itens = list(itens)
+        resultados: List[Optional[Dict]] = [None] * len(itens)
+        for indice, resultado in self.iterar_perguntas_em_lote(itens, max_workers):
+            resultados[indice] = resultado
+            if ao_concluir:
+                try:
+                    ao_concluir(indice, resultado)
+                except Exception as e:
+                    logger.error(f"Erro no callback do lote: {e}")
+        return resultados
+    
     def obter_historico(self) -> List[Dict]:
         """
         Retorna o histórico de perguntas e respostas
         """
-        return self.historico
+        return self.historico.listar()
     
     def limpar_historico(self):
         """
-        Limpa o histórico de conversa
+        Limpa o histórico de conversa (o log em disco é preservado)
         """
-        self.historico = []
+        self.historico.limpar()
         logger.info("Histórico limpo")
     
-    def exportar_historico(self, arquivo: str = 'historico_apex.json'):
+    def exportar_historico(self, arquivo: str = 'historico_apex_export.jsonl') -> int:
         """
-        Exporta o histórico para arquivo JSON
+        Anexa ao arquivo JSONL as interações ainda não exportadas
         """
-        with open(arquivo, 'w', encoding='utf-8') as f:
-            json.dump(self.historico, f, ensure_ascii=False, indent=2)
-        logger.info(f"Histórico exportado para {arquivo}")
+        novas = self.historico.exportar(arquivo)
+        logger.info(f"{novas} interações exportadas para {arquivo}")
+        return novas
 
 
 def testar_integracao():
@@ -0,0 +1,219 @@
+"""apex_pipeline.py - Pipeline busca → leitura → passagens → resposta com citações
+
+Funciona como o Perplexity: busca na web, baixa as páginas em paralelo,
+ranqueia as passagens (BM25) e transmite a resposta do LLM em streaming,
+citando as fontes como [n].
+
+As etapas se sobrepõem: cada página entra no índice assim que chega e o
+prompt é enviado quando já há passagens suficientes, sem esperar as
+páginas restantes. `RespostaPipeline.tempos` mostra quanto cada etapa
+levou.
+
+Uso:
+    pipeline = PipelineBusca(APEXLLMClient())
+    resposta = pipeline.responder("qual a temperatura ideal para dormir?")
+    for delta in resposta:
+        print(delta, end='', flush=True)
+    print(resposta.fontes_formatadas())
+"""
+
+import time
+import logging
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from apex_llm_client import APEXLLMClient
+from apex_passage_index import Passagem
+from apex_web_search import APEXWebSearch
+
+logger = logging.getLogger(__name__)
+
+SISTEMA_CITACOES = (
+    "Você é o APEX, um assistente de pesquisa. Responda em português usando "
+    "apenas as fontes numeradas fornecidas. Cite cada afirmação com o número "
+    "da fonte entre colchetes, como [1] ou [2][3]. Se as fontes não bastarem, "
+    "diga isso claramente."
+)
+
+
+class RespostaPipeline:
+    """
+    Resposta em streaming com as fontes usadas e os tempos de cada etapa.
+
+    Iterar entrega os deltas do LLM; depois de consumida, `texto` tem a
+    resposta completa e `tempos` inclui a geração.
+    """
+
+    def __init__(
+        self,
+        pergunta: str,
+        fontes: List[Dict],
+        passagens: List[Tuple[int, Passagem]],
+        tempos: Dict[str, float],
+        inicio: float,
+        stream=None,
+        texto: str = ''
+    ):
+        self.pergunta = pergunta
+        self.fontes = fontes
+        self.passagens = passagens
+        self.tempos = tempos
+        self.texto = texto
+        self._inicio = inicio
+        self._stream = stream
+
+    def __iter__(self) -> Iterator[str]:
+        if self._stream is None:
+            if self.texto:
+                yield self.texto
+            return
+        inicio_llm = time.perf_counter()
+        try:
+            for delta in self._stream:
+                yield delta
+        except Exception as e:
+            logger.error(f"Erro no streaming da resposta: {e}")
+            self._stream.texto = (self._stream.texto or '') + f"\nErro: {e}"
+        finally:
+            self.texto = self._stream.texto
+            if self._stream.tempo_primeiro_token is not None:
+                self.tempos['primeiro_token'] = round(self._stream.tempo_primeiro_token, 4)
+            self.tempos['geracao'] = round(time.perf_counter() - inicio_llm, 4)
+            self.tempos['total'] = round(time.perf_counter() - self._inicio, 4)
+            self._stream = None
+
+    def ler_tudo(self, ao_token: Optional[Callable[[str], None]] = None) -> str:
+        """Consome o streaming (chamando `ao_token` a cada delta) e retorna o texto"""
+        for delta in self:
+            if ao_token:
+                ao_token(delta)
+        return self.texto
+
+    def fontes_formatadas(self) -> str:
+        """Lista "[n] título - url" das fontes citáveis"""
+        return '\n'.join(f"[{f['numero']}] {f['titulo']} - {f['url']}" for f in self.fontes)
+
+
+class PipelineBusca:
+    """
+    Busca na web e responde com o LLM citando as fontes.
+    """
+
+    def __init__(
+        self,
+        llm_client,
+        busca: Optional[APEXWebSearch] = None,
+        max_passagens: int = 6,
+        paginas_suficientes: int = 2,
+        min_passagens: int = 3
+    ):
+        """
+        Args:
+            llm_client: APEXLLMClient (usa `processar_com_streaming`)
+            busca: Buscador web (padrão: um APEXWebSearch novo)
+            max_passagens: Passagens enviadas no prompt
+            paginas_suficientes: Páginas lidas a partir das quais o prompt
+                já pode ser enviado
+            min_passagens: Passagens relevantes exigidas junto com
+                `paginas_suficientes` para não esperar as demais páginas
+        """
+        self.llm = llm_client
+        self.busca = busca if busca is not None else APEXWebSearch()
+        self.max_passagens = max_passagens
+        self.paginas_suficientes = paginas_suficientes
+        self.min_passagens = min_passagens
+
+    def _coletar_passagens(
+        self,
+        pergunta: str,
+        resultados: List[Dict],
+        tempos: Dict[str, float]
+    ) -> List[Tuple[int, Passagem]]:
+        """
+        Indexa as páginas conforme chegam e para assim que houver o suficiente.
+        """
+        numeros: Dict[str, int] = {}
+        indexacao = 0.0
+        encontradas = []
+        inicio = time.perf_counter()
+        for indice, resultado, conteudo in self.busca.iterar_conteudos(resultados, max_paginas=len(resultados)):
+            marca = time.perf_counter()
+            self.busca.indice.adicionar_pagina(resultado['url'], conteudo, resultado['title'])
+            numeros[resultado['url']] = indice + 1
+            encontradas = self.busca.indice.buscar(pergunta, self.max_passagens, urls=numeros)
+            indexacao += time.perf_counter() - marca
+            if len(numeros) >= self.paginas_suficientes and len(encontradas) >= self.min_passagens:
+                break
+        tempos['leitura'] = round(time.perf_counter() - inicio - indexacao, 4)
+        tempos['ranqueamento'] = round(indexacao, 4)
+        tempos['paginas_lidas'] = len(numeros)
+        return [(numeros[passagem.url], passagem) for _, passagem in encontradas]
+
+    @staticmethod
+    def montar_prompt(pergunta: str, passagens: List[Tuple[int, Passagem]], resultados: List[Dict]) -> str:
+        """
+        Monta o prompt com as fontes numeradas.
+
+        Sem passagens (nenhuma página lida a tempo), usa os snippets da busca.
+        """
+        blocos = []
+        if passagens:
+            for numero, passagem in sorted(passagens, key=lambda item: item[0]):
+                blocos.append(f"[{numero}] {passagem.titulo}\n{passagem.texto}")
+        else:
+            for numero, resultado in enumerate(resultados, 1):
+                if resultado.get('snippet'):
+                    blocos.append(f"[{numero}] {resultado['title']}\n{resultado['snippet']}")
+        fontes = '\n\n'.join(blocos)
+        return f"Fontes:\n\n{fontes}\n\nPergunta: {pergunta}"
+
+    def responder(self, pergunta: str) -> RespostaPipeline:
+        """
+        Executa busca, leitura e ranqueamento e inicia a resposta em streaming.
+
+        Returns:
+            RespostaPipeline; itere sobre ela para receber os tokens
+        """
+        inicio = time.perf_counter()
+        tempos: Dict[str, float] = {}
+
+        resultados = self.busca.buscar(pergunta)
+        tempos['busca'] = round(time.perf_counter() - inicio, 4)
+        if not resultados:
+            tempos['total'] = tempos['busca']
+            return RespostaPipeline(
+                pergunta, [], [], tempos, inicio,
+                texto="Não consegui encontrar resultados para sua pergunta."
+            )
+
+        passagens = self._coletar_passagens(pergunta, resultados, tempos)
+        citadas = {numero for numero, _ in passagens} or set(range(1, len(resultados) + 1))
+        fontes = [
+            {'numero': numero, 'titulo': resultado['title'], 'url': resultado['url']}
+            for numero, resultado in enumerate(resultados, 1) if numero in citadas
+        ]
+
+        prompt = self.montar_prompt(pergunta, passagens, resultados)
+        marca = time.perf_counter()
+        try:
+            stream = self.llm.processar_com_streaming(prompt, sistema=SISTEMA_CITACOES, temperatura=0.2)
+        except Exception as e:
+            logger.error(f"Erro ao iniciar a resposta: {e}")
+            tempos['total'] = round(time.perf_counter() - inicio, 4)
+            return RespostaPipeline(pergunta, fontes, passagens, tempos, inicio, texto=f"Erro: {e}")
+        tempos['envio_prompt'] = round(time.perf_counter() - marca, 4)
+        return RespostaPipeline(pergunta, fontes, passagens, tempos, inicio, stream=stream)
+
+
+def responder_com_fontes(
+    pergunta: str,
+    ao_token: Optional[Callable[[str], None]] = None,
+    api_key: Optional[str] = None
+) -> str:
+    """
+    Interface simplificada: resposta completa seguida da lista de fontes.
+    """
+    resposta = PipelineBusca(APEXLLMClient(api_key)).responder(pergunta)
+    texto = resposta.ler_tudo(ao_token)
+    if resposta.fontes:
+        texto += f"\n\nFontes:\n{resposta.fontes_formatadas()}"
+    return texto
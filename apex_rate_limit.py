@@ -0,0 +1,355 @@
+"""apex_rate_limit.py - Controle de taxa adaptativo para a API da Perplexity
+
+Compartilhado por todos os clientes do processo:
+    - Balde de tokens para requisições/min e tokens/min
+    - Backoff exponencial com jitter que respeita `Retry-After`
+    - Limite de concorrência AIMD: diminui pela metade ao receber 429/5xx
+      e cresce aos poucos a cada sucesso
+
+Assim o APEX trabalha perto do teto da cota em vez de falhar ou subutilizá-la.
+"""
+
+import os
+import time
+import random
+import threading
+import logging
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Optional
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Status que indicam sobrecarga/limite e merecem nova tentativa
+STATUS_RETENTAVEIS = frozenset([429, 500, 502, 503, 504])
+
+
+class BaldeTokens:
+    """
+    Balde de tokens: `capacidade` unidades, reabastecido a `taxa` por segundo.
+    """
+
+    def __init__(self, capacidade: float, taxa: float):
+        self.capacidade = float(capacidade)
+        self.taxa = float(taxa)
+        self._disponivel = float(capacidade)
+        self._atualizado = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reabastecer(self):
+        agora = time.monotonic()
+        self._disponivel = min(self.capacidade, self._disponivel + (agora - self._atualizado) * self.taxa)
+        self._atualizado = agora
+
+    def adquirir(self, quantidade: float = 1) -> float:
+        """
+        Retira `quantidade` do balde, bloqueando até haver saldo.
+
+        Returns:
+            Tempo (s) que a chamada esperou
+        """
+        quantidade = min(float(quantidade), self.capacidade)
+        esperado = 0.0
+        while True:
+            with self._lock:
+                self._reabastecer()
+                if self._disponivel >= quantidade:
+                    self._disponivel -= quantidade
+                    return esperado
+                falta = (quantidade - self._disponivel) / self.taxa
+            time.sleep(falta)
+            esperado += falta
+
+    def ajustar(self, diferenca: float):
+        """
+        Corrige o saldo após saber o custo real (positivo devolve, negativo cobra).
+        """
+        with self._lock:
+            self._reabastecer()
+            self._disponivel = min(self.capacidade, self._disponivel + diferenca)
+
+    @property
+    def disponivel(self) -> float:
+        with self._lock:
+            self._reabastecer()
+            return self._disponivel
+
+
+class LimiteAdaptativo:
+    """
+    Limite de concorrência AIMD (aumento aditivo, redução multiplicativa).
+
+    Uso:
+        with limite:
+            ...  # no máximo `limite.limite` blocos simultâneos
+    """
+
+    def __init__(
+        self,
+        inicial: float = 4,
+        minimo: float = 1,
+        maximo: float = 32,
+        fator_reducao: float = 0.5,
+        intervalo_reducao: float = 1.0
+    ):
+        """
+        Args:
+            inicial: Limite inicial de chamadas simultâneas
+            minimo: Limite mínimo
+            maximo: Limite máximo
+            fator_reducao: Multiplicador aplicado ao limite em caso de throttling
+            intervalo_reducao: Intervalo mínimo (s) entre reduções, para que uma
+                rajada de 429s conte como um único evento
+        """
+        self.limite = float(inicial)
+        self.minimo = float(minimo)
+        self.maximo = float(maximo)
+        self.fator_reducao = fator_reducao
+        self.intervalo_reducao = intervalo_reducao
+        self.ativos = 0
+        self._ultima_reducao = 0.0
+        self._cond = threading.Condition()
+
+    def __enter__(self):
+        with self._cond:
+            while self.ativos >= max(1, int(self.limite)):
+                self._cond.wait()
+            self.ativos += 1
+        return self
+
+    def __exit__(self, *exc):
+        with self._cond:
+            self.ativos -= 1
+            self._cond.notify()
+        return False
+
+    def aumentar(self):
+        """Sucesso: +1 no limite a cada `limite` sucessos"""
+        with self._cond:
+            anterior = int(self.limite)
+            self.limite = min(self.maximo, self.limite + 1.0 / self.limite)
+            if int(self.limite) > anterior:
+                self._cond.notify()
+
+    def reduzir(self):
+        """Throttling: multiplica o limite por `fator_reducao`"""
+        with self._cond:
+            agora = time.monotonic()
+            if agora - self._ultima_reducao < self.intervalo_reducao:
+                return
+            self._ultima_reducao = agora
+            self.limite = max(self.minimo, self.limite * self.fator_reducao)
+
+
+def ler_retry_after(valor: Optional[str]) -> Optional[float]:
+    """
+    Converte o cabeçalho `Retry-After` (segundos ou data HTTP) em segundos.
+    """
+    if not valor:
+        return None
+    try:
+        return max(0.0, float(valor))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(valor).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def calcular_espera(
+    tentativa: int,
+    retry_after: Optional[str] = None,
+    base: float = 0.5,
+    maximo: float = 30.0
+) -> float:
+    """
+    Espera antes da próxima tentativa: exponencial com "full jitter".
+
+    Se a API enviou `Retry-After`, ele é o piso da espera.
+
+    Args:
+        tentativa: Número da tentativa que falhou (0 = primeira)
+        retry_after: Valor bruto do cabeçalho Retry-After
+        base: Espera base (s)
+        maximo: Teto da espera (s)
+    """
+    espera = random.uniform(0, min(maximo, base * (2 ** tentativa)))
+    piso = ler_retry_after(retry_after)
+    if piso is not None:
+        espera = max(espera, min(piso, maximo))
+    return espera
+
+
+class ControleTaxa:
+    """
+    Aplica limites de taxa, concorrência adaptativa e retentativas a uma requisição.
+    """
+
+    def __init__(
+        self,
+        requisicoes_por_minuto: float = 60,
+        tokens_por_minuto: float = 100000,
+        concorrencia_inicial: float = 4,
+        concorrencia_maxima: float = 32,
+        tentativas: int = 4
+    ):
+        self.requisicoes = BaldeTokens(requisicoes_por_minuto, requisicoes_por_minuto / 60.0)
+        self.tokens = BaldeTokens(tokens_por_minuto, tokens_por_minuto / 60.0)
+        self.concorrencia = LimiteAdaptativo(inicial=concorrencia_inicial, maximo=concorrencia_maxima)
+        self.tentativas = tentativas
+
+        self._lock = threading.Lock()
+        self.contadores = {
+            'requisicoes': 0,
+            'retentativas': 0,
+            'throttled': 0,
+            'erros_servidor': 0,
+            'espera_total_s': 0.0
+        }
+
+    def _contar(self, campo: str, valor: float = 1):
+        with self._lock:
+            self.contadores[campo] += valor
+
+    def executar(
+        self,
+        requisicao: Callable[[], requests.Response],
+        tokens_estimados: int = 0
+    ) -> requests.Response:
+        """
+        Executa `requisicao` respeitando os limites, com retentativas.
+
+        Os `tokens_estimados` saem do balde uma vez por chamada, não por
+        tentativa, e voltam para ele se a chamada terminar em erro (HTTP >= 400
+        ou exceção), já que nada foi consumido da cota.
+
+        Falhas de conexão não são repetidas aqui: a fase de conexão já é
+        retentada pelo urllib3 (apex_http) e, depois que o POST saiu, repeti-lo
+        poderia cobrar a mesma chamada duas vezes.
+
+        Args:
+            requisicao: Função sem argumentos que faz o POST e retorna a resposta
+            tokens_estimados: Tokens que a chamada deve consumir (prompt + resposta)
+
+        Returns:
+            A resposta final (pode ainda ser 429/5xx se as tentativas acabarem)
+
+        Raises:
+            requests.exceptions.RequestException: Falhas de rede
+        """
+        if tokens_estimados:
+            esperado = self.tokens.adquirir(tokens_estimados)
+            if esperado:
+                self._contar('espera_total_s', esperado)
+        try:
+            response = self._executar_com_retentativas(requisicao)
+        except Exception:
+            self.tokens.ajustar(tokens_estimados)
+            raise
+        if response.status_code >= 400:
+            self.tokens.ajustar(tokens_estimados)
+        return response
+
+    def _executar_com_retentativas(self, requisicao: Callable[[], requests.Response]) -> requests.Response:
+        """Laço de tentativas de `executar`: backoff em 429/5xx e AIMD na concorrência"""
+        for tentativa in range(self.tentativas + 1):
+            esperado = self.requisicoes.adquirir(1)
+            if esperado:
+                self._contar('espera_total_s', esperado)
+
+            with self.concorrencia:
+                self._contar('requisicoes')
+                try:
+                    response = requisicao()
+                except requests.exceptions.ConnectionError:
+                    self.concorrencia.reduzir()
+                    raise
+
+            if response.status_code not in STATUS_RETENTAVEIS:
+                self.concorrencia.aumentar()
+                return response
+
+            self._contar('throttled' if response.status_code == 429 else 'erros_servidor')
+            self.concorrencia.reduzir()
+            if tentativa == self.tentativas:
+                return response
+            retry_after = response.headers.get('Retry-After')
+            # Lê o corpo (pequeno) para devolver a conexão ao pool em vez de fechá-la
+            response.content
+            response.close()
+
+            espera = calcular_espera(tentativa, retry_after)
+            logger.warning(f"Perplexity sobrecarregada; nova tentativa em {espera:.2f}s")
+            self._contar('retentativas')
+            self._contar('espera_total_s', espera)
+            time.sleep(espera)
+
+    def registrar_uso(self, tokens_reais: int, tokens_estimados: int):
+        """
+        Corrige o balde de tokens/min com o consumo real informado pela API.
+        """
+        if tokens_estimados and tokens_reais is not None:
+            self.tokens.ajustar(tokens_estimados - tokens_reais)
+
+    def estatisticas(self) -> Dict:
+        """Retorna contadores e o estado atual dos limites"""
+        with self._lock:
+            dados = dict(self.contadores)
+        dados.update({
+            'limite_concorrencia': round(self.concorrencia.limite, 2),
+            'chamadas_ativas': self.concorrencia.ativos,
+            'requisicoes_disponiveis': round(self.requisicoes.disponivel, 2),
+            'tokens_disponiveis': round(self.tokens.disponivel)
+        })
+        return dados
+
+
+_controle: Optional[ControleTaxa] = None
+_controle_lock = threading.Lock()
+
+
+def obter_controle() -> ControleTaxa:
+    """
+    Retorna o controle de taxa compartilhado do processo, configurado pelo .env.
+    """
+    global _controle
+    if _controle is None:
+        with _controle_lock:
+            if _controle is None:
+                _controle = ControleTaxa(
+                    requisicoes_por_minuto=float(os.getenv('RATE_LIMIT', '60')),
+                    tokens_por_minuto=float(os.getenv('APEX_LIMITE_TOKENS_MINUTO', '100000')),
+                    concorrencia_inicial=float(os.getenv('APEX_CONCORRENCIA_INICIAL', '4')),
+                    concorrencia_maxima=float(os.getenv('APEX_CONCORRENCIA_MAXIMA', '32')),
+                    tentativas=int(os.getenv('APEX_TENTATIVAS_API', '4'))
+                )
+    return _controle
+
+
+def configurar_controle(**kwargs) -> ControleTaxa:
+    """
+    Substitui o controle compartilhado por um novo com outros limites.
+
+    Args:
+        **kwargs: Mesmos argumentos de ControleTaxa
+    """
+    global _controle
+    with _controle_lock:
+        _controle = ControleTaxa(**kwargs)
+    return _controle
+
+
+def trocar_controle(controle: Optional[ControleTaxa]) -> Optional[ControleTaxa]:
+    """
+    Instala `controle` como compartilhado.
+
+    Returns:
+        O controle anterior (None se ainda não tinha sido criado), para ser
+        reinstalado depois
+    """
+    global _controle
+    with _controle_lock:
+        anterior, _controle = _controle, controle
+    return anterior
@@ -0,0 +1,324 @@
+"""apex_search_providers.py - Provedores de busca do APEXWebSearch
+
+Cada provedor implementa `buscar(query, max_resultados)` e devolve dicts
+com 'title', 'url' e 'snippet'. `BuscaMultipla` consulta vários
+provedores em paralelo e junta os rankings (reciprocal rank fusion),
+removendo URLs repetidas.
+
+Provedores:
+    - ProvedorGoogle: scraping do HTML do google.com
+    - ProvedorFixture: pasta local com resultados salvos, para testes de
+      carga e profiling da busca sem rede
+
+Pasta de fixtures:
+    <pasta>/*.json  {"query": "...", "resultados": [{"title", "url", "snippet"}]}
+    <pasta>/*.html  Página de resultados do Google salva; a consulta é o
+                    nome do arquivo com "_" no lugar dos espaços
+    URLs relativas (ex.: "paginas/sono.html") são resolvidas contra
+    `url_paginas`, que pode apontar para `ServidorPaginasFixture(pasta)`.
+"""
+
+import os
+import json
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout, as_completed
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Sequence
+from urllib.parse import parse_qs, urljoin, urlparse, urlunparse, urlencode
+
+import requests
+from bs4 import BeautifulSoup
+
+from apex_http import obter_transporte
+from apex_web_cache import normalizar_query
+
+logger = logging.getLogger(__name__)
+
+# Constante da reciprocal rank fusion: suaviza o peso das primeiras posições
+RRF_K = 60
+
+
+def normalizar_url(url: str) -> str:
+    """
+    Chave de deduplicação: sem esquema, "www.", fragmento, barra final e
+    parâmetros de rastreamento (utm_*).
+    """
+    partes = urlparse(url.strip())
+    host = partes.netloc.lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    parametros = [
+        (chave, valor) for chave, valores in sorted(parse_qs(partes.query).items())
+        for valor in valores if not chave.startswith('utm_')
+    ]
+    caminho = partes.path.rstrip('/') or '/'
+    return urlunparse(('', host, caminho, '', urlencode(parametros), ''))
+
+
+class ProvedorBusca:
+    """
+    Interface dos provedores de busca.
+    """
+
+    nome = 'base'
+
+    @property
+    def identificador(self) -> str:
+        """Distingue provedores do mesmo tipo (ex.: na chave do cache de buscas)"""
+        return self.nome
+
+    def buscar(self, query: str, max_resultados: int = 5) -> List[Dict]:
+        """
+        Returns:
+            Lista de {'title', 'url', 'snippet'}, do mais relevante para o menos
+        """
+        raise NotImplementedError
+
+
+class ProvedorGoogle(ProvedorBusca):
+    """
+    Busca no google.com lendo o HTML da página de resultados.
+    """
+
+    nome = 'google'
+
+    def __init__(self, headers: Optional[Dict] = None, timeout: float = 10):
+        self.headers = headers or {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+        }
+        self.timeout = timeout
+
+    @staticmethod
+    def extrair_resultados(html, max_resultados: int = 5) -> List[Dict]:
+        """
+        Extrai os resultados de uma página de busca do Google.
+        """
+        soup = BeautifulSoup(html, 'html.parser')
+        resultados = []
+        for g in soup.find_all('div', class_='g')[:max_resultados]:
+            titulo = g.find('h3')
+            link = g.find('a')
+            snippet = g.find('div', class_=['VwiC3b', 'yXK7lf'])
+            if not (titulo and link and link.get('href')):
+                continue
+            url = link.get('href')
+            if url.startswith('/url?'):
+                # Link de redirecionamento: a URL real está em ?q=
+                url = parse_qs(urlparse(url).query).get('q', [url])[0]
+            resultados.append({
+                'title': titulo.get_text(),
+                'url': url,
+                'snippet': snippet.get_text() if snippet else ""
+            })
+        return resultados
+
+    def buscar(self, query: str, max_resultados: int = 5) -> List[Dict]:
+        url = f"https://www.google.com/search?q={requests.utils.quote(query)}"
+        response = obter_transporte().get(url, headers=self.headers, timeout=self.timeout)
+        response.raise_for_status()
+        return self.extrair_resultados(response.content, max_resultados)
+
+
+class ProvedorFixture(ProvedorBusca):
+    """
+    Resultados salvos numa pasta local, sem acesso à rede.
+
+    A consulta é casada pela forma normalizada; sem correspondência exata,
+    usa a fixture com mais palavras em comum (ou nenhuma, se não houver).
+    """
+
+    nome = 'fixture'
+
+    def __init__(self, pasta: str, url_paginas: Optional[str] = None):
+        """
+        Args:
+            pasta: Pasta com arquivos .json e .html de resultados
+            url_paginas: Base para resolver URLs relativas dos resultados
+        """
+        self.pasta = pasta
+        self.url_paginas = url_paginas
+        self._fixtures: Optional[Dict[str, List[Dict]]] = None
+        self._lock = threading.Lock()
+
+    @property
+    def identificador(self) -> str:
+        return f"{self.nome}:{os.path.abspath(self.pasta)}"
+
+    def _carregar(self) -> Dict[str, List[Dict]]:
+        with self._lock:
+            if self._fixtures is not None:
+                return self._fixtures
+            fixtures = {}
+            for nome in sorted(os.listdir(self.pasta)):
+                caminho = os.path.join(self.pasta, nome)
+                base, extensao = os.path.splitext(nome)
+                try:
+                    if extensao == '.json':
+                        with open(caminho, encoding='utf-8') as f:
+                            dados = json.load(f)
+                        fixtures[normalizar_query(dados.get('query', base))] = dados.get('resultados', [])
+                    elif extensao in ('.html', '.htm'):
+                        with open(caminho, 'rb') as f:
+                            fixtures[normalizar_query(base.replace('_', ' '))] = \
+                                ProvedorGoogle.extrair_resultados(f.read(), max_resultados=100)
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Fixture de busca inválida {caminho}: {e}")
+            self._fixtures = fixtures
+            return fixtures
+
+    def _resolver(self, resultado: Dict) -> Dict:
+        url = resultado.get('url', '')
+        if self.url_paginas and not urlparse(url).scheme:
+            url = urljoin(self.url_paginas.rstrip('/') + '/', url)
+        return {'title': resultado.get('title', ''), 'url': url, 'snippet': resultado.get('snippet', '')}
+
+    def buscar(self, query: str, max_resultados: int = 5) -> List[Dict]:
+        fixtures = self._carregar()
+        chave = normalizar_query(query)
+        resultados = fixtures.get(chave)
+        if resultados is None:
+            palavras = set(chave.split())
+            melhor, comum = None, 0
+            for outra, itens in fixtures.items():
+                em_comum = len(palavras & set(outra.split()))
+                if em_comum > comum:
+                    melhor, comum = itens, em_comum
+            resultados = melhor or []
+        return [self._resolver(r) for r in resultados[:max_resultados]]
+
+
+class BuscaMultipla:
+    """
+    Consulta vários provedores em paralelo e funde os resultados.
+    """
+
+    def __init__(self, provedores: Sequence[ProvedorBusca], timeout: float = 10):
+        """
+        Args:
+            provedores: Provedores consultados a cada busca
+            timeout: Espera máxima (s) pelos provedores; os atrasados são ignorados
+        """
+        self.provedores = list(provedores)
+        self.timeout = timeout
+
+    @property
+    def assinatura(self) -> str:
+        """Provedores consultados, em ordem estável (ex.: "fixture:/dados,google")"""
+        return ','.join(sorted(provedor.identificador for provedor in self.provedores))
+
+    def buscar(self, query: str, max_resultados: int = 5) -> List[Dict]:
+        """
+        Resultados fundidos por reciprocal rank fusion, sem URLs repetidas.
+        """
+        if len(self.provedores) == 1:
+            # Sem threads, mas pela fusão: um provedor também repete URLs
+            # (www, utm_*, barra final)
+            return self.fundir([self._consultar(self.provedores[0], query, max_resultados)], max_resultados)
+
+        rankings = []
+        executor = ThreadPoolExecutor(max_workers=len(self.provedores))
+        futuros = [executor.submit(self._consultar, p, query, max_resultados) for p in self.provedores]
+        try:
+            for futuro in as_completed(futuros, timeout=self.timeout):
+                rankings.append(futuro.result())
+        except FuturesTimeout:
+            logger.warning(f"Provedores de busca sem resposta em {self.timeout}s foram ignorados")
+        finally:
+            executor.shutdown(wait=False)
+        return self.fundir(rankings, max_resultados)
+
+    @staticmethod
+    def _consultar(provedor: ProvedorBusca, query: str, max_resultados: int) -> List[Dict]:
+        try:
+            return provedor.buscar(query, max_resultados)
+        except Exception as e:
+            logger.error(f"Erro no provedor de busca {provedor.nome}: {e}")
+            return []
+
+    @staticmethod
+    def fundir(rankings: Sequence[List[Dict]], max_resultados: int = 5) -> List[Dict]:
+        """
+        Junta rankings de provedores diferentes, somando 1/(RRF_K + posição).
+
+        URLs equivalentes viram um único resultado, com o snippet mais longo.
+        """
+        pontuacoes: Dict[str, float] = {}
+        melhores: Dict[str, Dict] = {}
+        for ranking in rankings:
+            for posicao, resultado in enumerate(ranking, 1):
+                if not resultado.get('url'):
+                    continue
+                chave = normalizar_url(resultado['url'])
+                pontuacoes[chave] = pontuacoes.get(chave, 0.0) + 1.0 / (RRF_K + posicao)
+                atual = melhores.get(chave)
+                if atual is None:
+                    melhores[chave] = dict(resultado)
+                elif len(resultado.get('snippet', '')) > len(atual.get('snippet', '')):
+                    atual['snippet'] = resultado['snippet']
+        ordem = sorted(pontuacoes, key=lambda chave: pontuacoes[chave], reverse=True)
+        return [melhores[chave] for chave in ordem[:max_resultados]]
+
+
+def provedores_padrao(headers: Optional[Dict] = None) -> List[ProvedorBusca]:
+    """
+    Provedores configurados em APEX_BUSCA_PROVEDORES (separados por vírgula):
+    "google" e/ou "fixture:<pasta>". Padrão: google.
+    """
+    provedores: List[ProvedorBusca] = []
+    for item in os.getenv('APEX_BUSCA_PROVEDORES', 'google').split(','):
+        item = item.strip()
+        if item == 'google':
+            provedores.append(ProvedorGoogle(headers))
+        elif item.startswith('fixture:'):
+            provedores.append(ProvedorFixture(item[len('fixture:'):], os.getenv('APEX_BUSCA_FIXTURE_URL') or None))
+        elif item:
+            logger.warning(f"Provedor de busca desconhecido: {item}")
+    return provedores or [ProvedorGoogle(headers)]
+
+
+class _ManipuladorSilencioso(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class ServidorPaginasFixture:
+    """
+    Serve uma pasta de páginas salvas por HTTP local (para extrair_conteudo).
+
+    Exemplo:
+        with ServidorPaginasFixture('fixtures/busca') as servidor:
+            busca = APEXWebSearch(provedores=[ProvedorFixture('fixtures/busca', servidor.url_base)])
+    """
+
+    def __init__(self, pasta: str, porta: int = 0):
+        self.pasta = pasta
+        self.porta = porta
+        self._servidor: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def url_base(self) -> str:
+        return f"http://127.0.0.1:{self._servidor.server_port}"
+
+    def iniciar(self) -> 'ServidorPaginasFixture':
+        """Sobe o servidor numa thread em segundo plano"""
+        manipulador = partial(_ManipuladorSilencioso, directory=self.pasta)
+        self._servidor = ThreadingHTTPServer(('127.0.0.1', self.porta), manipulador)
+        self._servidor.daemon_threads = True
+        threading.Thread(target=self._servidor.serve_forever, daemon=True).start()
+        return self
+
+    def parar(self):
+        """Encerra o servidor"""
+        if self._servidor is not None:
+            self._servidor.shutdown()
+            self._servidor.server_close()
+            self._servidor = None
+
+    def __enter__(self):
+        return self.iniciar()
+
+    def __exit__(self, *exc):
+        self.parar()
+        return False
@@ -0,0 +1,118 @@
+"""apex_singleflight.py - Deduplicação de chamadas idênticas simultâneas
+
+Quando várias threads (ou tarefas asyncio) pedem a mesma coisa ao mesmo
+tempo, só a primeira executa a chamada; as demais esperam e recebem o
+mesmo resultado (ou a mesma exceção).
+"""
+
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict
+
+
+class _Chamada:
+    """Chamada em andamento compartilhada entre threads"""
+    __slots__ = ('evento', 'resultado', 'erro', 'aguardando')
+
+    def __init__(self):
+        self.evento = threading.Event()
+        self.resultado = None
+        self.erro = None
+        self.aguardando = 0
+
+
+class SingleFlight:
+    """
+    Agrupa chamadas concorrentes com a mesma chave numa única execução.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._em_andamento: Dict[str, _Chamada] = {}
+        self._em_andamento_async: Dict[Any, Dict[str, asyncio.Future]] = {}
+        self.executadas = 0
+        self.colapsadas = 0
+
+    def executar(self, chave: str, funcao: Callable[[], Any]) -> Any:
+        """
+        Executa `funcao` uma vez por chave entre as threads concorrentes.
+
+        Args:
+            chave: Identificador da requisição (ex.: chave_cache)
+            funcao: Função sem argumentos que faz a chamada real
+
+        Returns:
+            Resultado da execução compartilhada
+        """
+        with self._lock:
+            chamada = self._em_andamento.get(chave)
+            if chamada is not None:
+                chamada.aguardando += 1
+                self.colapsadas += 1
+                lider = False
+            else:
+                chamada = _Chamada()
+                self._em_andamento[chave] = chamada
+                self.executadas += 1
+                lider = True
+
+        if not lider:
+            chamada.evento.wait()
+            if chamada.erro is not None:
+                raise chamada.erro
+            return chamada.resultado
+
+        try:
+            chamada.resultado = funcao()
+        except BaseException as e:
+            chamada.erro = e
+            raise
+        finally:
+            with self._lock:
+                del self._em_andamento[chave]
+            chamada.evento.set()
+        return chamada.resultado
+
+    async def executar_async(self, chave: str, funcao: Callable[[], Awaitable]) -> Any:
+        """
+        Versão asyncio de `executar`, por event loop.
+
+        Args:
+            chave: Identificador da requisição
+            funcao: Função sem argumentos que retorna o awaitable real
+        """
+        loop = asyncio.get_running_loop()
+        pendentes = self._em_andamento_async.setdefault(loop, {})
+
+        futuro = pendentes.get(chave)
+        if futuro is not None:
+            self.colapsadas += 1
+            return await asyncio.shield(futuro)
+
+        futuro = loop.create_future()
+        pendentes[chave] = futuro
+        self.executadas += 1
+        try:
+            resultado = await funcao()
+        except BaseException as e:
+            if not futuro.cancelled():
+                futuro.set_exception(e)
+                # Evita o aviso "exception was never retrieved" sem seguidores
+                futuro.exception()
+            raise
+        else:
+            futuro.set_result(resultado)
+            return resultado
+        finally:
+            del pendentes[chave]
+            if not pendentes:
+                self._em_andamento_async.pop(loop, None)
+
+    def estatisticas(self) -> Dict:
+        """Retorna quantas chamadas foram executadas e quantas colapsadas"""
+        with self._lock:
+            return {
+                'executadas': self.executadas,
+                'colapsadas': self.colapsadas,
+                'em_andamento': len(self._em_andamento)
+            }
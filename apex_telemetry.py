@@ -0,0 +1,415 @@
+"""apex_telemetry.py - Telemetria das chamadas ao LLM (formato Prometheus)
+
+Registra, por chamada à Perplexity: latência, tempo até o primeiro token,
+tokens de prompt/resposta, status HTTP e o módulo que originou a chamada.
+O registro é um incremento de contadores sob um único lock (~1µs), então
+pode ficar no caminho quente.
+
+O dashboard roda em outro processo, então cada processo que chama o LLM
+grava de tempos em tempos (e na saída) um retrato dos seus contadores em
+`APEX_METRICAS_DIR/<pid>-<início>-<n>.json`. A gravação roda numa thread
+daemon, fora do caminho quente, que também renova o arquivo enquanto o
+processo vive; retratos parados há `EXPIRACAO_RETRATO` são de processos
+encerrados e entram em `agregado.json`, para a pasta não crescer. `exportar_prometheus()` soma os
+retratos da pasta e gera o texto servido em `/metrics`; sem a variável,
+exporta só o registro do próprio processo.
+"""
+
+import os
+import json
+import time
+import atexit
+import itertools
+import logging
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Limites (s) dos buckets dos histogramas
+BUCKETS_LATENCIA = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0)
+BUCKETS_TTFT = (0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 2.0, 5.0, 10.0)
+# Segundos entre gravações do retrato do processo na pasta compartilhada
+INTERVALO_GRAVACAO = 5.0
+# Segundos sem renovação para um retrato ser considerado de processo encerrado
+EXPIRACAO_RETRATO = 600.0
+# Soma dos retratos de processos encerrados
+ARQUIVO_AGREGADO = 'agregado.json'
+# Numera os registros criados no processo (nome do arquivo do retrato)
+_registros = itertools.count()
+
+# Módulo "chamador" atual; sobrepõe o padrão do cliente (ex.: TutorIdiomas)
+_origem_atual: 'ContextVar[Optional[str]]' = ContextVar('apex_origem', default=None)
+
+
+@contextmanager
+def origem(nome: str):
+    """
+    Marca as chamadas feitas dentro do bloco como vindas de `nome`.
+    """
+    token = _origem_atual.set(nome)
+    try:
+        yield
+    finally:
+        _origem_atual.reset(token)
+
+
+def origem_atual(padrao: str) -> str:
+    """Origem ativa no contexto atual, ou `padrao`"""
+    return _origem_atual.get() or padrao
+
+
+def diretorio_metricas() -> Optional[str]:
+    """Pasta compartilhada entre os processos (APEX_METRICAS_DIR; vazio = só em memória)"""
+    return os.getenv('APEX_METRICAS_DIR') or None
+
+
+class _Histograma:
+    __slots__ = ('limites', 'contagens', 'soma', 'total')
+
+    def __init__(self, limites: Tuple[float, ...]):
+        self.limites = limites
+        self.contagens = [0] * (len(limites) + 1)
+        self.soma = 0.0
+        self.total = 0
+
+    def observar(self, valor: float):
+        self.contagens[bisect_left(self.limites, valor)] += 1
+        self.soma += valor
+        self.total += 1
+
+    def estado(self) -> dict:
+        return {'contagens': list(self.contagens), 'soma': self.soma, 'total': self.total}
+
+    def mesclar(self, estado: dict):
+        if len(estado['contagens']) != len(self.contagens):
+            return
+        for i, contagem in enumerate(estado['contagens']):
+            self.contagens[i] += contagem
+        self.soma += estado['soma']
+        self.total += estado['total']
+
+
+class MetricasLLM:
+    """
+    Registro em memória das métricas de chamadas ao LLM.
+    """
+
+    def __init__(self, compartilhar: bool = False, intervalo_gravacao: float = INTERVALO_GRAVACAO):
+        """
+        Args:
+            compartilhar: Grava retratos na pasta de `diretorio_metricas()`
+                para o dashboard (só o registro global do processo)
+            intervalo_gravacao: Segundos entre gravações da thread de fundo
+        """
+        self._lock = threading.Lock()
+        self._requisicoes: Dict[Tuple[str, str, str], int] = {}
+        self._tokens: Dict[Tuple[str, str], int] = {}
+        self._latencia: Dict[str, _Histograma] = {}
+        self._ttft: Dict[str, _Histograma] = {}
+        self.compartilhar = compartilhar
+        self.intervalo_gravacao = intervalo_gravacao
+        self._gravando = threading.Lock()
+        # Há registros ainda não gravados; a thread de fundo só grava se houver
+        self._pendente = False
+        self._gravador: Optional[threading.Thread] = None
+        self._nome_arquivo = self._novo_nome_arquivo()
+
+    @staticmethod
+    def _novo_nome_arquivo() -> str:
+        # Um arquivo por registro e execução: um pid reaproveitado não
+        # sobrescreve os totais de um processo que já terminou
+        return f"{os.getpid()}-{int(time.time() * 1000)}-{next(_registros)}.json"
+
+    def _iniciar_gravador(self):
+        with self._lock:
+            if self._gravador is None:
+                self._gravador = threading.Thread(
+                    target=self._laco_gravacao, name='apex-telemetria', daemon=True
+                )
+                self._gravador.start()
+
+    def _laco_gravacao(self):
+        while True:
+            time.sleep(self.intervalo_gravacao)
+            if self._pendente:
+                self._pendente = False
+                self.gravar()
+            else:
+                self._renovar()
+
+    def _renovar(self):
+        """Marca o retrato como de um processo vivo, sem regravá-lo"""
+        diretorio = diretorio_metricas()
+        if diretorio is None:
+            return
+        try:
+            os.utime(os.path.join(diretorio, self._nome_arquivo))
+        except OSError:
+            pass
+
+    def _apos_fork(self):
+        """No filho: sem a thread do pai, contadores zerados e arquivo próprio"""
+        self._lock = threading.Lock()
+        self._gravando = threading.Lock()
+        self._gravador = None
+        self._pendente = False
+        self._nome_arquivo = self._novo_nome_arquivo()
+        self.limpar()
+
+    def registrar(
+        self,
+        origem_padrao: str,
+        modelo: str,
+        status,
+        latencia: float,
+        ttft: Optional[float] = None,
+        tokens_prompt: Optional[int] = 0,
+        tokens_resposta: Optional[int] = 0
+    ):
+        """
+        Registra uma chamada concluída.
+
+        Args:
+            origem_padrao: Módulo que fez a chamada (se nenhum `origem()` ativo)
+            modelo: Modelo usado
+            status: Código HTTP ou rótulo do erro (ex.: 'erro_rede')
+            latencia: Duração total (s), incluindo retentativas
+            ttft: Tempo até o primeiro token (s), em streaming
+            tokens_prompt: Tokens do prompt informados pela API
+            tokens_resposta: Tokens gerados informados pela API
+        """
+        rotulo = origem_atual(origem_padrao)
+        chave = (rotulo, modelo, str(status))
+        with self._lock:
+            self._requisicoes[chave] = self._requisicoes.get(chave, 0) + 1
+            hist = self._latencia.get(rotulo)
+            if hist is None:
+                hist = self._latencia[rotulo] = _Histograma(BUCKETS_LATENCIA)
+            hist.observar(latencia)
+            if ttft is not None:
+                hist = self._ttft.get(rotulo)
+                if hist is None:
+                    hist = self._ttft[rotulo] = _Histograma(BUCKETS_TTFT)
+                hist.observar(ttft)
+            if tokens_prompt:
+                chave_tokens = (rotulo, 'prompt')
+                self._tokens[chave_tokens] = self._tokens.get(chave_tokens, 0) + tokens_prompt
+            if tokens_resposta:
+                chave_tokens = (rotulo, 'resposta')
+                self._tokens[chave_tokens] = self._tokens.get(chave_tokens, 0) + tokens_resposta
+        if self.compartilhar:
+            self._pendente = True
+            if self._gravador is None:
+                self._iniciar_gravador()
+
+    def limpar(self):
+        """Zera todas as métricas"""
+        with self._lock:
+            self._requisicoes.clear()
+            self._tokens.clear()
+            self._latencia.clear()
+            self._ttft.clear()
+
+    def estado(self) -> dict:
+        """Retrato serializável (JSON) dos contadores"""
+        with self._lock:
+            return {
+                'requisicoes': [[*chave, total] for chave, total in self._requisicoes.items()],
+                'tokens': [[*chave, total] for chave, total in self._tokens.items()],
+                'latencia': {rotulo: hist.estado() for rotulo, hist in self._latencia.items()},
+                'ttft': {rotulo: hist.estado() for rotulo, hist in self._ttft.items()},
+            }
+
+    def mesclar(self, estado: dict):
+        """Soma um retrato (de `estado()`) aos contadores"""
+        with self._lock:
+            for rotulo, modelo, status, total in estado.get('requisicoes', []):
+                chave = (rotulo, modelo, status)
+                self._requisicoes[chave] = self._requisicoes.get(chave, 0) + total
+            for rotulo, tipo, total in estado.get('tokens', []):
+                self._tokens[(rotulo, tipo)] = self._tokens.get((rotulo, tipo), 0) + total
+            for nome, histogramas, limites in (
+                ('latencia', self._latencia, BUCKETS_LATENCIA), ('ttft', self._ttft, BUCKETS_TTFT)
+            ):
+                for rotulo, hist in estado.get(nome, {}).items():
+                    if rotulo not in histogramas:
+                        histogramas[rotulo] = _Histograma(limites)
+                    histogramas[rotulo].mesclar(hist)
+
+    def gravar(self):
+        """Grava o retrato do processo na pasta compartilhada (se configurada)"""
+        diretorio = diretorio_metricas()
+        if diretorio is None or not self._gravando.acquire(blocking=False):
+            return
+        try:
+            os.makedirs(diretorio, exist_ok=True)
+            _gravar_json(os.path.join(diretorio, self._nome_arquivo), self.estado())
+        except OSError as e:
+            logger.warning(f"Não foi possível gravar as métricas em {diretorio}: {e}")
+        finally:
+            self._gravando.release()
+
+    @staticmethod
+    def _escapar(valor: str) -> str:
+        return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    def _linhas_histograma(self, nome: str, ajuda: str, histogramas: Dict[str, _Histograma]):
+        linhas = [f"# HELP {nome} {ajuda}", f"# TYPE {nome} histogram"]
+        for rotulo, hist in sorted(histogramas.items()):
+            origem_rotulo = f'origem="{self._escapar(rotulo)}"'
+            acumulado = 0
+            for limite, contagem in zip(hist.limites, hist.contagens):
+                acumulado += contagem
+                linhas.append(f'{nome}_bucket{{{origem_rotulo},le="{limite}"}} {acumulado}')
+            linhas.append(f'{nome}_bucket{{{origem_rotulo},le="+Inf"}} {hist.total}')
+            linhas.append(f'{nome}_sum{{{origem_rotulo}}} {hist.soma:.6f}')
+            linhas.append(f'{nome}_count{{{origem_rotulo}}} {hist.total}')
+        return linhas
+
+    def exportar_prometheus(self) -> str:
+        """
+        Gera as métricas no formato de exposição de texto do Prometheus.
+        """
+        with self._lock:
+            linhas = [
+                "# HELP apex_llm_requisicoes_total Chamadas ao LLM por origem, modelo e status.",
+                "# TYPE apex_llm_requisicoes_total counter"
+            ]
+            for (rotulo, modelo, status), total in sorted(self._requisicoes.items()):
+                linhas.append(
+                    f'apex_llm_requisicoes_total{{origem="{self._escapar(rotulo)}",'
+                    f'modelo="{self._escapar(modelo)}",status="{self._escapar(status)}"}} {total}'
+                )
+
+            linhas += [
+                "# HELP apex_llm_tokens_total Tokens consumidos por origem e tipo.",
+                "# TYPE apex_llm_tokens_total counter"
+            ]
+            for (rotulo, tipo), total in sorted(self._tokens.items()):
+                linhas.append(f'apex_llm_tokens_total{{origem="{self._escapar(rotulo)}",tipo="{tipo}"}} {total}')
+
+            linhas += self._linhas_histograma(
+                'apex_llm_latencia_segundos', 'Latência total das chamadas ao LLM.', self._latencia
+            )
+            linhas += self._linhas_histograma(
+                'apex_llm_ttft_segundos', 'Tempo até o primeiro token (streaming).', self._ttft
+            )
+        return '\n'.join(linhas) + '\n'
+
+
+def _gravar_json(arquivo: str, estado: dict):
+    temporario = arquivo + '.tmp'
+    with open(temporario, 'w', encoding='utf-8') as f:
+        json.dump(estado, f)
+    os.replace(temporario, arquivo)
+
+
+def _ler_json(arquivo: str) -> dict:
+    with open(arquivo, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def agregar_retratos_antigos(diretorio: str, expiracao: float = EXPIRACAO_RETRATO) -> int:
+    """
+    Soma os retratos não renovados há `expiracao` segundos em `agregado.json`
+    e os apaga.
+
+    Um arquivo de trava impede que dois dashboards agreguem ao mesmo tempo
+    (o que contaria os retratos duas vezes); uma trava mais velha que
+    `expiracao` é de um agregador que morreu e é descartada.
+
+    Returns:
+        Quantos retratos foram agregados
+    """
+    trava = os.path.join(diretorio, 'agregado.lock')
+    try:
+        os.close(os.open(trava, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        try:
+            if time.time() - os.path.getmtime(trava) > expiracao:
+                os.remove(trava)
+        except OSError:
+            pass
+        return 0
+    except OSError:
+        return 0
+
+    try:
+        limite = time.time() - expiracao
+        antigos = []
+        for nome in os.listdir(diretorio):
+            if not nome.endswith('.json') or nome == ARQUIVO_AGREGADO:
+                continue
+            try:
+                if os.path.getmtime(os.path.join(diretorio, nome)) < limite:
+                    antigos.append(nome)
+            except OSError:
+                pass
+        if not antigos:
+            return 0
+
+        agregado = MetricasLLM()
+        arquivo_agregado = os.path.join(diretorio, ARQUIVO_AGREGADO)
+        if os.path.exists(arquivo_agregado):
+            agregado.mesclar(_ler_json(arquivo_agregado))
+        for nome in antigos:
+            try:
+                agregado.mesclar(_ler_json(os.path.join(diretorio, nome)))
+            except ValueError as e:
+                logger.warning(f"Retrato de métricas descartado ({nome}): {e}")
+        # Grava a soma antes de apagar: uma falha no meio repete contagens em
+        # vez de perdê-las
+        _gravar_json(arquivo_agregado, agregado.estado())
+        for nome in antigos:
+            os.remove(os.path.join(diretorio, nome))
+        return len(antigos)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Não foi possível agregar as métricas de {diretorio}: {e}")
+        return 0
+    finally:
+        try:
+            os.remove(trava)
+        except OSError:
+            pass
+
+
+metricas = MetricasLLM(compartilhar=True)
+atexit.register(metricas.gravar)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=metricas._apos_fork)
+
+
+def registrar(*args, **kwargs):
+    """Atalho para `metricas.registrar` no registro global do processo"""
+    metricas.registrar(*args, **kwargs)
+
+
+def exportar_prometheus() -> str:
+    """
+    Métricas de todos os processos que gravaram na pasta compartilhada, ou
+    só as do registro global se APEX_METRICAS_DIR não estiver definida.
+    """
+    diretorio = diretorio_metricas()
+    if diretorio is None:
+        return metricas.exportar_prometheus()
+    metricas.gravar()
+    agregar_retratos_antigos(diretorio)
+    total = MetricasLLM()
+    try:
+        nomes = sorted(os.listdir(diretorio))
+    except OSError:
+        nomes = []
+    for nome in nomes:
+        if not nome.endswith('.json'):
+            continue
+        try:
+            total.mesclar(_ler_json(os.path.join(diretorio, nome)))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Retrato de métricas ignorado ({nome}): {e}")
+    return total.exportar_prometheus()
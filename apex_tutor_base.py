@@ -0,0 +1,47 @@
+"""apex_tutor_base.py - Base comum dos tutores com IA"""
+import inspect
+from typing import Any, Callable, Optional
+
+from apex_telemetry import origem
+
+
+class TutorBase:
+    """
+    Base dos tutores: guarda o cliente LLM e centraliza a chamada ao modelo.
+
+    Aceita tanto o APEXLLMClient quanto o AsyncAPEXLLMClient. Com o cliente
+    assíncrono, os métodos do tutor devolvem corrotinas, que podem ser
+    executadas em lote com `cliente.gather(...)`.
+    """
+    def __init__(self, llm_client, ao_token: Optional[Callable[[str], None]] = None):
+        """
+        Args:
+            llm_client: Cliente com `gerar_resposta` (ex.: APEXLLMClient)
+            ao_token: Callback opcional; ativa o streaming e recebe cada delta
+        """
+        self.llm = llm_client
+        self.ao_token = ao_token
+    
+    def _gerar(self, prompt: str, pos: Optional[Callable[[str], Any]] = None):
+        """
+        Gera a resposta, em streaming quando `ao_token` estiver definido.
+        
+        Args:
+            prompt: Prompt enviado ao modelo
+            pos: Pós-processamento aplicado ao texto gerado
+        """
+        # Métricas do LLM contabilizadas em nome do tutor (ex.: TutorIdiomas)
+        with origem(type(self).__name__):
+            if self.ao_token:
+                resultado = self.llm.gerar_resposta(prompt, ao_token=self.ao_token)
+            else:
+                resultado = self.llm.gerar_resposta(prompt)
+        
+        if inspect.isawaitable(resultado):
+            return self._aguardar(resultado, pos)
+        return pos(resultado) if pos else resultado
+    
+    async def _aguardar(self, resultado, pos):
+        with origem(type(self).__name__):
+            texto = await resultado
+        return pos(texto) if pos else texto
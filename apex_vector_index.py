@@ -0,0 +1,237 @@
+"""apex_vector_index.py - Índice vetorial leve (CPU) para recall semântico
+
+Os textos viram vetores de n-gramas de caracteres com hashing (sem modelo
+nem GPU): perguntas com a mesma redação, erros de digitação ou pequenas
+variações ficam próximas no cosseno. Os vetores ficam numa matriz float32
+mapeada em memória (`<base>.f32`) com os ids em `<base>.ids`, e novos
+itens são apenas anexados. A busca multiplica as consultas pela matriz em
+blocos com NumPy e seleciona o top-k com `argpartition`.
+
+Cada vetor pode ter um grupo inteiro (`<base>.grp`, ex.: a sessão dona da
+conversa); a busca restrita a um grupo descarta os demais antes do top-k.
+"""
+
+import os
+import json
+import zlib
+import logging
+import threading
+import unicodedata
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DIMENSAO_PADRAO = 512
+# Formato dos arquivos; índices de versões anteriores são recriados
+VERSAO_FORMATO = 2
+# Grupo dos vetores removidos: nunca aparecem nas buscas
+GRUPO_REMOVIDO = -1
+# Linhas da matriz processadas por vez na busca (limita a memória temporária)
+BLOCO_BUSCA = 65536
+
+
+def _normalizar(texto: str) -> str:
+    texto = unicodedata.normalize('NFKD', texto.lower())
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return ' '.join(texto.split())
+
+
+def vetorizar(texto: str, dimensao: int = DIMENSAO_PADRAO, tamanhos: Tuple[int, ...] = (3, 4)) -> np.ndarray:
+    """
+    Vetor L2-normalizado dos n-gramas de caracteres do texto.
+
+    Cada n-grama cai numa posição pelo CRC32 (estável entre processos) e
+    soma +1 ou -1 conforme um bit do hash, o que reduz o viés das colisões.
+    """
+    vetor = np.zeros(dimensao, dtype=np.float32)
+    texto = f" {_normalizar(texto)} "
+    for n in tamanhos:
+        for i in range(len(texto) - n + 1):
+            h = zlib.crc32(texto[i:i + n].encode('utf-8'))
+            vetor[h % dimensao] += 1.0 if (h >> 31) & 1 else -1.0
+    norma = np.linalg.norm(vetor)
+    if norma:
+        vetor /= norma
+    return vetor
+
+
+def vetorizar_lote(textos: Sequence[str], dimensao: int = DIMENSAO_PADRAO) -> np.ndarray:
+    """Matriz (len(textos), dimensao) com um vetor por texto"""
+    matriz = np.zeros((len(textos), dimensao), dtype=np.float32)
+    for i, texto in enumerate(textos):
+        matriz[i] = vetorizar(texto, dimensao)
+    return matriz
+
+
+class IndiceVetorial:
+    """
+    Matriz de vetores em disco (memmap) com busca top-k por cosseno.
+    """
+
+    def __init__(self, caminho_base: str, dimensao: int = DIMENSAO_PADRAO, capacidade_inicial: int = 1024):
+        """
+        Args:
+            caminho_base: Prefixo dos arquivos (.f32, .ids, .grp e .json)
+            dimensao: Tamanho dos vetores (fixado na criação do índice)
+            capacidade_inicial: Linhas reservadas; a capacidade dobra quando enche
+        """
+        self.caminho_base = caminho_base
+        self._lock = threading.RLock()
+        self.total = 0
+        self.dimensao = dimensao
+        self.capacidade = capacidade_inicial
+
+        meta = self._ler_meta()
+        if meta is not None and meta.get('versao') != VERSAO_FORMATO:
+            logger.info(f"Índice vetorial {caminho_base} em formato antigo será recriado")
+            meta = None
+        if meta is not None:
+            self.total = meta['total']
+            self.dimensao = meta['dimensao']
+            self.capacidade = max(meta['capacidade'], self.total, 1)
+        self._mapear()
+
+    @property
+    def _arquivo_meta(self) -> str:
+        return self.caminho_base + '.json'
+
+    def _ler_meta(self) -> Optional[dict]:
+        try:
+            with open(self._arquivo_meta, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _gravar_meta(self):
+        temporario = self._arquivo_meta + '.tmp'
+        with open(temporario, 'w', encoding='utf-8') as f:
+            json.dump({
+                'versao': VERSAO_FORMATO, 'total': self.total,
+                'dimensao': self.dimensao, 'capacidade': self.capacidade
+            }, f)
+        os.replace(temporario, self._arquivo_meta)
+
+    def _mapear(self):
+        """(Re)abre os arquivos com a capacidade atual, criando/estendendo se preciso"""
+        self._vetores = self._abrir(self.caminho_base + '.f32', np.float32, (self.capacidade, self.dimensao))
+        self._ids = self._abrir(self.caminho_base + '.ids', np.int64, (self.capacidade,))
+        self._grupos = self._abrir(self.caminho_base + '.grp', np.int64, (self.capacidade,))
+
+    @staticmethod
+    def _abrir(caminho: str, dtype, forma: Tuple[int, ...]) -> np.memmap:
+        tamanho = int(np.prod(forma)) * np.dtype(dtype).itemsize
+        if not os.path.exists(caminho) or os.path.getsize(caminho) < tamanho:
+            with open(caminho, 'ab') as f:
+                f.truncate(tamanho)
+        return np.memmap(caminho, dtype=dtype, mode='r+', shape=forma)
+
+    def __len__(self) -> int:
+        return self.total
+
+    @property
+    def ultimo_id(self) -> Optional[int]:
+        """Id do item anexado por último (None se vazio)"""
+        with self._lock:
+            return int(self._ids[self.total - 1]) if self.total else None
+
+    def _flush(self):
+        self._vetores.flush()
+        self._ids.flush()
+        self._grupos.flush()
+
+    def adicionar_lote(self, ids: Sequence[int], textos: Sequence[str], grupos: Optional[Sequence[int]] = None):
+        """Vetoriza e anexa os textos com seus ids (e grupos; padrão 0)"""
+        if not len(ids):
+            return
+        self.anexar(ids, vetorizar_lote(textos, self.dimensao), grupos)
+
+    def anexar(self, ids: Sequence[int], vetores: np.ndarray, grupos: Optional[Sequence[int]] = None):
+        """Anexa vetores já calculados (ex.: com `vetorizar_lote` fora de um lock)"""
+        if not len(ids):
+            return
+        with self._lock:
+            necessario = self.total + len(ids)
+            if necessario > self.capacidade:
+                self._flush()
+                while self.capacidade < necessario:
+                    self.capacidade *= 2
+                self._mapear()
+            self._vetores[self.total:necessario] = vetores
+            self._ids[self.total:necessario] = np.asarray(ids, dtype=np.int64)
+            self._grupos[self.total:necessario] = np.asarray(grupos if grupos is not None else 0, dtype=np.int64)
+            self._flush()
+            # Os metadados só avançam depois dos dados gravados
+            self.total = necessario
+            self._gravar_meta()
+
+    def adicionar(self, id: int, texto: str, grupo: int = 0):
+        """Anexa um único texto"""
+        self.adicionar_lote([id], [texto], [grupo])
+
+    def buscar_lote(
+        self,
+        textos: Sequence[str],
+        k: int = 5,
+        grupo: Optional[int] = None
+    ) -> List[List[Tuple[int, float]]]:
+        """
+        Top-k por similaridade de cosseno para várias consultas de uma vez.
+
+        Com `grupo`, só vetores desse grupo concorrem (o top-k pode ter menos
+        de k itens se o grupo for pequeno).
+
+        Returns:
+            Para cada consulta, lista de (id, similaridade) em ordem decrescente
+        """
+        consultas = vetorizar_lote(textos, self.dimensao)
+        with self._lock:
+            total = self.total
+            if not total:
+                return [[] for _ in textos]
+            melhores_sim = np.full((len(textos), 0), -np.inf, dtype=np.float32)
+            melhores_pos = np.zeros((len(textos), 0), dtype=np.int64)
+            for inicio in range(0, total, BLOCO_BUSCA):
+                fim = min(total, inicio + BLOCO_BUSCA)
+                similaridades = consultas @ self._vetores[inicio:fim].T
+                grupos = self._grupos[inicio:fim]
+                if grupo is not None:
+                    similaridades[:, grupos != grupo] = -np.inf
+                else:
+                    similaridades[:, grupos == GRUPO_REMOVIDO] = -np.inf
+                quantos = min(k, fim - inicio)
+                posicoes = np.argpartition(-similaridades, quantos - 1, axis=1)[:, :quantos]
+                melhores_sim = np.concatenate(
+                    [melhores_sim, np.take_along_axis(similaridades, posicoes, axis=1)], axis=1
+                )
+                melhores_pos = np.concatenate([melhores_pos, posicoes + inicio], axis=1)
+            ordem = np.argsort(-melhores_sim, axis=1)[:, :k]
+            ids = self._ids[:total]
+            return [
+                [
+                    (int(ids[melhores_pos[q, j]]), float(melhores_sim[q, j]))
+                    for j in ordem[q] if melhores_sim[q, j] > -np.inf
+                ]
+                for q in range(len(textos))
+            ]
+
+    def remover(self, ids: Sequence[int]):
+        """Marca os vetores desses ids como removidos (o espaço não é liberado)"""
+        if not len(ids):
+            return
+        with self._lock:
+            removidos = np.isin(self._ids[:self.total], np.asarray(ids, dtype=np.int64))
+            if removidos.any():
+                self._grupos[:self.total][removidos] = GRUPO_REMOVIDO
+                self._vetores[:self.total][removidos] = 0
+                self._flush()
+
+    def buscar(self, texto: str, k: int = 5, grupo: Optional[int] = None) -> List[Tuple[int, float]]:
+        """Top-k (id, similaridade) para uma consulta"""
+        return self.buscar_lote([texto], k, grupo)[0]
+
+    def fechar(self):
+        """Grava pendências no disco"""
+        with self._lock:
+            self._flush()
@@ -0,0 +1,310 @@
+"""apex_web_cache.py - Cache persistente da busca web
+
+Guarda em SQLite (apex_web_cache.db, ao lado do apex_memory.db):
+    - Páginas: texto já extraído (não o HTML), comprimido com zlib, junto
+      com `ETag`/`Last-Modified` para revalidar com GET condicional
+    - Buscas: resultados por conjunto de provedores e consulta normalizada
+      ("Python  Async?" e "python async" caem na mesma entrada; "C++",
+      "C#" e "C" não)
+
+Cada tipo tem seu TTL. Páginas expiradas continuam guardadas para a
+revalidação (um 304 renova a entrada sem baixar a página de novo). Acima
+do limite de tamanho saem primeiro as entradas acessadas há mais tempo.
+"""
+
+import os
+import json
+import time
+import zlib
+import sqlite3
+import threading
+import unicodedata
+import logging
+import re
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# "+" e "#" colados na palavra fazem parte dela (C++, C#, F#)
+_RE_PALAVRAS = re.compile(r'\w+[+#]*')
+
+
+def normalizar_query(query: str) -> str:
+    """
+    Normaliza uma consulta: minúsculas, sem acentos, pontuação e espaços extras.
+    """
+    sem_acentos = unicodedata.normalize('NFKD', query.lower())
+    sem_acentos = ''.join(c for c in sem_acentos if not unicodedata.combining(c))
+    return ' '.join(_RE_PALAVRAS.findall(sem_acentos))
+
+
+def _comprimir(texto: str) -> bytes:
+    return zlib.compress(texto.encode('utf-8'), 6)
+
+
+def _descomprimir(dados: bytes) -> str:
+    return zlib.decompress(dados).decode('utf-8')
+
+
+class CacheWeb:
+    """
+    Cache em SQLite de páginas extraídas e resultados de busca.
+    """
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        ttl_paginas: float = 86400,
+        ttl_buscas: float = 3600,
+        max_bytes: int = 100 * 1024 * 1024,
+        ativo: bool = True
+    ):
+        """
+        Args:
+            db_path: Arquivo SQLite (None desativa o cache)
+            ttl_paginas: Validade (s) do texto de uma página antes de revalidar
+            ttl_buscas: Validade (s) dos resultados de uma consulta
+            max_bytes: Tamanho máximo dos dados comprimidos guardados
+            ativo: Liga/desliga o cache
+        """
+        self.db_path = db_path
+        self.ttl_paginas = ttl_paginas
+        self.ttl_buscas = ttl_buscas
+        self.max_bytes = max_bytes
+        self.ativo = ativo and bool(db_path)
+
+        self._lock = threading.RLock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._bytes = 0
+
+        self.contadores = {
+            'hits_paginas': 0,
+            'revalidadas': 0,
+            'misses_paginas': 0,
+            'hits_buscas': 0,
+            'misses_buscas': 0,
+            'gravacoes': 0,
+            'remocoes': 0
+        }
+
+    def _conexao(self) -> sqlite3.Connection:
+        """Abre o SQLite no primeiro uso"""
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.executescript('''
+                CREATE TABLE IF NOT EXISTS paginas_web (
+                    url TEXT PRIMARY KEY,
+                    texto BLOB,
+                    etag TEXT,
+                    modificado TEXT,
+                    tamanho INTEGER,
+                    expira REAL,
+                    acessado REAL
+                );
+                CREATE TABLE IF NOT EXISTS buscas_web (
+                    query TEXT PRIMARY KEY,
+                    resultados BLOB,
+                    tamanho INTEGER,
+                    expira REAL,
+                    acessado REAL
+                );
+                CREATE INDEX IF NOT EXISTS idx_paginas_acessado ON paginas_web (acessado);
+                CREATE INDEX IF NOT EXISTS idx_buscas_acessado ON buscas_web (acessado);
+            ''')
+            self._bytes = self._total_bytes()
+        return self._conn
+
+    def _total_bytes(self) -> int:
+        return self._conn.execute('''
+            SELECT (SELECT COALESCE(SUM(tamanho), 0) FROM paginas_web)
+                 + (SELECT COALESCE(SUM(tamanho), 0) FROM buscas_web)
+        ''').fetchone()[0]
+
+    def obter_pagina(self, url: str) -> Optional[Dict]:
+        """
+        Busca o texto de uma página.
+
+        Returns:
+            Dict com 'texto', 'etag', 'modificado' e 'fresco' (False quando o
+            TTL venceu e a página deve ser revalidada), ou None se ausente
+        """
+        if not self.ativo:
+            return None
+        agora = time.time()
+        with self._lock:
+            conn = self._conexao()
+            linha = conn.execute(
+                'SELECT texto, etag, modificado, expira FROM paginas_web WHERE url = ?', (url,)
+            ).fetchone()
+            if linha is None:
+                self.contadores['misses_paginas'] += 1
+                return None
+            conn.execute('UPDATE paginas_web SET acessado = ? WHERE url = ?', (agora, url))
+            conn.commit()
+            fresco = linha[3] > agora
+            if fresco:
+                self.contadores['hits_paginas'] += 1
+            return {
+                'texto': _descomprimir(linha[0]),
+                'etag': linha[1],
+                'modificado': linha[2],
+                'fresco': fresco
+            }
+
+    def salvar_pagina(
+        self,
+        url: str,
+        texto: str,
+        etag: Optional[str] = None,
+        modificado: Optional[str] = None
+    ):
+        """Guarda o texto extraído de uma página com seus validadores HTTP"""
+        if not self.ativo:
+            return
+        dados = _comprimir(texto)
+        agora = time.time()
+        with self._lock:
+            conn = self._conexao()
+            self._remover('paginas_web', 'url', url)
+            conn.execute(
+                'INSERT INTO paginas_web (url, texto, etag, modificado, tamanho, expira, acessado) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (url, dados, etag, modificado, len(dados), agora + self.ttl_paginas, agora)
+            )
+            self._bytes += len(dados)
+            self.contadores['gravacoes'] += 1
+            self._liberar_espaco()
+            conn.commit()
+
+    def renovar_pagina(self, url: str):
+        """A origem respondeu 304: a página vale por mais um TTL"""
+        if not self.ativo:
+            return
+        agora = time.time()
+        with self._lock:
+            conn = self._conexao()
+            conn.execute(
+                'UPDATE paginas_web SET expira = ?, acessado = ? WHERE url = ?',
+                (agora + self.ttl_paginas, agora, url)
+            )
+            conn.commit()
+            self.contadores['revalidadas'] += 1
+
+    @staticmethod
+    def _chave_busca(query: str, provedores: str) -> str:
+        chave = normalizar_query(query)
+        return f"{provedores}|{chave}" if provedores else chave
+
+    def obter_busca(self, query: str, provedores: str = '') -> Optional[List[Dict]]:
+        """
+        Resultados de uma consulta equivalente ainda válidos, ou None
+
+        `provedores` identifica o conjunto de provedores que gerou os
+        resultados: trocar os provedores não devolve resultados antigos.
+        """
+        if not self.ativo:
+            return None
+        chave = self._chave_busca(query, provedores)
+        agora = time.time()
+        with self._lock:
+            conn = self._conexao()
+            linha = conn.execute(
+                'SELECT resultados, expira FROM buscas_web WHERE query = ?', (chave,)
+            ).fetchone()
+            if linha is None or linha[1] <= agora:
+                self.contadores['misses_buscas'] += 1
+                return None
+            conn.execute('UPDATE buscas_web SET acessado = ? WHERE query = ?', (agora, chave))
+            conn.commit()
+            self.contadores['hits_buscas'] += 1
+            return json.loads(_descomprimir(linha[0]))
+
+    def salvar_busca(self, query: str, resultados: List[Dict], provedores: str = ''):
+        """Guarda os resultados de uma consulta (ver `obter_busca`)"""
+        if not self.ativo:
+            return
+        chave = self._chave_busca(query, provedores)
+        dados = _comprimir(json.dumps(resultados, ensure_ascii=False))
+        agora = time.time()
+        with self._lock:
+            conn = self._conexao()
+            self._remover('buscas_web', 'query', chave)
+            conn.execute(
+                'INSERT INTO buscas_web (query, resultados, tamanho, expira, acessado) VALUES (?, ?, ?, ?, ?)',
+                (chave, dados, len(dados), agora + self.ttl_buscas, agora)
+            )
+            self._bytes += len(dados)
+            self.contadores['gravacoes'] += 1
+            self._liberar_espaco()
+            conn.commit()
+
+    def _remover(self, tabela: str, coluna: str, chave: str):
+        conn = self._conexao()
+        linha = conn.execute(f'SELECT tamanho FROM {tabela} WHERE {coluna} = ?', (chave,)).fetchone()
+        if linha is not None:
+            conn.execute(f'DELETE FROM {tabela} WHERE {coluna} = ?', (chave,))
+            self._bytes -= linha[0]
+
+    def _liberar_espaco(self):
+        """Remove buscas expiradas e depois as entradas menos acessadas até caber"""
+        if self._bytes <= self.max_bytes:
+            return
+        conn = self._conexao()
+        conn.execute('DELETE FROM buscas_web WHERE expira <= ?', (time.time(),))
+        self._bytes = self._total_bytes()
+        cursor = conn.execute('''
+            SELECT 'paginas_web', url, tamanho, acessado FROM paginas_web
+            UNION ALL
+            SELECT 'buscas_web', query, tamanho, acessado FROM buscas_web
+            ORDER BY acessado
+        ''')
+        vitimas = {'paginas_web': [], 'buscas_web': []}
+        while self._bytes > self.max_bytes:
+            linha = cursor.fetchone()
+            if linha is None:
+                break
+            vitimas[linha[0]].append((linha[1],))
+            self._bytes -= linha[2]
+            self.contadores['remocoes'] += 1
+        cursor.close()
+        conn.executemany('DELETE FROM paginas_web WHERE url = ?', vitimas['paginas_web'])
+        conn.executemany('DELETE FROM buscas_web WHERE query = ?', vitimas['buscas_web'])
+
+    def limpar(self):
+        """Remove todas as entradas"""
+        if not self.ativo:
+            return
+        with self._lock:
+            conn = self._conexao()
+            conn.execute('DELETE FROM paginas_web')
+            conn.execute('DELETE FROM buscas_web')
+            conn.commit()
+            self._bytes = 0
+
+    def estatisticas(self) -> Dict:
+        """Retorna contadores de uso e o tamanho ocupado"""
+        with self._lock:
+            return {**self.contadores, 'bytes': self._bytes, 'ativo': self.ativo}
+
+
+_cache_web: Optional[CacheWeb] = None
+_cache_web_lock = threading.Lock()
+
+
+def obter_cache_web() -> CacheWeb:
+    """
+    Retorna o cache web compartilhado do processo, configurado pelo .env.
+    """
+    global _cache_web
+    if _cache_web is None:
+        with _cache_web_lock:
+            if _cache_web is None:
+                pasta = os.path.dirname(os.getenv('DATABASE_PATH', 'apex_memory.db'))
+                _cache_web = CacheWeb(
+                    db_path=os.path.join(pasta, 'apex_web_cache.db'),
+                    ttl_paginas=float(os.getenv('APEX_WEB_CACHE_TTL', '86400')),
+                    ttl_buscas=float(os.getenv('APEX_WEB_CACHE_TTL_BUSCA', '3600')),
+                    max_bytes=int(float(os.getenv('APEX_WEB_CACHE_MAX_MB', '100')) * 1024 * 1024),
+                    ativo=os.getenv('APEX_WEB_CACHE_ATIVO', 'true').lower() in ('1', 'true', 'sim', 'yes')
+                )
+    return _cache_web
@@ -2,11 +2,156 @@
 """Sistema de busca web integrado ao APEX - Funciona como Perplexity"""
 
 import requests
-from bs4 import BeautifulSoup
+import codecs
+import itertools
 import json
-from typing import List, Dict
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout, as_completed
+from typing import Dict, Iterator, List, Optional, Tuple
+from html.parser import HTMLParser
+from urllib.parse import urlparse
 import re
 
+from apex_http import obter_transporte
+from apex_web_cache import CacheWeb, obter_cache_web
+from apex_passage_index import IndicePassagens, Passagem
+from apex_search_providers import BuscaMultipla, ProvedorBusca, provedores_padrao
+
+try:
+    from lxml import etree
+except ImportError:  # pragma: no cover - lxml está no requirements.txt
+    etree = None
+
+# Conteúdo ignorado na extração de texto
+TAGS_IGNORADAS = frozenset(['script', 'style', 'noscript', 'template', 'svg', 'iframe', 'head'])
+# Tags que separam blocos de texto (as demais, como <a> e <b>, são inline)
+TAGS_BLOCO = frozenset([
+    'p', 'div', 'br', 'hr', 'li', 'ul', 'ol', 'dl', 'dt', 'dd', 'table', 'tr', 'td', 'th',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'title', 'section', 'article', 'header', 'footer',
+    'nav', 'aside', 'main', 'blockquote', 'pre', 'form', 'figure', 'figcaption'
+])
+TIPOS_HTML = ('text/html', 'application/xhtml+xml')
+
+
+class _ColetorTexto:
+    """
+    Alvo de parser incremental: junta o texto visível até `max_caracteres`.
+    """
+
+    def __init__(self, max_caracteres: int):
+        self.max_caracteres = max_caracteres
+        self.partes: List[str] = []
+        self.tamanho = 0
+        self._ignorando = 0
+        self._titulo = False
+
+    @property
+    def cheio(self) -> bool:
+        return self.tamanho >= self.max_caracteres
+
+    def start(self, tag, attrib=None):
+        tag = str(tag).lower()
+        if tag == 'title':
+            self._titulo = True
+        elif tag in TAGS_IGNORADAS:
+            self._ignorando += 1
+        if tag in TAGS_BLOCO:
+            self.partes.append(' ')
+
+    def end(self, tag):
+        tag = str(tag).lower()
+        if tag == 'title':
+            self._titulo = False
+        elif tag in TAGS_IGNORADAS and self._ignorando:
+            self._ignorando -= 1
+        if tag in TAGS_BLOCO:
+            self.partes.append(' ')
+
+    def data(self, texto):
+        if (self._ignorando and not self._titulo) or self.cheio:
+            return
+        # O parser pode entregar uma palavra em pedaços: junta sem espaço
+        self.partes.append(texto)
+        self.tamanho += len(texto.strip())
+
+    def close(self) -> str:
+        return ' '.join(''.join(self.partes).split())[:self.max_caracteres]
+
+
+class _ParserPadrao(HTMLParser):
+    """Fallback sem lxml: adapta o HTMLParser da biblioteca padrão ao coletor"""
+
+    def __init__(self, coletor: _ColetorTexto):
+        super().__init__(convert_charrefs=True)
+        self.coletor = coletor
+
+    def handle_starttag(self, tag, attrs):
+        self.coletor.start(tag)
+
+    def handle_endtag(self, tag):
+        self.coletor.end(tag)
+
+    def handle_data(self, data):
+        self.coletor.data(data)
+
+
+_RE_CHARSET = re.compile(rb'charset\s*=\s*["\']?([\w.:-]+)', re.I)
+
+
+def _charset(content_type: str) -> Optional[str]:
+    encontrado = _RE_CHARSET.search((content_type or '').encode('latin-1', 'ignore'))
+    return encontrado.group(1).decode('ascii') if encontrado else None
+
+
+def extrair_texto_html(blocos, max_caracteres: int = 5000, encoding: Optional[str] = None) -> str:
+    """
+    Extrai o texto visível de um HTML recebido em blocos de bytes.
+
+    O parser é incremental e a leitura para assim que `max_caracteres`
+    forem coletados, sem montar a árvore do documento.
+
+    Args:
+        blocos: Iterável de bytes (ex.: `response.iter_content()`)
+        max_caracteres: Tamanho máximo do texto
+        encoding: Charset informado pelo servidor (None = detectar)
+    """
+    blocos = iter(blocos)
+    primeiro = next(blocos, b'')
+    if encoding is None:
+        # Sem charset no cabeçalho: procura <meta charset> no início; padrão UTF-8
+        encontrado = _RE_CHARSET.search(primeiro[:2048])
+        encoding = encontrado.group(1).decode('ascii') if encontrado else 'utf-8'
+    blocos = itertools.chain([primeiro], blocos)
+    
+    coletor = _ColetorTexto(max_caracteres)
+    if etree is not None:
+        try:
+            parser = etree.HTMLParser(target=coletor, encoding=encoding, no_network=True)
+        except LookupError:
+            parser = etree.HTMLParser(target=coletor, no_network=True)
+        alimentar = parser.feed
+    else:
+        try:
+            decodificador = codecs.getincrementaldecoder(encoding)(errors='replace')
+        except LookupError:
+            decodificador = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        parser = _ParserPadrao(coletor)
+        alimentar = lambda bloco: parser.feed(decodificador.decode(bloco))
+
+    for bloco in blocos:
+        if not bloco:
+            continue
+        try:
+            alimentar(bloco)
+        except Exception:
+            # HTML quebrado: fica com o que já foi coletado
+            break
+        if coletor.cheio:
+            break
+    return coletor.close()
+
 
 class APEXWebSearch:
     """
@@ -14,72 +159,212 @@ class APEXWebSearch:
     Similar ao Perplexity AI.
     """
     
-    def __init__(self):
+    def __init__(
+        self,
+        cache: Optional[CacheWeb] = None,
+        provedores: Optional[List[ProvedorBusca]] = None
+    ):
+        """
+        Args:
+            cache: Cache de páginas e buscas (padrão: o compartilhado do processo)
+            provedores: Provedores de busca (padrão: os de APEX_BUSCA_PROVEDORES)
+        """
+        self.cache = cache if cache is not None else obter_cache_web()
+        # Passagens das páginas já lidas, reaproveitadas entre perguntas
+        self.indice = IndicePassagens()
+        self.max_passagens = 5
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         }
         self.max_results = 5
+        self.provedores = BuscaMultipla(provedores or provedores_padrao(self.headers))
+        # Extração de páginas: as N primeiras que terminarem dentro do prazo
+        self.max_paginas = 3
+        self.prazo_paginas = float(os.getenv('APEX_WEB_PRAZO', '4'))
+        self.conexoes_por_host = int(os.getenv('APEX_WEB_CONEXOES_POR_HOST', '2'))
+        self._semaforos: Dict[str, threading.BoundedSemaphore] = {}
+        # Limites do download de cada página
+        self.max_bytes_pagina = int(os.getenv('APEX_WEB_MAX_BYTES', str(1024 * 1024)))
+        self.max_caracteres = 5000
+        self._semaforos_lock = threading.Lock()
     
-    def buscar_google(self, query: str) -> List[Dict]:
+    def buscar(self, query: str) -> List[Dict]:
         """
-        Realiza busca no Google e retorna resultados.
+        Consulta os provedores de busca e retorna os resultados fundidos.
         """
+        em_cache = self.cache.obter_busca(query, self.provedores.assinatura)
+        if em_cache is not None:
+            return em_cache[:self.max_results]
+        
         try:
-            # API do Google Custom Search (você precisará adicionar sua chave)
-            # Por enquanto, faremos web scraping básico
-            
-            search_url = f"https://www.google.com/search?q={requests.utils.quote(query)}"
-            response = requests.get(search_url, headers=self.headers, timeout=10)
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
-            results = []
-            
-            # Extrair resultados de busca
-            for g in soup.find_all('div', class_='g')[:self.max_results]:
-                try:
-                    title_elem = g.find('h3')
-                    link_elem = g.find('a')
-                    snippet_elem = g.find('div', class_=['VwiC3b', 'yXK7lf'])
-                    
-                    if title_elem and link_elem:
-                        results.append({
-                            'title': title_elem.get_text(),
-                            'url': link_elem.get('href'),
-                            'snippet': snippet_elem.get_text() if snippet_elem else ""
-                        })
-                except:
-                    continue
-            
+            results = self.provedores.buscar(query, self.max_results)
+            if results:
+                self.cache.salvar_busca(query, results, self.provedores.assinatura)
             return results
         
         except Exception as e:
             print(f"Erro na busca: {e}")
             return []
     
-    def extrair_conteudo(self, url: str) -> str:
+    def buscar_google(self, query: str) -> List[Dict]:
+        """
+        Realiza busca e retorna resultados (nome mantido por compatibilidade;
+        os provedores usados vêm de APEX_BUSCA_PROVEDORES).
+        """
+        return self.buscar(query)
+    
+    def extrair_conteudo(self, url: str, timeout: float = 10) -> str:
         """
         Extrai o conteúdo principal de uma página web.
+        
+        O corpo é lido em streaming até `max_bytes_pagina` e o parser para
+        assim que `max_caracteres` de texto forem coletados. Respostas que
+        não são HTML (PDF, imagens...) são ignoradas sem baixar o corpo.
+        
+        O texto fica no cache web; vencido o TTL, a página é revalidada com
+        GET condicional e um 304 reaproveita o texto guardado.
         """
+        em_cache = self.cache.obter_pagina(url)
+        if em_cache is not None and em_cache['fresco']:
+            return em_cache['texto']
+        
+        headers = dict(self.headers)
+        if em_cache is not None:
+            if em_cache['etag']:
+                headers['If-None-Match'] = em_cache['etag']
+            if em_cache['modificado']:
+                headers['If-Modified-Since'] = em_cache['modificado']
+        
         try:
-            response = requests.get(url, headers=self.headers, timeout=10)
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Remover scripts e estilos
-            for script in soup(["script", "style"]):
-                script.decompose()
-            
-            # Extrair texto
-            text = soup.get_text()
-            lines = (line.strip() for line in text.splitlines())
-            chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-            text = ' '.join(chunk for chunk in chunks if chunk)
-            
-            return text[:5000]  # Primeiros 5000 caracteres
+            response = obter_transporte().get(url, headers=headers, timeout=timeout, stream=True)
+            try:
+                if response.status_code == 304 and em_cache is not None:
+                    self.cache.renovar_pagina(url)
+                    return em_cache['texto']
+                tipo = response.headers.get('Content-Type', '')
+                if response.status_code >= 400:
+                    return ""
+                if tipo and tipo.split(';')[0].strip().lower() not in TIPOS_HTML:
+                    return ""
+                texto = extrair_texto_html(
+                    self._ler_limitado(response), self.max_caracteres, _charset(tipo)
+                )
+                if texto and 'no-store' not in response.headers.get('Cache-Control', ''):
+                    self.cache.salvar_pagina(
+                        url, texto, response.headers.get('ETag'), response.headers.get('Last-Modified')
+                    )
+                return texto
+            finally:
+                response.close()
         
         except Exception as e:
             print(f"Erro ao extrair conteúdo: {e}")
             return ""
     
+    def _ler_limitado(self, response: requests.Response, tamanho_bloco: int = 16384):
+        """Blocos do corpo até `max_bytes_pagina` bytes"""
+        lidos = 0
+        for bloco in response.iter_content(chunk_size=tamanho_bloco):
+            restante = self.max_bytes_pagina - lidos
+            if restante <= 0:
+                break
+            lidos += len(bloco)
+            yield bloco[:restante]
+    
+    def _semaforo_host(self, url: str) -> threading.BoundedSemaphore:
+        host = urlparse(url).netloc.lower()
+        with self._semaforos_lock:
+            semaforo = self._semaforos.get(host)
+            if semaforo is None:
+                semaforo = self._semaforos[host] = threading.BoundedSemaphore(self.conexoes_por_host)
+            return semaforo
+    
+    def _extrair_ate(self, url: str, limite: float) -> str:
+        """
+        Extrai a página respeitando o limite de conexões do host e o prazo final.
+        """
+        semaforo = self._semaforo_host(url)
+        restante = limite - time.monotonic()
+        if restante <= 0 or not semaforo.acquire(timeout=restante):
+            return ""
+        try:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                return ""
+            return self.extrair_conteudo(url, timeout=restante)
+        finally:
+            semaforo.release()
+    
+    def iterar_conteudos(
+        self,
+        resultados: List[Dict],
+        max_paginas: Optional[int] = None,
+        prazo: Optional[float] = None
+    ) -> Iterator[Tuple[int, Dict, str]]:
+        """
+        Extrai as páginas dos resultados em paralelo, na ordem em que terminam.
+        
+        Para após `max_paginas` páginas com conteúdo ou ao fim do `prazo` (s);
+        páginas lentas são descartadas em vez de esperadas.
+        
+        Yields:
+            (índice do resultado, resultado, conteúdo extraído)
+        """
+        if not resultados:
+            return
+        max_paginas = max_paginas or self.max_paginas
+        prazo = self.prazo_paginas if prazo is None else prazo
+        limite = time.monotonic() + prazo
+        
+        # Sem `with`: o bloco esperaria as páginas lentas terminarem
+        executor = ThreadPoolExecutor(max_workers=len(resultados))
+        futuros = {
+            executor.submit(self._extrair_ate, resultado['url'], limite): i
+            for i, resultado in enumerate(resultados)
+        }
+        entregues = 0
+        try:
+            for futuro in as_completed(futuros, timeout=prazo):
+                conteudo = futuro.result()
+                if not conteudo:
+                    continue
+                indice = futuros[futuro]
+                yield indice, resultados[indice], conteudo
+                entregues += 1
+                if entregues >= max_paginas:
+                    break
+        except FuturesTimeout:
+            print(f"⏱️ Prazo de {prazo:.1f}s esgotado; {entregues} páginas aproveitadas")
+        finally:
+            for futuro in futuros:
+                futuro.cancel()
+            executor.shutdown(wait=False)
+    
+    def passagens_relevantes(
+        self,
+        pergunta: str,
+        resultados: List[Dict],
+        k: Optional[int] = None
+    ) -> List[Tuple[int, Passagem]]:
+        """
+        Extrai as páginas dos resultados e devolve os trechos mais relevantes.
+        
+        Returns:
+            Lista de (número do resultado, começando em 1, passagem), da mais
+            relevante para a menos relevante
+        """
+        numeros = {}
+        for indice, resultado, conteudo in self.iterar_conteudos(resultados):
+            i = indice + 1
+            print(f"[{i}] {resultado['title']}")
+            print(f"    {resultado['url'][:80]}...")
+            
+            self.indice.adicionar_pagina(resultado['url'], conteudo, resultado['title'])
+            numeros[resultado['url']] = i
+        
+        encontradas = self.indice.buscar(pergunta, k or self.max_passagens, urls=numeros)
+        return [(numeros[passagem.url], passagem) for _, passagem in encontradas]
+    
     def pesquisar_e_resumir(self, pergunta: str) -> str:
         """
         Busca na web e gera uma resposta resumida.
@@ -87,24 +372,14 @@ class APEXWebSearch:
         """
         print(f"\n🔍 Buscando: {pergunta}\n")
         
-        # 1. Buscar no Google
-        resultados = self.buscar_google(pergunta)
+        # 1. Buscar nos provedores
+        resultados = self.buscar(pergunta)
         
         if not resultados:
             return "Não consegui encontrar resultados para sua pergunta."
         
-        # 2. Extrair conteúdo dos primeiros resultados
-        conteudo_total = []
-        fontes = []
-        
-        for i, resultado in enumerate(resultados[:3], 1):
-            print(f"[{i}] {resultado['title']}")
-            print(f"    {resultado['url'][:80]}...")
-            
-            conteudo = self.extrair_conteudo(resultado['url'])
-            if conteudo:
-                conteudo_total.append(conteudo)
-                fontes.append(f"[{i}] {resultado['title']} - {resultado['url']}")
+        # 2. Extrair conteúdo dos primeiros resultados e ranquear as passagens
+        passagens = self.passagens_relevantes(pergunta, resultados)
         
         # 3. Criar resposta resumida
         resposta = f"🤖 APEX encontrou {len(resultados)} resultados:\n\n"
@@ -116,6 +391,11 @@ class APEXWebSearch:
                 resposta += f"    {resultado['snippet'][:200]}...\n"
             resposta += f"    {resultado['url']}\n\n"
         
+        if passagens:
+            resposta += "📌 Trechos mais relevantes:\n\n"
+            for i, passagem in passagens:
+                resposta += f"[{i}] {passagem.texto[:300]}...\n\n"
+        
         resposta += "\nℹ️ Use os números para acessar as fontes detalhadas."
         
         return resposta
@@ -2,9 +2,14 @@
 Descrição: Gera código/apps baseado em prompts usando Perplexity.
 """
 import os
-import requests
+import time
 import logging
 
+from apex_http import obter_transporte
+from apex_rate_limit import obter_controle
+from apex_context_window import contar_tokens
+from apex_telemetry import metricas
+
 logging.basicConfig(level=logging.INFO)
 
 def generate_tool_code(prompt: str) -> str:
@@ -39,16 +44,32 @@ def generate_tool_code(prompt: str) -> str:
         "max_tokens": 1500
     }
     
+    inicio = time.perf_counter()
     try:
-        response = requests.post(url, json=payload, headers=headers)
+        try:
+            response = obter_controle().executar(
+                lambda: obter_transporte().post(url, json=payload, headers=headers),
+                contar_tokens(payload["messages"][0]["content"]) + payload["max_tokens"]
+            )
+        except Exception:
+            metricas.registrar('code_generation_utils', payload["model"], 'erro_rede', time.perf_counter() - inicio)
+            raise
+        latencia = time.perf_counter() - inicio
         if response.status_code == 200:
-            code = response.json()['choices'][0]['message']['content']
+            dados = response.json()
+            uso = dados.get('usage') or {}
+            metricas.registrar(
+                'code_generation_utils', payload["model"], 200, latencia,
+                None, uso.get('prompt_tokens'), uso.get('completion_tokens')
+            )
+            code = dados['choices'][0]['message']['content']
             # Salva em arquivo
             with open('generated_tool.py', 'w', encoding='utf-8') as f:
                 f.write(code)
             logging.info(f"Código gerado e salvo em generated_tool.py")
             return code
         else:
+            metricas.registrar('code_generation_utils', payload["model"], response.status_code, latencia)
             logging.error(f"Erro na API Perplexity: {response.status_code}")
             return f"Erro ao gerar código: {response.text}"
     except Exception as e:
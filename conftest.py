@@ -0,0 +1,78 @@
+"""Fixtures compartilhadas entre os arquivos de teste"""
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+
+class _Paginas(BaseHTTPRequestHandler):
+    requisicoes_etag = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.startswith('/lenta'):
+            time.sleep(2)
+        if self.path == '/etag':
+            _Paginas.requisicoes_etag.append(self.headers.get('If-None-Match'))
+            if self.headers.get('If-None-Match') == '"v1"':
+                self.send_response(304)
+                self.send_header('ETag', '"v1"')
+                self.end_headers()
+                return
+            corpo = b'<p>texto versionado</p>'
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html')
+            self.send_header('ETag', '"v1"')
+            self.send_header('Content-Length', str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+            return
+        if self.path == '/pdf':
+            self._enviar(b'%PDF-1.4 conteudo', 'application/pdf')
+            return
+        if self.path == '/grande':
+            # 20 MB anunciados; o cliente deve parar bem antes
+            bloco = b'<p>' + 'palavra ' .encode() * 1000 + b'</p>'
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html')
+            self.send_header('Content-Length', str(len(bloco) * 2500))
+            self.end_headers()
+            try:
+                for _ in range(2500):
+                    self.wfile.write(bloco)
+            except OSError:
+                pass
+            return
+        corpo = f"<html><body><script>x()</script><p>conteúdo {self.path}</p></body></html>".encode()
+        self._enviar(corpo, 'text/html; charset=utf-8')
+
+    def _enviar(self, corpo, tipo):
+        self.send_response(200)
+        self.send_header('Content-Type', tipo)
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        try:
+            self.wfile.write(corpo)
+        except OSError:
+            pass
+
+
+@pytest.fixture
+def site():
+    servidor = ThreadingHTTPServer(('127.0.0.1', 0), _Paginas)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{servidor.server_port}"
+    servidor.shutdown()
+    servidor.server_close()
+
+
+@pytest.fixture
+def requisicoes_etag():
+    """If-None-Match recebidos pelo /etag do `site` durante o teste"""
+    _Paginas.requisicoes_etag.clear()
+    return _Paginas.requisicoes_etag
@@ -1,8 +1,14 @@
-from flask import Flask, render_template, jsonify
+from flask import Flask, Response, render_template, jsonify
 import pandas as pd
 import json
 import os
 import logging
+from dotenv import load_dotenv
+
+# APEX_METRICAS_DIR precisa ser a mesma pasta dos processos que chamam o LLM
+load_dotenv()
+
+from apex_telemetry import CONTENT_TYPE, exportar_prometheus
 
 logging.basicConfig(level=logging.INFO)
 app = Flask(__name__)
@@ -30,5 +36,10 @@ def get_data():
             return jsonify(json.load(f))
     return jsonify({"error": "No data"})
 
+@app.route('/metrics')
+def metrics():
+    """Métricas das chamadas ao LLM no formato Prometheus."""
+    return Response(exportar_prometheus(), mimetype=CONTENT_TYPE)
+
 if __name__ == "__main__":
     app.run(debug=True, port=5000)
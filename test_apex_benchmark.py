@@ -0,0 +1,48 @@
+import os
+
+import pytest
+
+from apex_benchmark import executar_benchmark, medir_contexto_relevante, percentil
+from apex_http import obter_transporte
+from apex_rate_limit import obter_controle
+
+
+def test_percentil_nearest_rank():
+    valores = list(range(1, 101))
+    assert percentil(valores, 50) == 50
+    assert percentil(valores, 99) == 99
+    assert percentil([], 50) is None
+
+
+def test_benchmark_offline_gera_relatorio():
+    relatorio = executar_benchmark(
+        [1, 4], requisicoes=8, alvos=('llm', 'streaming', 'perplexity', 'tutor'),
+        latencia_ms=1, jitter_ms=0, tokens_resposta=4, intervalo_token_ms=0
+    )
+    for alvo in ('llm', 'streaming', 'perplexity', 'tutor'):
+        medicao = relatorio['resultados'][alvo]['4']
+        assert medicao['requisicoes'] == 8
+        assert medicao['erros'] == 0
+        assert medicao['p50_ms'] <= medicao['p99_ms']
+    assert 'ttft_p50_ms' in relatorio['resultados']['streaming']['1']
+    assert relatorio['servidor']['respostas_200'] == 64
+
+
+def test_benchmark_restaura_transporte_e_controle():
+    transporte, controle = obter_transporte(), obter_controle()
+    executar_benchmark([2], requisicoes=2, alvos=('llm',), latencia_ms=1, jitter_ms=0, tokens_resposta=2)
+    assert obter_transporte() is transporte
+    assert obter_controle() is controle
+
+
+def test_benchmark_memoria_gera_relatorio():
+    relatorio = medir_contexto_relevante(conversas=2000, repeticoes=2)
+    assert set(relatorio['consultas']) == {'comum', 'raro', 'misto'}
+    assert relatorio['consultas']['raro']['requisicoes'] == 4
+
+
+@pytest.mark.skipif(not os.getenv('APEX_BENCHMARK'), reason="defina APEX_BENCHMARK=1 (gera 200 mil conversas)")
+def test_contexto_relevante_rapido_com_200_mil_conversas():
+    relatorio = medir_contexto_relevante(conversas=200_000)
+    for tipo, medicao in relatorio['consultas'].items():
+        assert medicao['p95_ms'] < 20, (tipo, medicao)
@@ -0,0 +1,277 @@
+import gc
+import gzip
+import json
+import sqlite3
+import threading
+
+import apex_context_memory
+from apex_context_memory import ContextMemory
+
+
+def test_wal_e_conexao_por_thread(tmp_path):
+    memoria = ContextMemory(str(tmp_path / 'memoria.db'))
+    assert memoria._conexao().execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    assert memoria._conexao() is memoria._conexao()
+
+    def _gravar(i):
+        for j in range(20):
+            memoria.adicionar_conversa(f'p{i}-{j}', 'r')
+
+    threads = [threading.Thread(target=_gravar, args=(i,)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(memoria.obter_contexto(limite=1000)) == 80
+    memoria.fechar()
+
+
+def test_escrita_adiada_agrupa_e_descarrega_ao_fechar(tmp_path):
+    caminho = str(tmp_path / 'memoria.db')
+    memoria = ContextMemory(caminho, escrita_adiada=True, tamanho_lote=1000, intervalo_lote=60)
+    for i in range(10):
+        memoria.adicionar_conversa(f'pergunta {i}', f'resposta {i}')
+
+    with sqlite3.connect(caminho) as conn:
+        assert conn.execute('SELECT COUNT(*) FROM conversa').fetchone()[0] == 0
+
+    # Leituras enxergam o que ainda está na fila
+    assert memoria.obter_contexto(limite=1)[0]['pergunta'] == 'pergunta 9'
+
+    memoria.adicionar_conversa('última', 'r')
+    memoria.fechar()
+    with sqlite3.connect(caminho) as conn:
+        assert conn.execute('SELECT COUNT(*) FROM conversa').fetchone()[0] == 11
+
+
+def test_contexto_relevante_por_fts(tmp_path):
+    memoria = ContextMemory(str(tmp_path / 'memoria.db'))
+    memoria.adicionar_conversa('Como funciona a fotossíntese?', 'As plantas convertem luz em energia.')
+    for i in range(30):
+        memoria.adicionar_conversa(f'Abrir o navegador {i}', 'Chrome aberto.')
+
+    relevantes = memoria.obter_contexto_relevante('explique a fotossintese das plantas', k=3)
+    assert relevantes[0]['pergunta'] == 'Como funciona a fotossíntese?'
+    assert len(relevantes) == 1
+
+    # Triggers mantêm o índice em sincronia com atualizações e remoções
+    conn = memoria._conexao()
+    with conn:
+        conn.execute("UPDATE conversa SET resposta = 'Clorofila captura a luz' WHERE id = 1")
+    assert memoria.obter_contexto_relevante('clorofila')[0]['id'] == 1
+    with conn:
+        conn.execute('DELETE FROM conversa WHERE id = 1')
+    assert memoria.obter_contexto_relevante('clorofila') == []
+    memoria.fechar()
+
+
+def test_fts_indexa_banco_existente(tmp_path):
+    caminho = str(tmp_path / 'antigo.db')
+    with sqlite3.connect(caminho) as conn:
+        conn.execute('CREATE TABLE conversa (id INTEGER PRIMARY KEY, timestamp TEXT, pergunta TEXT, '
+                     'resposta TEXT, fonte TEXT, tokens INTEGER)')
+        conn.execute("INSERT INTO conversa VALUES (1, '2024-01-01', 'receita de bolo', 'farinha e ovos', 'p', 0)")
+    conn.close()
+
+    memoria = ContextMemory(caminho)
+    assert memoria.obter_contexto_relevante('bolo')[0]['resposta'] == 'farinha e ovos'
+    memoria.fechar()
+
+
+def test_contexto_relevante_ignora_termos_comuns_e_limita_candidatos(tmp_path, monkeypatch):
+    monkeypatch.setattr(apex_context_memory, 'MIN_DOCS_TERMO_COMUM', 10)
+    monkeypatch.setattr(apex_context_memory, 'MAX_CANDIDATOS_FTS', 5)
+    memoria = ContextMemory(str(tmp_path / 'memoria.db'), recall_vetorial=False)
+    for i in range(40):
+        memoria.adicionar_conversa(f'erro no python {i}', 'reinstale o pacote')
+    memoria.adicionar_conversa('decorador em python', 'funcao que embrulha outra')
+    for i in range(8):
+        memoria.adicionar_conversa(f'receita de bolo {i}', 'farinha e ovos')
+
+    # "python" está em 41 de 49 conversas: sai do ranking e fica em cache
+    relevantes = memoria.obter_contexto_relevante('decorador python', k=3)
+    assert relevantes[0]['pergunta'] == 'decorador em python'
+    assert 'python' in memoria._termos_comuns
+
+    # Só termos comuns: as conversas mais recentes que casam, sem bm25
+    relevantes = memoria.obter_contexto_relevante('python', k=3)
+    assert [c['id'] for c in relevantes] == [41, 40, 39]
+
+    # Termo raro com mais casamentos que o corte: o bm25 só vê os 5 mais recentes
+    relevantes = memoria.obter_contexto_relevante('receita', k=10)
+    assert sorted(c['id'] for c in relevantes) == [45, 46, 47, 48, 49]
+    memoria.fechar()
+
+
+def test_exportar_jsonl_incremental_com_cursor(tmp_path):
+    memoria = ContextMemory(str(tmp_path / 'memoria.db'))
+    for i in range(25):
+        memoria.adicionar_conversa(f'pergunta {i}', f'resposta {i}')
+    destino = str(tmp_path / 'export.jsonl.gz')
+    cursor = str(tmp_path / 'export.cursor')
+
+    assert memoria.exportar_jsonl(destino, arquivo_cursor=cursor, tamanho_lote=10) == 25
+    assert memoria.exportar_jsonl(destino, arquivo_cursor=cursor) == 0
+    memoria.adicionar_conversa('pergunta nova', 'resposta nova')
+    assert memoria.exportar_jsonl(destino, arquivo_cursor=cursor) == 1
+
+    with gzip.open(destino, 'rt', encoding='utf-8') as f:
+        linhas = [json.loads(linha) for linha in f]
+    assert [c['id'] for c in linhas] == list(range(1, 27))
+    assert linhas[-1]['pergunta'] == 'pergunta nova'
+
+    assert [c['id'] for c in memoria.iterar_conversas(desde_id=20, tamanho_lote=2)] == list(range(21, 27))
+    memoria.exportar_historico(str(tmp_path / 'historico.json'))
+    with open(tmp_path / 'historico.json', encoding='utf-8') as f:
+        assert len(json.load(f)) == 26
+    memoria.fechar()
+
+
+def test_sessoes_separam_conversas_e_variaveis(tmp_path):
+    memoria = ContextMemory(str(tmp_path / 'memoria.db'))
+    memoria.adicionar_conversa('qual meu time?', 'Palmeiras', sessao='ana')
+    memoria.adicionar_conversa('qual meu time?', 'Bahia', sessao='bruno')
+    memoria.salvar_variavel('cidade', 'Recife', sessao='ana')
+    memoria.salvar_variavel('cidade', 'Salvador', sessao='bruno')
+
+    assert [c['resposta'] for c in memoria.obter_contexto(sessao='ana')] == ['Palmeiras']
+    assert memoria.obter_contexto() == []
+    assert memoria.resposta_memorizada('Qual meu time?', sessao='bruno')['resposta'] == 'Bahia'
+    assert memoria.obter_variavel('cidade', sessao='ana') == 'Recife'
+    assert memoria.obter_variavel('cidade') is None
+    assert memoria.listar_sessoes() == ['ana', 'bruno']
+    memoria.fechar()
+
+
+def test_cache_de_variaveis_invalida_gravacao_de_outra_conexao(tmp_path):
+    caminho = str(tmp_path / 'memoria.db')
+    memoria = ContextMemory(caminho)
+    outro_processo = ContextMemory(caminho)
+    memoria.salvar_variavel('tema', 'claro', sessao='ana')
+    memoria.salvar_variavel('idioma', 'pt', sessao='bruno')
+    assert memoria.obter_variavel('tema', sessao='ana') == 'claro'
+    assert memoria.obter_variavel('nada', sessao='ana') is None
+
+    # Leituras seguintes não vão ao banco
+    consultas = []
+    memoria._conexao().set_trace_callback(consultas.append)
+    assert memoria.obter_variavel('tema', sessao='ana') == 'claro'
+    assert not [c for c in consultas if 'FROM contexto ' in c or 'contexto WHERE' in c]
+
+    outro_processo.salvar_variavel('tema', 'escuro', sessao='ana')
+    assert memoria.obter_variavel('tema', sessao='ana') == 'escuro'
+    # Só a sessão alterada sai do cache
+    assert memoria._variaveis['bruno'] == {'idioma': 'pt'}
+    memoria.salvar_variavel('nada', 'agora existe', sessao='ana')
+    assert outro_processo.obter_variavel('nada', sessao='ana') == 'agora existe'
+    memoria.fechar()
+    outro_processo.fechar()
+
+
+def test_cache_de_variaveis_descarta_a_sessao_usada_ha_mais_tempo(tmp_path):
+    memoria = ContextMemory(str(tmp_path / 'memoria.db'), recall_vetorial=False, max_sessoes_cache=2)
+    for sessao in ('ana', 'bruno', 'carla'):
+        memoria.salvar_variavel('tema', f'tema de {sessao}', sessao=sessao)
+    assert list(memoria._variaveis) == ['bruno', 'carla']
+    assert 'ana' not in memoria._versoes
+
+    # Uma leitura com acerto torna a sessão a mais recente
+    assert memoria.obter_variavel('tema', sessao='bruno') == 'tema de bruno'
+    # Sessão descartada: falta no cache, lida do banco
+    consultas = []
+    memoria._conexao().set_trace_callback(consultas.append)
+    assert memoria.obter_variavel('tema', sessao='ana') == 'tema de ana'
+    assert [c for c in consultas if 'FROM contexto ' in c]
+    assert list(memoria._variaveis) == ['bruno', 'ana']
+    memoria.fechar()
+
+
+def test_recall_vetorial_por_sessao_com_muitas_sessoes(tmp_path):
+    memoria = ContextMemory(str(tmp_path / 'memoria.db'))
+    sessoes = [f'u{i}' for i in range(8)]
+    for sessao in sessoes:
+        memoria.adicionar_conversa('qual meu time?', f'time de {sessao}', sessao=sessao)
+
+    respostas = [memoria.resposta_memorizada('qual meu time?', sessao=s) for s in sessoes]
+    assert [r['resposta'] for r in respostas] == [f'time de {s}' for s in sessoes]
+    assert len(memoria.buscar_similares('qual meu time?', k=5, sessao='u3')) == 1
+    memoria.fechar()
+
+
+def test_recall_vetorial_ve_conversas_gravadas_depois_da_primeira_busca(tmp_path):
+    caminho = str(tmp_path / 'memoria.db')
+    memoria = ContextMemory(caminho)
+    memoria.adicionar_conversa('qual a cor do ceu?', 'azul')
+    assert memoria.resposta_memorizada('qual a cor do ceu?')['resposta'] == 'azul'
+
+    # Outro processo grava no mesmo banco depois da primeira busca
+    outro = ContextMemory(caminho, recall_vetorial=False)
+    outro.adicionar_conversa('qual a cor da grama?', 'verde')
+    outro.fechar()
+    memoria.adicionar_conversa('qual a cor do sol?', 'amarelo')
+
+    assert memoria.resposta_memorizada('qual a cor da grama?')['resposta'] == 'verde'
+    assert memoria.resposta_memorizada('qual a cor do sol?')['resposta'] == 'amarelo'
+    assert len(memoria.vetores) == 3
+    memoria.fechar()
+
+
+def test_exportar_jsonl_gz_retoma_apos_falha(tmp_path, monkeypatch):
+    memoria = ContextMemory(str(tmp_path / 'memoria.db'))
+    for i in range(30):
+        memoria.adicionar_conversa(f'pergunta {i}', f'resposta {i}')
+    destino = str(tmp_path / 'export.jsonl.gz')
+    cursor = str(tmp_path / 'export.cursor')
+
+    original = ContextMemory._escrever_lote
+    chamadas = []
+
+    def _morre_no_terceiro_lote(arquivo, comprimir, lote, arquivo_cursor, ultimo_id):
+        chamadas.append(ultimo_id)
+        if len(chamadas) == 3:
+            # Metade de um membro gzip gravada antes do processo morrer
+            with open(arquivo, 'ab') as f:
+                f.write(gzip.compress(''.join(lote).encode('utf-8'))[:20])
+            raise KeyboardInterrupt
+        return original(arquivo, comprimir, lote, arquivo_cursor, ultimo_id)
+
+    monkeypatch.setattr(ContextMemory, '_escrever_lote', staticmethod(_morre_no_terceiro_lote))
+    try:
+        memoria.exportar_jsonl(destino, arquivo_cursor=cursor, tamanho_lote=10)
+    except KeyboardInterrupt:
+        pass
+    monkeypatch.setattr(ContextMemory, '_escrever_lote', staticmethod(original))
+
+    assert memoria.exportar_jsonl(destino, arquivo_cursor=cursor, tamanho_lote=10) == 10
+    with gzip.open(destino, 'rt', encoding='utf-8') as f:
+        assert [json.loads(linha)['id'] for linha in f] == list(range(1, 31))
+    memoria.fechar()
+
+
+def test_saida_do_processo_fecha_instancias_reusadas_sem_segura_las(tmp_path):
+    caminho = str(tmp_path / 'memoria.db')
+    memoria = ContextMemory(caminho, escrita_adiada=True, tamanho_lote=1000, intervalo_lote=60)
+    memoria.fechar()
+    # Reusada depois de fechada: a fila ainda precisa ser gravada na saída
+    memoria.adicionar_conversa('pergunta tardia', 'resposta')
+    apex_context_memory._fechar_instancias()
+    with sqlite3.connect(caminho) as conn:
+        assert conn.execute('SELECT COUNT(*) FROM conversa').fetchone()[0] == 1
+
+    memoria.fechar()
+    del memoria
+    gc.collect()
+    assert not any(m.db_path == caminho for m in apex_context_memory._instancias)
+
+
+def test_resposta_memorizada_confere_numeros_e_nomes(tmp_path):
+    memoria = ContextMemory(str(tmp_path / 'memoria.db'))
+    memoria.adicionar_conversa('qual a raiz quadrada de 144', 'A raiz quadrada de 144 é 12.')
+    memoria.adicionar_conversa('qual a capital da França?', 'Paris')
+
+    assert memoria.resposta_memorizada('qual é a raiz quadrada de 144?')['resposta'].endswith('12.')
+    assert memoria.resposta_memorizada('qual a raiz quadrada de 169') is None
+    assert memoria.resposta_memorizada('Qual é a capital da frança')['resposta'] == 'Paris'
+    assert memoria.resposta_memorizada('qual a capital da alemanha?') is None
+    memoria.fechar()
@@ -0,0 +1,49 @@
+from apex_context_window import MontadorContexto, contar_tokens
+
+
+def _conversa(pares):
+    mensagens = []
+    for i in range(pares):
+        mensagens.append({"role": "user", "content": f"pergunta {i} " + "palavra " * 20})
+        mensagens.append({"role": "assistant", "content": f"resposta {i} " + "palavra " * 20})
+    return mensagens
+
+
+def test_contar_tokens_aproximado():
+    assert contar_tokens("") == 0
+    assert contar_tokens("olá, mundo") == 4
+    assert contar_tokens("inconstitucionalissimamente") == 7
+
+
+def test_respeita_orcamento_e_mantem_sistema_e_pergunta():
+    montador = MontadorContexto(orcamento_tokens=120)
+    mensagens = [{"role": "system", "content": "Seja breve."}] + _conversa(50)
+    mensagens.append({"role": "user", "content": "pergunta atual"})
+
+    selecionadas = montador.montar(mensagens)
+
+    assert selecionadas[0]["role"] == "system"
+    assert selecionadas[-1]["content"] == "pergunta atual"
+    assert selecionadas[1]["role"] == "user"
+    assert sum(montador.contar(m) for m in selecionadas) <= 120
+    assert "resposta 49" in selecionadas[-2]["content"]
+
+
+def test_resumo_incremental_reaproveita_prefixo():
+    chamadas = []
+
+    def resumidor(mensagens):
+        chamadas.append(len(mensagens))
+        return f"resumo de {len(mensagens)} mensagens"
+
+    montador = MontadorContexto(orcamento_tokens=150, resumidor=resumidor, orcamento_resumo=30)
+    conversa = _conversa(10)
+    primeira = montador.montar(conversa + [{"role": "user", "content": "a"}])
+    assert primeira[0]["content"].startswith("Resumo da conversa anterior")
+
+    montador.montar(conversa + [{"role": "user", "content": "b"}])
+    assert len(chamadas) == 1
+
+    montador.montar(conversa + _conversa(1) + [{"role": "user", "content": "c"}])
+    assert len(chamadas) == 2
+    assert chamadas[1] < chamadas[0]
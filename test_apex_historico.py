@@ -0,0 +1,54 @@
+import json
+
+from apex_historico import HistoricoConversa, criar_historico
+
+
+def _ler_jsonl(caminho):
+    with open(caminho, encoding='utf-8') as f:
+        return [json.loads(linha) for linha in f]
+
+
+def test_buffer_limitado_com_log_completo(tmp_path):
+    log = tmp_path / 'historico.jsonl'
+    historico = HistoricoConversa(max_itens=3, arquivo_log=str(log))
+    for i in range(5):
+        historico.adicionar(f'p{i}', f'r{i}', 'modelo', i)
+    historico.fechar()
+
+    assert [h['pergunta'] for h in historico.listar()] == ['p2', 'p3', 'p4']
+    assert [h['pergunta'] for h in _ler_jsonl(log)] == ['p0', 'p1', 'p2', 'p3', 'p4']
+
+    recarregado = HistoricoConversa(max_itens=2, arquivo_log=str(log))
+    assert [h['pergunta'] for h in recarregado.listar()] == ['p3', 'p4']
+
+
+def test_exportacao_incremental(tmp_path):
+    destino = tmp_path / 'export.jsonl'
+    historico = HistoricoConversa(max_itens=10)
+    historico.adicionar('p1', 'r1', 'modelo')
+    historico.adicionar('p2', 'r2', 'modelo')
+
+    assert historico.exportar(str(destino)) == 2
+    assert historico.exportar(str(destino)) == 0
+    historico.adicionar('p3', 'r3', 'modelo')
+    assert historico.exportar(str(destino)) == 1
+
+    assert [h['pergunta'] for h in _ler_jsonl(destino)] == ['p1', 'p2', 'p3']
+
+
+def test_limpar_nao_volta_ao_recarregar_o_log(tmp_path):
+    log = str(tmp_path / 'historico.jsonl')
+    historico = HistoricoConversa(arquivo_log=log)
+    historico.adicionar('antiga', 'r', 'modelo')
+    historico.limpar()
+    historico.adicionar('nova', 'r', 'modelo')
+    historico.fechar()
+
+    assert [h['pergunta'] for h in HistoricoConversa(arquivo_log=log).listar()] == ['nova']
+
+
+def test_log_do_historico_so_com_variavel(tmp_path, monkeypatch):
+    monkeypatch.delenv('APEX_HISTORICO_LOG', raising=False)
+    assert criar_historico().arquivo_log is None
+    monkeypatch.setenv('APEX_HISTORICO_LOG', str(tmp_path / 'h.jsonl'))
+    assert criar_historico().arquivo_log == str(tmp_path / 'h.jsonl')
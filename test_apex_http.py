@@ -0,0 +1,48 @@
+import json
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+from apex_http import TransporteHTTP
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        corpo = json.dumps({'ok': True}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def servidor():
+    srv = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{srv.server_port}"
+    srv.shutdown()
+
+
+def test_transporte_reaproveita_conexao(servidor):
+    transporte = TransporteHTTP(timeout_conexao=2, timeout_leitura=5)
+    for _ in range(4):
+        assert transporte.post(servidor, json={'a': 1}).json() == {'ok': True}
+    stats = transporte.estatisticas()
+    assert stats['requisicoes'] == 4
+    assert stats['conexoes_abertas'] == 1
+    assert stats['taxa_reuso'] == 0.75
+    transporte.fechar()
+
+
+def test_transporte_timeouts_separados():
+    transporte = TransporteHTTP(timeout_conexao=1.5, timeout_leitura=20)
+    assert transporte.timeout == (1.5, 20)
+    assert transporte._timeout(10) == (1.5, 10)
@@ -0,0 +1,58 @@
+import pytest
+
+from apex_intent_classifier import ClassificadorIntencoes, chave_fonetica
+from apex_nle import interpretar_comando, interpretar_lote
+
+EXEMPLOS = {
+    'youtube': ['abrir o youtube', 'abre o youtube', 'entra no youtube'],
+    'horas': ['que horas sao', 'que hora e'],
+}
+
+
+def test_classifica_com_ruido_e_respeita_limiar():
+    classificador = ClassificadorIntencoes(EXEMPLOS)
+    rotulo, confianca = classificador.classificar('abri o iutube')
+    assert rotulo == 'youtube' and confianca >= classificador.limiar
+    assert classificador.classificar('manda uma mensagem pro joão')[0] is None
+    lote = classificador.classificar_lote(['ke oras sao', 'abre o iutube', 'toca uma música'])
+    assert [r for r, _ in lote] == ['horas', 'youtube', None]
+    assert ClassificadorIntencoes({}).classificar('abrir youtube') == (None, 0.0)
+
+
+def test_chave_fonetica_junta_grafias_da_transcricao():
+    assert chave_fonetica('youtube') == chave_fonetica('iutube') == chave_fonetica('iutubi')
+    assert chave_fonetica('chrome') == chave_fonetica('crome')
+    assert chave_fonetica('massa') == chave_fonetica('masa')
+    assert chave_fonetica('facebook') != chave_fonetica('youtube')
+
+
+def test_exige_margem_sobre_a_segunda_intencao():
+    classificador = ClassificadorIntencoes({
+        'youtube': ['abrir o youtube'], 'youtube_music': ['abrir o youtube music']
+    })
+    rotulo, confianca = classificador.classificar('youtube mus')
+    assert rotulo is None and confianca >= classificador.limiar
+
+
+def test_interpretar_usa_classificador_quando_as_regras_falham():
+    assert interpretar_comando('abri o iutube') == 'abrir youtube'
+    assert interpretar_comando('abri o iutubi') == 'abrir youtube'
+    assert interpretar_comando('abre o iutub') == 'abrir youtube'
+    assert interpretar_comando('abre o crome') == 'abrir navegador chrome'
+    assert interpretar_comando('qual a capital da frança') == 'qual a capital da frança'
+    assert interpretar_lote(['pesquisar gatos', 'abri o iutube', '']) == [
+        'pesquisar por gatos', 'abrir youtube', ''
+    ]
+
+
+@pytest.mark.parametrize('frase', [
+    'que dia é hoje',
+    'que temperatura está',
+    'entra no facebook',
+    'entra no instagram',
+    'abre o editor de texto',
+    'abre a calculadora',
+])
+def test_nao_confunde_frases_parecidas_com_outra_intencao(frase):
+    # Só dividem com os exemplos o verbo ou a palavra de pergunta
+    assert interpretar_comando(frase) == frase
@@ -0,0 +1,51 @@
+import time
+
+from apex_llm_cache import CacheRespostas, chave_cache
+
+
+MENSAGENS = [{"role": "user", "content": "Qual a capital do Brasil?"}]
+
+
+def test_chave_normaliza_espacos_e_role():
+    a = chave_cache("pplx-70b", MENSAGENS, 0.7, 100)
+    b = chave_cache("pplx-70b", [{"role": "User", "content": "  Qual a capital   do Brasil? "}], 0.7, 100)
+    assert a == b
+    assert a != chave_cache("pplx-70b", MENSAGENS, 0.2, 100)
+
+
+def test_nivel_disco_sobrevive_a_nova_instancia(tmp_path):
+    db = str(tmp_path / "cache.db")
+    chave = chave_cache("pplx-70b", MENSAGENS, 0.7, 100)
+    CacheRespostas(db_path=db).salvar(chave, "Brasília", "pplx-70b")
+
+    cache = CacheRespostas(db_path=db)
+    assert cache.obter(chave) == "Brasília"
+    assert cache.obter(chave) == "Brasília"
+    stats = cache.estatisticas()
+    assert stats['hits_disco'] == 1
+    assert stats['hits_memoria'] == 1
+
+
+def test_ttl_e_lru_em_memoria():
+    cache = CacheRespostas(db_path=None, max_itens_memoria=2, ttl=0.05)
+    cache.salvar("a", 1)
+    cache.salvar("b", 2)
+    cache.salvar("c", 3)
+    assert cache.obter("a") is None
+    assert cache.estatisticas()['remocoes_memoria'] == 1
+    time.sleep(0.06)
+    assert cache.obter("c") is None
+    assert cache.estatisticas()['expirados'] == 1
+
+
+def test_remocao_por_tamanho_no_disco(tmp_path):
+    cache = CacheRespostas(db_path=str(tmp_path / "cache.db"), max_bytes_disco=60)
+    for i in range(5):
+        cache.salvar(f"k{i}", "x" * 20)
+    assert cache.estatisticas()['bytes_disco'] <= 60
+    assert cache.estatisticas()['remocoes_disco'] >= 2
+
+
+def test_modelos_online_ignorados_sem_janela_de_frescor():
+    assert not CacheRespostas(db_path=None).usar_cache("pplx-70b-online")
+    assert CacheRespostas(db_path=None, janela_frescor_online=300).usar_cache("pplx-70b-online")
@@ -0,0 +1,88 @@
+import asyncio
+import json
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+from apex_llm_async import AsyncAPEXLLMClient
+from apex_llm_client import APEXLLMClient
+from apex_tutor_conteudo import TutorConteudo
+
+
+DELTAS = ["Bra", "sí", "lia"]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        if not payload.get('stream'):
+            corpo = json.dumps({'choices': [{'message': {'content': ''.join(DELTAS)}}]}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        for delta in DELTAS:
+            evento = {'choices': [{'delta': {'content': delta}}]}
+            self.wfile.write(f"data: {json.dumps(evento)}\n\n".encode())
+            self.wfile.flush()
+        fim = {'choices': [{'delta': {}}], 'usage': {'prompt_tokens': 4, 'completion_tokens': 3, 'total_tokens': 7}}
+        self.wfile.write(f"data: {json.dumps(fim)}\n\ndata: [DONE]\n\n".encode())
+        self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def cliente():
+    srv = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    client = APEXLLMClient('chave-teste')
+    client.base_url = f"http://127.0.0.1:{srv.server_port}"
+    yield client
+    srv.shutdown()
+
+
+def test_processar_com_streaming_entrega_deltas_e_uso(cliente):
+    resposta = cliente.processar_com_streaming("Capital do Brasil?")
+    assert list(resposta) == DELTAS
+    assert resposta.texto == "Brasília"
+    assert resposta.uso['total_tokens'] == 7
+    assert resposta.tempo_primeiro_token is not None
+
+
+def test_tutor_com_ao_token_recebe_deltas(cliente):
+    recebidos = []
+    tutor = TutorConteudo(cliente, ao_token=recebidos.append)
+    assert tutor.explicar_conteudo("Geografia") == "Brasília"
+    assert recebidos == DELTAS
+
+
+def test_gerar_resposta_sem_streaming(cliente):
+    assert cliente.gerar_resposta("Capital do Brasil?") == "Brasília"
+
+
+def test_cliente_assincrono_com_tutor(cliente):
+    async_cliente = AsyncAPEXLLMClient(cliente=cliente, limite_concorrencia=4)
+    tutor = TutorConteudo(async_cliente)
+
+    async def _lote():
+        return await async_cliente.gather(
+            [tutor.resumir("texto") for _ in range(6)] + [tutor.gerar_exercicios("x", 1)]
+        )
+
+    resultados = asyncio.run(_lote())
+    assert resultados[:6] == ["Brasília"] * 6
+    assert resultados[6] == ["Brasília"]
+    assert async_cliente.model == cliente.model
+    async_cliente.fechar()
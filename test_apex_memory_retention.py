@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta
+
+from apex_context_memory import ContextMemory
+from apex_memory_retention import FONTE_RESUMO, RetencaoMemoria
+
+
+def _memoria_com_antigas(tmp_path, antigas=30, recentes=5):
+    memoria = ContextMemory(str(tmp_path / 'memoria.db'))
+    velho = (datetime.now() - timedelta(days=200)).isoformat()
+    memoria._gravar_conversas([(velho, f'pergunta antiga {i}', f'resposta {i}', 'perplexity', 0, 'padrao') for i in range(antigas)])
+    for i in range(recentes):
+        memoria.adicionar_conversa(f'pergunta nova {i}', 'r')
+    return memoria
+
+
+def test_arquiva_em_blocos_e_recupera(tmp_path):
+    memoria = _memoria_com_antigas(tmp_path)
+    retencao = RetencaoMemoria(memoria, dias_retencao=90, manter_minimo=10, tamanho_bloco=8)
+
+    # As 10 mais recentes ficam, mesmo que 5 delas sejam antigas
+    assert retencao.arquivar() == 25
+    stats = retencao.estatisticas()
+    assert stats['conversas'] == 10 and stats['conversas_arquivadas'] == 25
+    assert stats['blocos_arquivo'] == 4 and stats['arquivo_bytes'] > 0
+
+    arquivadas = list(retencao.ler_arquivo())
+    assert [c['pergunta'] for c in arquivadas] == [f'pergunta antiga {i}' for i in range(25)]
+    assert all(c['id'] > 25 for c in memoria.obter_contexto_relevante('pergunta antiga', k=50))
+    assert retencao.arquivar() == 0
+    memoria.fechar()
+
+
+def test_resumos_substituem_blocos_e_manutencao(tmp_path):
+    memoria = _memoria_com_antigas(tmp_path, antigas=12, recentes=2)
+    resumidor = lambda conversas: f"{len(conversas)} conversas sobre perguntas antigas"
+    retencao = RetencaoMemoria(memoria, manter_minimo=2, tamanho_bloco=6, resumidor=resumidor)
+
+    resultado = retencao.executar()
+    assert resultado['arquivadas_ultima'] == 12
+    resumos = [c for c in memoria.obter_contexto(100) if c['fonte'] == FONTE_RESUMO]
+    assert [r['resposta'] for r in resumos] == ['6 conversas sobre perguntas antigas'] * 2
+    assert memoria.resposta_memorizada(resumos[0]['pergunta'])['fonte'] == FONTE_RESUMO
+
+    conn = memoria._conexao()
+    assert conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2
+    assert 'apex_memoria_conversas 4' in retencao.exportar_prometheus()
+    memoria.fechar()
+
+
+def test_ids_arquivados_nao_sao_reaproveitados(tmp_path):
+    memoria = ContextMemory(str(tmp_path / 'memoria.db'))
+    velho = (datetime.now() - timedelta(days=200)).isoformat()
+    memoria._gravar_conversas([(velho, 'qual a senha do wifi', 'segredo', 'perplexity', 0, 'padrao')])
+    memoria.resposta_memorizada('qual a senha do wifi')
+    retencao = RetencaoMemoria(memoria, manter_minimo=0)
+    assert retencao.arquivar() == 1
+
+    memoria.adicionar_conversa('receita de bolo de cenoura', 'cenoura, ovos e farinha')
+    assert memoria.obter_contexto()[0]['id'] == 2
+    assert memoria.resposta_memorizada('qual a senha do wifi') is None
+    assert [c['id'] for c in memoria.iterar_conversas(desde_id=1)] == [2]
+    memoria.fechar()
@@ -0,0 +1,58 @@
+import pytest
+
+import apex_nle
+from apex_nle import INTENCOES, MatcherIntencoes, interpretar_comando, limpar_texto
+
+
+def test_limpar_texto_remove_so_palavras_inteiras():
+    assert limpar_texto("APEX, me manda a mensagem aí por favor") == ", manda a mensagem"
+    assert limpar_texto("pesquisai o tempo") == "pesquisai o tempo"
+
+
+@pytest.mark.parametrize("frase, comando", [
+    ("Apex abre o YouTube aí", "abrir youtube"),
+    ("abre o google chrome por favor", "abrir navegador chrome"),
+    ("me abre a internet", "abrir navegador"),
+    ("abre o visual studio code", "abrir vs code"),
+    ("que horas são?", "que horas são"),
+    ("busque previsão do tempo", "pesquisar por previsão do tempo"),
+    ("pesquisar", "pesquisar por"),
+    ("criar comando abrir spotify", "criar comando abrir spotify"),
+    # "hora" dentro de "agora" não é gatilho
+    ("faz isso agora", "faz isso agora"),
+])
+def test_interpretar_comando(frase, comando):
+    assert interpretar_comando(frase) == comando
+
+
+def test_prioridade_e_slots_no_meio():
+    matcher = MatcherIntencoes(INTENCOES + [
+        apex_nle.Intencao("tocar", ["tocar {musica} no spotify"], "tocar {musica}")
+    ])
+    intencao, slots = matcher.reconhecer("tocar samba antigo no spotify")
+    assert intencao.nome == "tocar" and slots == {"musica": "samba antigo"}
+    # youtube vem antes de pesquisar na tabela
+    assert matcher.reconhecer("pesquisar receitas no youtube")[0].nome == "youtube"
+    assert matcher.reconhecer("tocar samba") is None
+
+
+def test_registrar_intencao(monkeypatch):
+    monkeypatch.setattr(apex_nle, "INTENCOES", list(INTENCOES))
+    monkeypatch.setattr(apex_nle, "_matcher", apex_nle._matcher)
+    apex_nle.registrar_intencao("calculadora", ["calculadora", "calcular"], "abrir calculadora", prioridade=0)
+    assert interpretar_comando("abre a calculadora") == "abrir calculadora"
+
+
+def test_padroes_com_o_mesmo_gatilho():
+    matcher = MatcherIntencoes([
+        apex_nle.Intencao("spotify", ["tocar {musica} no spotify", "tocar {musica}"], "tocar {musica}")
+    ])
+    assert matcher.reconhecer("tocar samba")[1] == {"musica": "samba"}
+    assert matcher.reconhecer("tocar samba no spotify")[1] == {"musica": "samba"}
+
+
+def test_gatilho_curto_de_maior_prioridade_vence_o_longo():
+    abrir = apex_nle.Intencao("abrir", ["abrir {app}"], "abrir {app}")
+    navegador = apex_nle.Intencao("navegador", ["abrir o navegador"], "abrir navegador")
+    assert MatcherIntencoes([abrir, navegador]).reconhecer("abrir o navegador")[0] is abrir
+    assert MatcherIntencoes([navegador, abrir]).reconhecer("abrir o navegador")[0] is navegador
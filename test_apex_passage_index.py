@@ -0,0 +1,32 @@
+from apex_passage_index import IndicePassagens, dividir_passagens, tokenizar
+
+
+def test_tokenizar_remove_acentos_e_stopwords():
+    assert tokenizar('A Programação é divertida!') == ['programacao', 'divertida']
+
+
+def test_dividir_passagens_com_sobreposicao():
+    texto = ' '.join(str(i) for i in range(10))
+    assert dividir_passagens(texto, palavras_por_passagem=4, sobreposicao=1) == [
+        '0 1 2 3', '3 4 5 6', '6 7 8 9'
+    ]
+
+
+def test_busca_bm25_e_indexacao_incremental():
+    indice = IndicePassagens(palavras_por_passagem=8, sobreposicao=0)
+    indice.adicionar_pagina('http://sono', 'Dormir bem exige temperatura do quarto entre 18 e 21 graus. '
+                                           'Evite telas antes de dormir.')
+    indice.adicionar_pagina('http://cafe', 'O café contém cafeína e atrapalha o sono quando tomado à noite.')
+    indice.adicionar_pagina('http://python', 'Python é uma linguagem de programação popular.')
+
+    melhores = indice.buscar('qual a temperatura ideal para dormir', k=2)
+    assert melhores[0][1].url == 'http://sono'
+    assert 'temperatura' in melhores[0][1].texto
+
+    assert [p.url for _, p in indice.buscar('sono café', urls=['http://cafe'])] == ['http://cafe']
+
+    passagens = len(indice)
+    indice.adicionar_pagina('http://python', 'Python é uma linguagem de programação popular.')
+    assert len(indice) == passagens
+    indice.adicionar_pagina('http://python', 'Texto novo')
+    assert indice.buscar('linguagem') == []
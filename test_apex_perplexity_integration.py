@@ -0,0 +1,43 @@
+from apex_historico import HistoricoConversa
+from apex_llm_cache import CacheRespostas
+from apex_mock_perplexity import ServidorMockPerplexity
+from apex_perplexity_integration import PerplexityIntegration
+
+
+def test_lote_em_ordem_com_callback():
+    concluidos = []
+    with ServidorMockPerplexity(latencia_ms=20, jitter_ms=15, tokens_resposta=3, semente=7) as mock:
+        perplexity = PerplexityIntegration('chave', cache=CacheRespostas(ativo=False), historico=HistoricoConversa())
+        perplexity.url_api = mock.url_chat
+
+        itens = ['primeira', {'pergunta': 'segunda', 'com_web': False}, {'pergunta': 'terceira', 'modelo': 'sonar'}]
+        resultados = perplexity.fazer_perguntas_em_lote(
+            itens, max_workers=3, ao_concluir=lambda i, r: concluidos.append(i)
+        )
+
+    assert [r['pergunta'] for r in resultados] == ['primeira', 'segunda', 'terceira']
+    assert all(r['status'] == 'sucesso' and r['latencia_s'] > 0 for r in resultados)
+    assert [r['modelo'] for r in resultados] == ['pplx-70b-online', 'pplx-70b', 'sonar']
+    assert sorted(concluidos) == [0, 1, 2]
+    assert len(perplexity.obter_historico()) == 3
+
+
+def test_lote_usa_historico_anterior_e_isola_itens_invalidos():
+    historico = HistoricoConversa()
+    historico.adicionar('antes do lote', 'resposta', 'pplx-70b')
+    with ServidorMockPerplexity(latencia_ms=5, jitter_ms=5, tokens_resposta=3, semente=3) as mock:
+        perplexity = PerplexityIntegration('chave', cache=CacheRespostas(ativo=False), historico=historico)
+        perplexity.url_api = mock.url_chat
+        tamanhos = []
+        preparar = perplexity._preparar_mensagens
+        perplexity._preparar_mensagens = lambda p, h=None: tamanhos.append(len(h)) or preparar(p, h)
+
+        resultados = perplexity.fazer_perguntas_em_lote(
+            ['um', {'com_web': False}, 'dois', 42, 'tres'], max_workers=1
+        )
+
+    assert [r['status'] for r in resultados] == ['sucesso', 'erro', 'sucesso', 'erro', 'sucesso']
+    assert resultados[1]['indice'] == 1 and resultados[3]['pergunta'] is None
+    # Com um worker os itens rodam em sequência, mas todos veem só o histórico de antes do lote
+    assert tamanhos == [1, 1, 1]
+    assert len(perplexity.obter_historico()) == 4
@@ -0,0 +1,40 @@
+import time
+
+from apex_llm_cache import CacheRespostas
+from apex_llm_client import APEXLLMClient
+from apex_mock_perplexity import ServidorMockPerplexity
+from apex_pipeline import PipelineBusca
+from apex_web_cache import CacheWeb
+from apex_web_search import APEXWebSearch
+
+
+def test_prompt_com_fontes_numeradas():
+    resultados = [{'title': 'Sono', 'url': 'http://a', 'snippet': 'Durma 8 horas'},
+                  {'title': 'Café', 'url': 'http://b', 'snippet': ''}]
+    prompt = PipelineBusca.montar_prompt('quanto dormir?', [], resultados)
+    assert '[1] Sono\nDurma 8 horas' in prompt
+    assert '[2]' not in prompt
+    assert prompt.endswith('Pergunta: quanto dormir?')
+
+
+def test_responde_sem_esperar_paginas_lentas(site):
+    busca = APEXWebSearch(cache=CacheWeb())
+    busca.conexoes_por_host = 4
+    resultados = [{'title': nome, 'url': f"{site}/{nome}", 'snippet': ''} for nome in ('lenta', 'a', 'b')]
+    busca.buscar = lambda pergunta: resultados
+
+    with ServidorMockPerplexity(latencia_ms=10, jitter_ms=0, tokens_resposta=5, intervalo_token_ms=0) as mock:
+        cliente = APEXLLMClient('chave', cache=CacheRespostas(ativo=False))
+        cliente.base_url = mock.url_base
+        pipeline = PipelineBusca(cliente, busca, paginas_suficientes=2, min_passagens=1)
+
+        inicio = time.monotonic()
+        resposta = pipeline.responder('conteúdo')
+        texto = resposta.ler_tudo()
+
+    assert time.monotonic() - inicio < 1.5
+    assert texto == 'token0 token1 token2 token3 token4'
+    assert sorted(numero for numero, _ in resposta.passagens) == [2, 3]
+    assert [fonte['numero'] for fonte in resposta.fontes] == [2, 3]
+    for etapa in ('busca', 'leitura', 'ranqueamento', 'primeiro_token', 'geracao', 'total'):
+        assert etapa in resposta.tempos
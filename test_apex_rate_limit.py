@@ -0,0 +1,79 @@
+from unittest.mock import MagicMock
+
+import pytest
+import requests
+
+from apex_rate_limit import BaldeTokens, ControleTaxa, LimiteAdaptativo, calcular_espera
+
+
+def _resposta(status, headers=None):
+    resposta = MagicMock()
+    resposta.status_code = status
+    resposta.headers = headers or {}
+    return resposta
+
+
+def test_calcular_espera_respeita_retry_after():
+    assert calcular_espera(0, retry_after="2") >= 2
+    assert calcular_espera(10, base=0.5, maximo=3) <= 3
+
+
+def test_limite_adaptativo_aimd():
+    limite = LimiteAdaptativo(inicial=8, intervalo_reducao=0)
+    limite.reduzir()
+    assert limite.limite == 4
+    for _ in range(4):
+        limite.aumentar()
+    assert 4.9 < limite.limite < 5.1
+
+
+def test_balde_de_tokens_bloqueia_sem_saldo():
+    balde = BaldeTokens(capacidade=2, taxa=100)
+    assert balde.adquirir(2) == 0
+    assert balde.adquirir(1) > 0
+
+
+def test_controle_repete_apos_429(monkeypatch):
+    monkeypatch.setattr('apex_rate_limit.time.sleep', lambda s: None)
+    respostas = [_resposta(429, {'Retry-After': '1'}), _resposta(503), _resposta(200)]
+    controle = ControleTaxa(requisicoes_por_minuto=600, tentativas=3)
+
+    final = controle.executar(lambda: respostas.pop(0), tokens_estimados=10)
+
+    assert final.status_code == 200
+    stats = controle.estatisticas()
+    assert stats['throttled'] == 1
+    assert stats['erros_servidor'] == 1
+    assert stats['retentativas'] == 2
+
+
+def test_controle_devolve_ultima_resposta_quando_tentativas_acabam(monkeypatch):
+    monkeypatch.setattr('apex_rate_limit.time.sleep', lambda s: None)
+    controle = ControleTaxa(tentativas=1)
+    assert controle.executar(lambda: _resposta(429)).status_code == 429
+
+
+def test_controle_cobra_tokens_uma_vez_e_devolve_na_falha(monkeypatch):
+    monkeypatch.setattr('apex_rate_limit.time.sleep', lambda s: None)
+    controle = ControleTaxa(requisicoes_por_minuto=600, tokens_por_minuto=1000, tentativas=3)
+
+    respostas = [_resposta(429), _resposta(503), _resposta(200)]
+    controle.executar(lambda: respostas.pop(0), tokens_estimados=300)
+    assert 690 < controle.tokens.disponivel < 710
+
+    controle.executar(lambda: _resposta(503), tokens_estimados=300)
+    assert controle.tokens.disponivel > 690
+
+
+def test_controle_nao_repete_post_apos_falha_de_conexao():
+    chamadas = []
+
+    def _abortada():
+        chamadas.append(1)
+        raise requests.exceptions.ConnectionError('Connection aborted.')
+
+    controle = ControleTaxa(tokens_por_minuto=1000, tentativas=3)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        controle.executar(_abortada, tokens_estimados=300)
+    assert len(chamadas) == 1
+    assert controle.tokens.disponivel > 990
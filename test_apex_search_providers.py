@@ -0,0 +1,77 @@
+import json
+
+from apex_search_providers import (
+    BuscaMultipla, ProvedorBusca, ProvedorFixture, ServidorPaginasFixture, normalizar_url
+)
+from apex_web_cache import CacheWeb
+from apex_web_search import APEXWebSearch
+
+HTML_GOOGLE = """
+<div class="g"><a href="/url?q=https://exemplo.com/cafe&sa=U"><h3>Café</h3></a>
+<div class="VwiC3b">Cafeína e sono</div></div>
+<div class="g"><a href="https://outro.com"><h3>Outro</h3></a></div>
+"""
+
+
+def _criar_fixtures(pasta):
+    (pasta / 'paginas').mkdir()
+    (pasta / 'paginas' / 'sono.html').write_text(
+        '<html><body><p>Dormir bem exige temperatura entre 18 e 21 graus.</p></body></html>', encoding='utf-8'
+    )
+    (pasta / 'sono.json').write_text(json.dumps({
+        'query': 'Temperatura ideal para dormir?',
+        'resultados': [{'title': 'Sono', 'url': 'paginas/sono.html', 'snippet': 'Quarto fresco'}]
+    }), encoding='utf-8')
+    (pasta / 'cafe_a_noite.html').write_text(HTML_GOOGLE, encoding='utf-8')
+
+
+class _ProvedorFixo(ProvedorBusca):
+    def __init__(self, resultados):
+        self.resultados = resultados
+
+    def buscar(self, query, max_resultados=5):
+        return self.resultados[:max_resultados]
+
+
+def test_fixture_json_e_html_salvo(tmp_path):
+    _criar_fixtures(tmp_path)
+    provedor = ProvedorFixture(str(tmp_path), url_paginas='http://local:1')
+
+    assert provedor.buscar('temperatura ideal para dormir') == [
+        {'title': 'Sono', 'url': 'http://local:1/paginas/sono.html', 'snippet': 'Quarto fresco'}
+    ]
+    assert [r['url'] for r in provedor.buscar('Café à noite')] == ['https://exemplo.com/cafe', 'https://outro.com']
+    # Sem correspondência exata: fixture com mais palavras em comum
+    assert provedor.buscar('dormir cedo')[0]['title'] == 'Sono'
+
+
+def test_fusao_remove_duplicadas():
+    a = _ProvedorFixo([{'title': 'A', 'url': 'https://www.site.com/x/', 'snippet': ''},
+                       {'title': 'B', 'url': 'https://b.com', 'snippet': 'b'}])
+    b = _ProvedorFixo([{'title': 'A2', 'url': 'http://site.com/x?utm_source=z', 'snippet': 'mais longo'},
+                       {'title': 'C', 'url': 'https://c.com', 'snippet': 'c'}])
+
+    resultados = BuscaMultipla([a, b]).buscar('q')
+    assert [r['title'] for r in resultados] == ['A', 'B', 'C']
+    assert resultados[0]['snippet'] == 'mais longo'
+    assert normalizar_url('https://www.site.com/x/#topo') == normalizar_url('http://site.com/x')
+
+
+def test_um_provedor_tambem_remove_duplicadas():
+    unico = _ProvedorFixo([{'title': 'A', 'url': 'https://www.site.com/x/', 'snippet': ''},
+                           {'title': 'A2', 'url': 'http://site.com/x?utm_source=z', 'snippet': 'mais longo'},
+                           {'title': 'B', 'url': 'https://b.com', 'snippet': 'b'}])
+
+    resultados = BuscaMultipla([unico]).buscar('q')
+    assert [r['title'] for r in resultados] == ['A', 'B']
+    assert resultados[0]['snippet'] == 'mais longo'
+
+
+def test_pesquisa_completa_offline(tmp_path):
+    _criar_fixtures(tmp_path)
+    with ServidorPaginasFixture(str(tmp_path)) as servidor:
+        busca = APEXWebSearch(cache=CacheWeb(), provedores=[ProvedorFixture(str(tmp_path), servidor.url_base)])
+        resposta = busca.pesquisar_e_resumir('temperatura ideal para dormir')
+
+    assert '[1] Sono' in resposta
+    assert 'entre 18 e 21 graus' in resposta
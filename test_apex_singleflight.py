@@ -0,0 +1,51 @@
+import asyncio
+import threading
+import time
+
+from apex_singleflight import SingleFlight
+
+
+def test_threads_compartilham_uma_execucao():
+    sf = SingleFlight()
+    chamadas = []
+
+    def lenta():
+        chamadas.append(1)
+        time.sleep(0.1)
+        return "ok"
+
+    resultados = []
+    threads = [threading.Thread(target=lambda: resultados.append(sf.executar("k", lenta))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert resultados == ["ok"] * 8
+    assert len(chamadas) == 1
+    assert sf.estatisticas()['colapsadas'] == 7
+
+
+def test_asyncio_compartilha_resultado_e_erro():
+    sf = SingleFlight()
+    chamadas = []
+
+    async def lenta():
+        chamadas.append(1)
+        await asyncio.sleep(0.05)
+        return 42
+
+    async def falha():
+        await asyncio.sleep(0.05)
+        raise ValueError("boom")
+
+    async def principal():
+        ok = await asyncio.gather(*(sf.executar_async("a", lenta) for _ in range(5)))
+        erros = await asyncio.gather(*(sf.executar_async("b", falha) for _ in range(3)), return_exceptions=True)
+        return ok, erros
+
+    ok, erros = asyncio.run(principal())
+    assert ok == [42] * 5
+    assert len(chamadas) == 1
+    assert all(isinstance(e, ValueError) for e in erros)
+    assert sf.colapsadas == 6
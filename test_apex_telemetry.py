@@ -0,0 +1,95 @@
+import asyncio
+import os
+import time
+
+from apex_llm_async import AsyncAPEXLLMClient
+from apex_llm_cache import CacheRespostas
+from apex_llm_client import APEXLLMClient
+from apex_mock_perplexity import ServidorMockPerplexity
+from apex_telemetry import ARQUIVO_AGREGADO, MetricasLLM, exportar_prometheus, metricas, origem
+from apex_tutor_conteudo import TutorConteudo
+
+
+def test_exportar_prometheus_formato():
+    registro = MetricasLLM()
+    registro.registrar('apex_llm_client', 'modelo', 200, 0.3, ttft=0.08, tokens_prompt=10, tokens_resposta=5)
+    with origem('TutorIdiomas'):
+        registro.registrar('apex_llm_client', 'modelo', 429, 1.5)
+
+    texto = registro.exportar_prometheus()
+    assert 'apex_llm_requisicoes_total{origem="apex_llm_client",modelo="modelo",status="200"} 1' in texto
+    assert 'apex_llm_requisicoes_total{origem="TutorIdiomas",modelo="modelo",status="429"} 1' in texto
+    assert 'apex_llm_tokens_total{origem="apex_llm_client",tipo="prompt"} 10' in texto
+    assert 'apex_llm_latencia_segundos_bucket{origem="apex_llm_client",le="0.5"} 1' in texto
+    assert 'apex_llm_latencia_segundos_bucket{origem="TutorIdiomas",le="1.0"} 0' in texto
+    assert 'apex_llm_ttft_segundos_count{origem="apex_llm_client"} 1' in texto
+    assert texto.endswith('\n')
+
+
+def test_chamadas_rotuladas_pela_origem():
+    metricas.limpar()
+    with ServidorMockPerplexity(latencia_ms=5, jitter_ms=0, tokens_resposta=4, intervalo_token_ms=0) as mock:
+        cliente = APEXLLMClient('chave', cache=CacheRespostas(ativo=False))
+        cliente.base_url = mock.url_base
+
+        cliente.gerar_resposta('pergunta direta')
+        TutorConteudo(cliente).resumir('texto para resumir', 'pequeno')
+        cliente.processar_com_streaming('pergunta em streaming').ler_tudo()
+
+        assincrono = AsyncAPEXLLMClient('chave', cliente=cliente)
+        asyncio.run(TutorConteudo(assincrono).resumir('outro texto', 'pequeno'))
+        assincrono.fechar()
+
+    texto = metricas.exportar_prometheus()
+    assert f'origem="apex_llm_client",modelo="{cliente.model}",status="200"}} 2' in texto
+    assert f'origem="TutorConteudo",modelo="{cliente.model}",status="200"}} 2' in texto
+    assert 'apex_llm_ttft_segundos_count{origem="apex_llm_client"} 1' in texto
+    assert 'apex_llm_tokens_total{origem="TutorConteudo",tipo="resposta"} 8' in texto
+
+
+def test_exportar_soma_os_processos_da_pasta_compartilhada(tmp_path, monkeypatch):
+    monkeypatch.setenv('APEX_METRICAS_DIR', str(tmp_path))
+    # Dois processos que chamam o LLM, cada um com seu registro
+    for _ in range(2):
+        registro = MetricasLLM(compartilhar=True)
+        registro.registrar('apex_llm_client', 'modelo', 200, 0.3, tokens_prompt=10)
+        registro.gravar()
+    metricas.limpar()
+
+    texto = exportar_prometheus()
+    assert 'apex_llm_requisicoes_total{origem="apex_llm_client",modelo="modelo",status="200"} 2' in texto
+    assert 'apex_llm_tokens_total{origem="apex_llm_client",tipo="prompt"} 20' in texto
+    assert 'apex_llm_latencia_segundos_count{origem="apex_llm_client"} 2' in texto
+
+
+def test_registrar_nao_grava_na_thread_do_chamador(tmp_path, monkeypatch):
+    monkeypatch.setenv('APEX_METRICAS_DIR', str(tmp_path))
+    registro = MetricasLLM(compartilhar=True, intervalo_gravacao=0.2)
+    registro.registrar('apex_llm_client', 'modelo', 200, 0.3)
+    assert os.listdir(tmp_path) == []
+
+    limite = time.monotonic() + 5
+    while not os.listdir(tmp_path) and time.monotonic() < limite:
+        time.sleep(0.01)
+    assert os.listdir(tmp_path) == [registro._nome_arquivo]
+    assert registro._gravador.daemon
+
+
+def test_retratos_de_processos_encerrados_viram_agregado(tmp_path, monkeypatch):
+    monkeypatch.setenv('APEX_METRICAS_DIR', str(tmp_path))
+    metricas.limpar()
+    antigo = time.time() - 3600
+    for _ in range(3):
+        registro = MetricasLLM(compartilhar=True)
+        registro.registrar('apex_llm_client', 'modelo', 200, 0.3, tokens_prompt=10)
+        registro.gravar()
+        os.utime(tmp_path / registro._nome_arquivo, (antigo, antigo))
+    vivo = MetricasLLM(compartilhar=True)
+    vivo.registrar('apex_llm_client', 'modelo', 200, 0.3, tokens_prompt=10)
+    vivo.gravar()
+
+    for _ in range(2):
+        texto = exportar_prometheus()
+        assert 'apex_llm_requisicoes_total{origem="apex_llm_client",modelo="modelo",status="200"} 4' in texto
+        assert 'apex_llm_tokens_total{origem="apex_llm_client",tipo="prompt"} 40' in texto
+    assert sorted(os.listdir(tmp_path)) == sorted([ARQUIVO_AGREGADO, vivo._nome_arquivo, metricas._nome_arquivo])
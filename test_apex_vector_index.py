@@ -0,0 +1,50 @@
+import numpy as np
+
+from apex_context_memory import ContextMemory
+from apex_vector_index import IndiceVetorial, vetorizar
+
+
+def test_vetorizar_normaliza_e_tolera_variacoes():
+    a = vetorizar('Qual a capital da França?')
+    assert abs(np.linalg.norm(a) - 1.0) < 1e-5
+    assert float(a @ vetorizar('qual a capital da franca')) > 0.9
+    assert float(a @ vetorizar('receita de bolo de cenoura')) < 0.3
+
+
+def test_indice_anexa_cresce_e_reabre(tmp_path):
+    base = str(tmp_path / 'vetores')
+    indice = IndiceVetorial(base, capacidade_inicial=2)
+    textos = [f'pergunta numero {i} sobre o tema {i * 7}' for i in range(10)]
+    indice.adicionar_lote(list(range(100, 110)), textos)
+    indice.adicionar(200, 'como instalar o python')
+    assert len(indice) == 11 and indice.capacidade >= 11
+    indice.fechar()
+
+    reaberto = IndiceVetorial(base)
+    assert len(reaberto) == 11 and reaberto.ultimo_id == 200
+    assert reaberto.buscar('como instalar python', k=1)[0][0] == 200
+    resultados = reaberto.buscar_lote([textos[3], textos[8]], k=3)
+    assert [r[0][0] for r in resultados] == [103, 108]
+    assert all(len(r) == 3 for r in resultados)
+
+
+def test_context_memory_resposta_memorizada(tmp_path):
+    caminho = str(tmp_path / 'memoria.db')
+    memoria = ContextMemory(caminho)
+    memoria.adicionar_conversa('Qual a capital da França?', 'Paris')
+    memoria.adicionar_conversa('Como instalar o python no windows?', 'Baixe do site oficial')
+    memoria.fechar()
+
+    # Reabre com um índice apagado: as conversas existentes são vetorizadas
+    for arquivo in tmp_path.glob('memoria_vetores*'):
+        arquivo.unlink()
+    memoria = ContextMemory(caminho)
+    assert memoria.resposta_memorizada('qual a capital da franca')['resposta'] == 'Paris'
+    assert memoria.resposta_memorizada('Qual a capital da Alemanha?') is None
+
+    memoria.adicionar_conversa('Qual a capital da Alemanha?', 'Berlim')
+    similares = memoria.buscar_similares('capital da alemanha', k=2)
+    assert similares[0]['resposta'] == 'Berlim'
+    assert similares[0]['similaridade'] >= similares[1]['similaridade']
+    assert len(memoria.vetores) == 3
+    memoria.fechar()
@@ -0,0 +1,45 @@
+from apex_web_cache import CacheWeb, normalizar_query
+
+
+def test_normalizar_query():
+    assert normalizar_query('  Qual a Temperatura   ideal? ') == 'qual a temperatura ideal'
+    assert normalizar_query('Programação Assíncrona') == normalizar_query('programacao assincrona')
+    assert len({normalizar_query('tutorial C++'), normalizar_query('tutorial C#'), normalizar_query('tutorial C')}) == 3
+    assert normalizar_query('C++?') == 'c++'
+
+
+def test_buscas_por_query_normalizada(tmp_path):
+    cache = CacheWeb(str(tmp_path / 'web.db'))
+    resultados = [{'title': 'T', 'url': 'http://x', 'snippet': 's'}]
+    cache.salvar_busca('Python Async?', resultados)
+
+    assert cache.obter_busca('python   async') == resultados
+    assert cache.obter_busca('python sync') is None
+
+
+def test_buscas_separadas_por_provedores(tmp_path):
+    cache = CacheWeb(str(tmp_path / 'web.db'))
+    cache.salvar_busca('python async', [{'title': 'G', 'url': 'http://g', 'snippet': ''}], 'google')
+
+    assert cache.obter_busca('python async', 'google')[0]['title'] == 'G'
+    assert cache.obter_busca('python async', 'fixture:/dados,google') is None
+
+
+def test_paginas_comprimidas_com_remocao_lru(tmp_path):
+    cache = CacheWeb(str(tmp_path / 'web.db'), max_bytes=200)
+    texto = 'conteudo repetido ' * 500
+    for i in range(6):
+        cache.salvar_pagina(f'http://site/{i}', texto + str(i), etag=f'"{i}"')
+        if i >= 1:
+            cache.obter_pagina('http://site/0')
+
+    assert cache.obter_pagina('http://site/0')['texto'] == texto + '0'
+    assert cache.obter_pagina('http://site/1') is None
+    assert cache.obter_pagina('http://site/5')['etag'] == '"5"'
+    assert cache.estatisticas()['bytes'] <= 200 < len(texto)
+
+
+def test_persistencia_entre_instancias(tmp_path):
+    caminho = str(tmp_path / 'web.db')
+    CacheWeb(caminho).salvar_pagina('http://site', 'texto')
+    assert CacheWeb(caminho).obter_pagina('http://site')['texto'] == 'texto'
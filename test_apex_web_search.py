@@ -0,0 +1,66 @@
+import time
+
+from apex_web_cache import CacheWeb
+from apex_web_search import APEXWebSearch
+
+
+def test_paginas_lentas_descartadas_pelo_prazo(site):
+    busca = APEXWebSearch(cache=CacheWeb())
+    resultados = [{'title': p, 'url': f"{site}/{p}", 'snippet': ''} for p in ('lenta', 'a', 'b', 'c')]
+
+    inicio = time.monotonic()
+    paginas = list(busca.iterar_conteudos(resultados, max_paginas=3, prazo=1.0))
+    duracao = time.monotonic() - inicio
+
+    assert sorted(i for i, _, _ in paginas) == [1, 2, 3]
+    assert all('conteúdo' in conteudo and 'x()' not in conteudo for _, _, conteudo in paginas)
+    assert duracao < 1.0
+
+
+def test_prazo_esgotado_devolve_o_que_chegou(site):
+    busca = APEXWebSearch(cache=CacheWeb())
+    busca.conexoes_por_host = 3
+    resultados = [{'title': p, 'url': f"{site}/{p}", 'snippet': ''} for p in ('lenta1', 'lenta2', 'a')]
+
+    inicio = time.monotonic()
+    paginas = list(busca.iterar_conteudos(resultados, max_paginas=3, prazo=0.5))
+
+    assert [i for i, _, _ in paginas] == [2]
+    assert time.monotonic() - inicio < 1.0
+
+
+def test_limite_de_conexoes_por_host(site):
+    busca = APEXWebSearch(cache=CacheWeb())
+    busca.conexoes_por_host = 2
+    resultados = [{'title': p, 'url': f"{site}/{p}", 'snippet': ''} for p in ('lenta1', 'lenta2', 'a')]
+
+    # As duas lentas ocupam as conexões do host; 'a' não consegue vaga no prazo
+    assert list(busca.iterar_conteudos(resultados, prazo=0.5)) == []
+
+
+def test_extracao_ignora_nao_html_e_para_cedo(site):
+    busca = APEXWebSearch(cache=CacheWeb())
+    busca.max_bytes_pagina = 64 * 1024
+
+    assert busca.extrair_conteudo(f"{site}/pdf") == ""
+
+    inicio = time.monotonic()
+    texto = busca.extrair_conteudo(f"{site}/grande")
+    assert len(texto) == busca.max_caracteres
+    assert texto.startswith('palavra palavra')
+    assert time.monotonic() - inicio < 1.0
+
+
+def test_cache_revalida_com_etag(site, tmp_path, requisicoes_etag):
+    cache = CacheWeb(str(tmp_path / 'web.db'), ttl_paginas=60)
+    busca = APEXWebSearch(cache=cache)
+
+    assert busca.extrair_conteudo(f"{site}/etag") == 'texto versionado'
+    assert busca.extrair_conteudo(f"{site}/etag") == 'texto versionado'
+    assert requisicoes_etag == [None]
+
+    cache.ttl_paginas = 0
+    cache.salvar_pagina(f"{site}/etag", 'texto versionado', '"v1"')
+    assert busca.extrair_conteudo(f"{site}/etag") == 'texto versionado'
+    assert requisicoes_etag == [None, '"v1"']
+    assert cache.estatisticas()['revalidadas'] == 1